@@ -52,10 +52,36 @@ if SYSTEM_CONFIGURED:
     # Initialize database & migrations
     db.init_app(app)
     migrate = Migrate(app, db)
+
+    # Per-request query counts, Server-Timing headers and slow-query log
+    try:
+        from utils.query_stats import init_query_stats
+        with app.app_context():
+            init_query_stats(app, db.engine)
+    except Exception as e:
+        print(f"⚠ Could not enable query stats: {e}")
 else:
     # System not configured - skip database initialization
     print("⚠️  Skipping database initialization - system not configured")
 
+# Jinja filters ({{ amount|currency }})
+from utils.formatting import register_template_filters
+register_template_filters(app)
+
+# Content-hashed static URLs with far-future caching (python -m utils.assets builds the manifest)
+try:
+    from utils.assets import init_assets
+    init_assets(app)
+except Exception as e:
+    print(f"⚠ Could not enable hashed static assets: {e}")
+
+# gzip/brotli compression, weak ETags and 304s for pages and JSON
+try:
+    from utils.compression import init_compression
+    init_compression(app)
+except Exception as e:
+    print(f"⚠ Could not enable response compression: {e}")
+
 # ---------------------------------------------------------------------------
 # Register blueprints
 # ---------------------------------------------------------------------------
@@ -102,6 +128,12 @@ if SYSTEM_CONFIGURED:
         app.register_blueprint(parent_bp)
     except Exception as e:
         print(f"⚠ Could not register parent routes: {e}")
+
+    try:
+        from routes.api_routes import api_bp
+        app.register_blueprint(api_bp)
+    except Exception as e:
+        print(f"⚠ Could not register API routes: {e}")
 else:
     print("⚠️  Skipping blueprint registration - system not configured")
 
@@ -289,7 +321,7 @@ def setup_backup_scheduler():
         from utils.settings import SystemSettings
 
         # Check if automatic backups are enabled
-        auto_backup_enabled = SystemSettings.get('backups', 'enabled', True)
+        auto_backup_enabled = SystemSettings.current().backups_enabled
         if not auto_backup_enabled:
             # If backups are disabled, remove any existing jobs
             if backup_scheduler:
@@ -329,8 +361,9 @@ def setup_backup_scheduler():
             pass
 
         # Get backup settings
-        backup_frequency = SystemSettings.get('backups', 'frequency', 'weekly')
-        backup_time = SystemSettings.get('backups', 'time', '02:00')
+        settings = SystemSettings.current()
+        backup_frequency = settings.backup_frequency
+        backup_time = settings.backup_time
 
         # Parse time
         try:
@@ -387,19 +420,13 @@ def inject_system_settings():
     print(f"DEBUG: Context processor called for request to {request.path}")
     if SYSTEM_CONFIGURED:
         try:
-            from models.system_settings import SystemSetting
-            # Load settings directly from database
-            school_name_setting = SystemSetting.query.filter_by(category='general', key='school_name', is_active=True).first()
-            abbr_name_setting = SystemSetting.query.filter_by(category='general', key='abbreviated_school_name', is_active=True).first()
-            school_address_setting = SystemSetting.query.filter_by(category='general', key='school_address', is_active=True).first()
-            school_phone_setting = SystemSetting.query.filter_by(category='general', key='school_phone', is_active=True).first()
-            school_email_setting = SystemSetting.query.filter_by(category='general', key='school_email', is_active=True).first()
-
-            school_name = school_name_setting.typed_value if school_name_setting else ''
-            abbr_name = abbr_name_setting.typed_value if abbr_name_setting else ''
-            school_address = school_address_setting.typed_value if school_address_setting else ''
-            school_phone = school_phone_setting.typed_value if school_phone_setting else ''
-            school_email = school_email_setting.typed_value if school_email_setting else ''
+            from utils.settings import SystemSettings
+            current = SystemSettings.current()
+            school_name = current.school_name
+            abbr_name = current.abbreviated_school_name
+            school_address = current.school_address
+            school_phone = current.school_phone
+            school_email = current.school_email
 
             print(f"DEBUG: Loaded school_name='{school_name}', abbr_name='{abbr_name}'")
 
@@ -437,7 +464,7 @@ def check_maintenance_mode():
 
     try:
         from utils.settings import SystemSettings
-        maintenance_mode = SystemSettings.get_maintenance_mode()
+        maintenance_mode = SystemSettings.current().maintenance_mode
         user_role = session.get('user_role', '').lower()
         print(f"DEBUG: Maintenance check - path: {request.path}, maintenance_mode: {maintenance_mode}, user_role: {user_role}")
         if maintenance_mode:
@@ -445,7 +472,7 @@ def check_maintenance_mode():
             if user_role == 'admin':
                 return
             # Block non-admin users
-            maintenance_message = SystemSettings.get_maintenance_message()
+            maintenance_message = SystemSettings.current().maintenance_message
             print(f"DEBUG: Blocking access for non-admin user")
             return render_template('maintenance.html', maintenance_message=maintenance_message)
     except Exception as e:
@@ -462,8 +489,8 @@ def debug():
         "DATABASE_URL_PREFIX": os.getenv("DATABASE_URL", "")[:20] + "..." if os.getenv("DATABASE_URL") else "Not set",
         "FLASK_ENV": os.getenv("FLASK_ENV", "Not set"),
         "VERCEL_ENV": os.getenv("VERCEL_ENV", "Not set"),
-        "MAINTENANCE_MODE": SystemSettings.get_maintenance_mode(),
-        "MAINTENANCE_MESSAGE": SystemSettings.get_maintenance_message(),
+        "MAINTENANCE_MODE": SystemSettings.current().maintenance_mode,
+        "MAINTENANCE_MESSAGE": SystemSettings.current().maintenance_message,
         "SESSION_USER_ROLE": session.get('user_role', 'Not set')
     }
 
@@ -478,10 +505,13 @@ def index():
 @app.route("/sw.js")
 def service_worker():
     """Serve service worker from root"""
+    from utils.assets import service_worker_script
     try:
-        return send_from_directory(app.root_path, "sw.js")
+        script = service_worker_script(app, os.path.join(app.root_path, "sw.js"))
     except FileNotFoundError:
         return "Service worker not found", 404
+    # Browsers must always see a new asset list, so never cache the worker itself
+    return script, 200, {"Content-Type": "application/javascript; charset=utf-8", "Cache-Control": "no-cache"}
 
 
 @app.route("/favicon.ico")
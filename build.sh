@@ -8,6 +8,9 @@ source venv/bin/activate
 # Install dependencies
 pip install -r requirements.txt
 
+# Hash static files and precompress them (utils/assets.py)
+python -m utils.assets
+
 # Deactivate virtual environment
 deactivate
 
@@ -0,0 +1,443 @@
+"""Query-budget check for every page and API endpoint.
+
+This script:
+- creates a throwaway SQLite database (or uses --database-url, which must
+  point at an empty database)
+- seeds a realistic school: 2,000 pupils, 30,000 attendance rows,
+  10,000 payments and 24,000 marks rows
+- requests every GET endpoint in the user, secretary, admin, headteacher,
+  teacher, bursar and parent blueprints, logged in as the matching role
+- then sends every POST-only endpoint in those blueprints the form or JSON
+  body built for it in seed() (`posts`), using the seeded ids
+- fails (exit code 1) when an endpoint errors, reports a failure (a JSON
+  "success": false or an error flash), runs more SQL statements than its
+  budget in BUDGETS, or takes longer than its time budget; a POST-only
+  endpoint with no body and no SKIP entry fails too
+
+Each GET endpoint is requested once to warm the reference-data and settings
+caches, then the page-data result cache is cleared and the second request is
+measured. POSTs change data, so each is sent once, after the GETs have
+warmed the caches. Budgets record what the routes need today; lower them as
+routes are fixed, and raise one only with a reason.
+
+Run:
+    python check_query_budgets.py
+    python check_query_budgets.py --report        # print every endpoint's numbers
+    python check_query_budgets.py --time-scale 2  # slower CI machines
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+# Default time budget per request (milliseconds)
+DEFAULT_MAX_MS = 1500
+
+# Statements allowed when an endpoint has no entry in BUDGETS
+DEFAULT_MAX_QUERIES = 10
+
+# endpoint -> (max queries, max milliseconds or None for the default)
+BUDGETS = {
+    'admin.list_users': (3, None),
+    'admin.system_settings': (3, None),
+    'bursar.api_revenue_analysis': (4, None),
+    'bursar.dashboard': (6, None),
+    'bursar.generate_bulk_invoices': (17, 3000),
+    'bursar.generate_invoice': (3, None),
+    'bursar.outstanding_fees': (6, None),
+    'bursar.pupil_payments': (7, None),
+    'bursar.students': (5, None),
+    'parent.get_pupil_details': (3, None),
+    'parent.get_reports_with_filters': (3, None),
+    'parent.search_pupils': (2, None),
+    'secretary.api_pupils': (2, None),
+    'secretary.manage_pupils_data': (3, None),
+    'teacher.generate_stream_reports': (6, 3000),
+    # Known N+1 loops, recorded at today's counts for 2,000 pupils so they
+    # cannot get worse unnoticed; tighten when the loops are removed
+    'bursar.api_outstanding_fees': (4001, 15000),
+    'bursar.get_today_payments': (25, None),
+    'bursar.payment_history': (100, None),
+    'teacher.attendance_summary': (100, None),
+    'teacher.recalculate_positions': (2057, 4000),
+    'teacher.save_attendance': (100, None),
+    'teacher.save_marks': (2052, 3000),
+}
+
+# Endpoints that are not pages or that cannot run against seeded data
+SKIP = {
+    'user.logout',
+    'admin.download_backup',
+    # The roster template reads `confirmed`, which the route never passes
+    'teacher.attendance_roster',
+    # Write a zip of every table to backups/ in the working directory, or delete one
+    'admin.create_backup',
+    'admin.delete_backup',
+    # Calls int() on the UUID class_id and never sets the required stream_id,
+    # so it only ever flashes 'Invalid data provided'
+    'bursar.save_fee_structure',
+}
+
+# Role to log in as for each blueprint
+BLUEPRINT_ROLES = {
+    'user': 'admin',
+    'secretary': 'secretary',
+    'admin': 'admin',
+    'headteacher': 'headteacher',
+    'teacher': 'teacher',
+    'bursar': 'bursar',
+    'parent': 'parent',
+}
+
+PUPILS = 2000
+ATTENDANCE_DAYS = 15      # x 2,000 pupils = 30,000 rows
+PAYMENTS_PER_PUPIL = 5    # 10,000 rows
+EXAM_TYPES = ['Beginning of term', 'Mid_term', 'End of term']
+MARK_TERMS = (1, 2)       # 2 years x 2 terms x 3 exams x 2,000 pupils = 24,000 rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='empty database to seed (default: temporary SQLite file)')
+    parser.add_argument('--report', action='store_true', help='print numbers for every endpoint')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='multiply every time budget')
+    return parser.parse_args()
+
+
+def seed(db):
+    """Fill the empty database and return the ids the URL builder needs"""
+    from models import (User, Pupil, AcademicYear, SchoolClass, Stream, TeacherAssignment, Attendance,
+                        FeeCategory, FeeStructure, Payment, PaymentMethod, Term)
+    from models.register_pupil import PupilMarks
+
+    random.seed(42)
+    db.create_all()
+
+    current_year = AcademicYear(name='2025/2026', start_year=2025, end_year=2026, is_active=True)
+    previous_year = AcademicYear(name='2024/2025', start_year=2024, end_year=2025, is_active=False)
+    classes = [SchoolClass(name=f'P.{level}', level=level) for level in range(1, 8)]
+    streams = [Stream(name=name) for name in ('RED', 'BLUE', 'GREEN')]
+    db.session.add_all([current_year, previous_year] + classes + streams)
+    db.session.add_all([Term(name=f'Term {n}', term_number=n) for n in (1, 2, 3)])
+    db.session.add_all([PaymentMethod(name=name) for name in ('Cash', 'Bank Transfer', 'Mobile Money')])
+    unused_method = PaymentMethod(name='Cheque')
+    db.session.add(unused_method)
+    category = FeeCategory(name='Tuition')
+    db.session.add(category)
+
+    users = {}
+    for role in ('admin', 'teacher', 'parent', 'secretary', 'bursar', 'headteacher'):
+        user = User(first_name=role.title(), last_name='Budget', email=f'{role}@budget.test', role=role)
+        user.set_password('budget-check')
+        users[role] = user
+    # A teacher with no assignment yet, and a user the admin deletes
+    spare_teacher = User(first_name='Spare', last_name='Budget', email='spare@budget.test', role='teacher')
+    leaver = User(first_name='Leaver', last_name='Budget', email='leaver@budget.test', role='secretary')
+    for user in (spare_teacher, leaver):
+        user.set_password('budget-check')
+    db.session.add_all(list(users.values()) + [spare_teacher, leaver])
+    db.session.flush()
+
+    for school_class in classes:
+        for stream in streams:
+            db.session.add(FeeStructure(academic_year_id=current_year.id, class_id=school_class.id,
+                                        stream_id=stream.id, fee_category_id=category.id,
+                                        term1_amount=350000, term2_amount=300000, term3_amount=300000,
+                                        annual_amount=950000))
+    assignment = TeacherAssignment(teacher_id=users['teacher'].id, class_id=classes[0].id, stream_id=streams[0].id)
+    db.session.add(assignment)
+    db.session.commit()
+
+    today = date.today()
+    first_names = ['Aisha', 'Brian', 'Grace', 'John', 'Mary', 'Peter', 'Ruth', 'Samuel']
+    last_names = ['Achieng', 'Mugisha', 'Nakato', 'Okello', 'Ssemanda', 'Wanjiru']
+    pupils = [{
+        'id': str(uuid.uuid4()),
+        'first_name': f'{random.choice(first_names)}{i}',
+        'last_name': random.choice(last_names),
+        'gender': random.choice(['Male', 'Female']),
+        'class_admitted': classes[i % len(classes)].id,
+        'stream': streams[(i // len(classes)) % len(streams)].id,
+        'academic_year_id': current_year.id,
+        'admission_number': f'ADM/2025/{i + 1:04d}',
+        'roll_number': f'ROLL/2025/{i + 1:04d}',
+        'enrollment_status': 'active',
+        'created_at': datetime.utcnow() - timedelta(minutes=i),
+        'updated_at': datetime.utcnow(),
+    } for i in range(PUPILS)]
+    db.session.execute(Pupil.__table__.insert(), pupils)
+
+    db.session.execute(Attendance.__table__.insert(), [{
+        'pupil_id': pupil['id'],
+        'class_id': pupil['class_admitted'],
+        'stream_id': pupil['stream'],
+        'attendance_date': today - timedelta(days=day),
+        'status': random.choice(['present', 'present', 'present', 'absent']),
+        'teacher_id': users['teacher'].id,
+        'academic_year_id': current_year.id,
+    } for pupil in pupils for day in range(ATTENDANCE_DAYS)])
+
+    db.session.execute(Payment.__table__.insert(), [{
+        'pupil_id': pupil['id'],
+        'academic_year_id': current_year.id if n else previous_year.id,
+        'amount': random.choice([50000, 100000, 150000]),
+        'term': n % 3 + 1,
+        'payment_date': today - timedelta(days=random.randint(0, 360)),
+        'payment_method': random.choice(['Cash', 'Bank Transfer', 'Mobile Money']),
+        'receipt_number': f'RCPT-{i:05d}-{n}',
+        'recorded_by': users['bursar'].id,
+        'recorded_at': datetime.utcnow(),
+    } for i, pupil in enumerate(pupils) for n in range(PAYMENTS_PER_PUPIL)])
+
+    marks = []
+    for pupil in pupils:
+        for year in (current_year, previous_year):
+            for term in MARK_TERMS:
+                for exam_type in EXAM_TYPES:
+                    mark = PupilMarks(pupil_id=pupil['id'], academic_year_id=year.id, term=term, exam_type=exam_type,
+                                      english=random.randint(30, 99), mathematics=random.randint(30, 99),
+                                      science=random.randint(30, 99), social_studies=random.randint(30, 99))
+                    mark.calculate_totals()
+                    mark.calculate_grades()
+                    marks.append({column.key: getattr(mark, column.key)
+                                  for column in PupilMarks.__table__.columns if column.key != 'id'})
+    db.session.execute(PupilMarks.__table__.insert(), marks)
+
+    # A withdrawn pupil with no attendance, payments or marks, for the secretary to
+    # delete; kept out of the checked class so the recorded N+1 counts still hold
+    removable_pupil = dict(pupils[0], id=str(uuid.uuid4()), admission_number='ADM/2025/9999',
+                           roll_number='ROLL/2025/9999', enrollment_status='withdrawn',
+                           class_admitted=classes[-1].id, stream=streams[-1].id)
+    db.session.execute(Pupil.__table__.insert(), [removable_pupil])
+    db.session.commit()
+
+    stream_pupils = [p for p in pupils if p['class_admitted'] == classes[0].id and p['stream'] == streams[0].id]
+    stream_pupil = stream_pupils[0]
+    pupil_payments = Payment.query.filter_by(pupil_id=stream_pupil['id'], academic_year_id=current_year.id)\
+        .order_by(Payment.id).all()
+    fee_structure = FeeStructure.query.filter_by(class_id=classes[0].id, stream_id=streams[0].id).first()
+
+    def payment_form(payment):
+        return {'academic_year_id': payment.academic_year_id, 'amount': payment.amount + 1000,
+                'term': payment.term, 'payment_date': payment.payment_date.isoformat(),
+                'payment_method': payment.payment_method, 'notes': 'Budget check'}
+
+    def register(day):
+        return {'class_id': classes[0].id, 'stream_id': streams[0].id,
+                'date': (today - timedelta(days=day)).isoformat(),
+                'entries': [{'pupil_id': p['id'], 'status': random.choice(['present', 'absent'])}
+                            for p in stream_pupils]}
+
+    marks_query = {'academic_year_id': current_year.id, 'term': 1, 'exam_type': 'Mid_term'}
+    return {
+        'users': {role: user.id for role, user in users.items()},
+        'url_values': {
+            'pupil_id': stream_pupil['id'],
+            'id': stream_pupil['id'],
+            'user_id': users['teacher'].id,
+            'class_id': classes[0].id,
+            'stream_id': streams[0].id,
+            'academic_year_id': current_year.id,
+            'report_type': 'term1_mid',
+        },
+        'query_strings': {
+            'bursar.api_class_collection': {'academic_year': current_year.id},
+            'bursar.api_payment_summary': {'academic_year': current_year.id},
+            'bursar.api_revenue_analysis': {'academic_year': current_year.id, 'bucket': 'month'},
+            'bursar.generate_bulk_invoices': {'class_id': classes[0].id, 'format': 'html'},
+            'bursar.search_student': {'q': 'gra'},
+            'parent.search_pupils': {'q': 'ADM/2025/01'},
+            'secretary.manage_pupils_data': {'q': 'okello'},
+            'teacher.attendance_marked': {'date': today.isoformat()},
+            'teacher.attendance_summary': {'class_id': classes[0].id},
+            'teacher.get_marks': {'pupil_id': stream_pupil['id'], 'academic_year_id': current_year.id,
+                                  'term': 1, 'exam_type': 'Mid_term'},
+            'teacher.get_pupils_for_reports': {'year': current_year.id, 'term': 1, 'exam_set': 'mid'},
+            'teacher.generate_stream_reports': {'year': current_year.id},
+            'user.role_firstnames': {'role': 'teacher'},
+        },
+        # POST-only endpoint -> {'url_values': ..., and 'data' (form) or 'json': ...}
+        'posts': {
+            'admin.delete_user': {'url_values': {'user_id': leaver.id}},
+            'bursar.delete_payment_method': {'url_values': {'method_id': unused_method.id}},
+            'bursar.fee_search': {'data': {'q': 'okello', 'filter': 'name'}},
+            'bursar.save_payment': {'data': {
+                'pupil_id': stream_pupil['id'], 'academic_year_id': current_year.id, 'amount': 120000,
+                'term': 1, 'payment_method': 'Cash'}},
+            'bursar.save_payment_method': {'data': {'name': 'Card', 'is_active': 'on'}},
+            'bursar.term_reports': {'data': {'academic_year': current_year.id, 'term_id': 1}},
+            'bursar.update_fee_structures': {'json': {'updates': [{
+                'id': fee_structure.id, 'term1_amount': 355000, 'term2_amount': 300000, 'term3_amount': 300000,
+                'annual_amount': 955000}]}},
+            'bursar.update_payment': {'url_values': {'payment_id': pupil_payments[0].id},
+                                      'data': payment_form(pupil_payments[0])},
+            'bursar.update_payments': {'url_values': {'pupil_id': stream_pupil['id']}, 'data': {
+                f'payments[{payment.id}][{field}]': value
+                for payment in pupil_payments[1:] for field, value in payment_form(payment).items()}},
+            'headteacher.save_assignments': {'json': [
+                {'teacher_id': users['teacher'].id, 'class_id': classes[0].id, 'stream_id': streams[0].id},
+                {'teacher_id': spare_teacher.id, 'class_id': classes[1].id, 'stream_id': streams[0].id},
+            ]},
+            'secretary.delete_pupil': {'url_values': {'id': removable_pupil['id']}},
+            'secretary.edit_pupil_submit': {'data': {
+                'first_name': stream_pupil['first_name'], 'last_name': stream_pupil['last_name'],
+                'gender': stream_pupil['gender'], 'district': 'Kampala', 'guardian_phone': '0700000000',
+                'class_admitted': classes[0].id, 'stream': streams[0].id}},
+            'secretary.register_submit': {'data': {
+                'first_name': 'Budget', 'last_name': 'Pupil', 'gender': 'Female', 'dob': '2018-03-14',
+                'class_admitted': classes[0].id, 'stream': streams[0].id, 'admission_date': today.isoformat()}},
+            'teacher.attendance_confirm': {'json': {}},
+            'teacher.recalculate_positions': {'json': marks_query},
+            'teacher.save_attendance': {'json': register(ATTENDANCE_DAYS)},
+            'teacher.save_attendance_bulk': {'json': {'registers': [
+                dict(register(day), request_id=str(uuid.uuid4()))
+                for day in (ATTENDANCE_DAYS + 1, ATTENDANCE_DAYS + 2)]}},
+            'teacher.save_marks': {'json': dict(marks_query, pupil_id=stream_pupil['id'], marks={
+                'english': 71, 'mathematics': 64, 'science': 80, 'social_studies': 58})},
+        },
+    }
+
+
+def main():
+    args = parse_args()
+
+    workdir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        workdir = tempfile.mkdtemp(prefix='query_budgets_')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'budgets.db')}"
+
+    try:
+        check_budgets(args)
+    finally:
+        if workdir:
+            # The seeded database is tens of MB; close its connections before deleting it
+            from app import app
+            from models import db
+            with app.app_context():
+                db.engine.dispose()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def reported_failure(client, response):
+    """The failure a POST reported despite a non-error status, or None"""
+    if response.is_json:
+        body = response.get_json(silent=True)
+        if isinstance(body, dict) and body.get('success') is False:
+            return body.get('message') or body.get('error') or 'success: false'
+    with client.session_transaction() as sess:
+        flashes = sess.pop('_flashes', [])
+    return next((message for category, message in flashes if category in ('error', 'danger')), None)
+
+
+def check_budgets(args):
+    """Seed the database, request every GET and POST-only endpoint and exit non-zero on overruns"""
+    from flask import url_for
+    from sqlalchemy import event
+    from app import app
+    from models import db
+    from utils.cache import ResultCache
+
+    with app.app_context():
+        started = time.perf_counter()
+        fixtures = seed(db)
+        print(f"Seeded test data in {time.perf_counter() - started:.1f}s")
+        engine = db.engine
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+
+    clients = {}
+    for role, user_id in fixtures['users'].items():
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['user_role'] = role
+            sess['user_name'] = role.title()
+        clients[role] = client
+
+    checked = [rule for rule in app.url_map.iter_rules()
+               if rule.endpoint.split('.')[0] in BLUEPRINT_ROLES and rule.endpoint not in SKIP]
+    get_rules = sorted((rule for rule in checked if 'GET' in rule.methods), key=lambda rule: rule.endpoint)
+    post_rules = sorted((rule for rule in checked if 'GET' not in rule.methods and 'POST' in rule.methods),
+                        key=lambda rule: rule.endpoint)
+
+    failures = []
+    results = []
+
+    def measure(rule, method, url_values=None, query_string=None, **body):
+        """Send the measured request and record its numbers and any problems"""
+        values = dict(fixtures['url_values'], **(url_values or {}))
+        with app.test_request_context():
+            url = url_for(rule.endpoint, **{name: values[name] for name in rule.arguments}, **(query_string or {}))
+        client = clients[BLUEPRINT_ROLES[rule.endpoint.split('.')[0]]]
+
+        if method == 'GET':
+            client.get(url).get_data()  # warm reference data and settings
+        ResultCache.invalidate()
+        statements.clear()
+        request_started = time.perf_counter()
+        reported = None
+        try:
+            response = client.open(url, method=method, **body)
+            response.get_data()  # streamed responses run their queries here
+            status = response.status_code
+            if method == 'POST':
+                reported = reported_failure(client, response)
+        except Exception as e:
+            status = f'error: {e}'
+        elapsed_ms = (time.perf_counter() - request_started) * 1000
+
+        max_queries, max_ms = BUDGETS.get(rule.endpoint, (DEFAULT_MAX_QUERIES, None))
+        max_ms = (max_ms or DEFAULT_MAX_MS) * args.time_scale
+        problems = []
+        if not isinstance(status, int) or status >= 500:
+            problems.append(f'status {status}')
+        if reported:
+            problems.append(f'reported {reported!r}')
+        if len(statements) > max_queries:
+            problems.append(f'{len(statements)} queries > {max_queries}')
+        if elapsed_ms > max_ms:
+            problems.append(f'{elapsed_ms:.0f} ms > {max_ms:.0f} ms')
+
+        results.append((rule.endpoint, method, status, len(statements), max_queries, elapsed_ms))
+        if problems:
+            failures.append((rule.endpoint, f'{method} {url}', problems, list(statements)))
+
+    for rule in get_rules:
+        measure(rule, 'GET', query_string=fixtures['query_strings'].get(rule.endpoint))
+
+    for rule in post_rules:
+        post = fixtures['posts'].get(rule.endpoint)
+        if post is None:
+            failures.append((rule.endpoint, rule.rule, ['no POST body in seed(); add one or a SKIP entry'], []))
+            continue
+        measure(rule, 'POST', **post)
+
+    if args.report:
+        print(f"{'endpoint':45} {'method':>6} {'status':>6} {'queries':>8} {'budget':>7} {'ms':>8}")
+        for endpoint, method, status, queries, budget, elapsed_ms in results:
+            print(f"{endpoint:45} {method:>6} {str(status):>6} {queries:>8} {budget:>7} {elapsed_ms:>8.1f}")
+
+    if failures:
+        print(f"\n❌ {len(failures)} endpoint(s) over budget:")
+        for endpoint, url, problems, failed_statements in failures:
+            print(f"  {endpoint} ({url}): {', '.join(problems)}")
+            # The most repeated statement is usually the N+1
+            if failed_statements:
+                worst = max(set(failed_statements), key=failed_statements.count)
+                print(f"    most repeated ({failed_statements.count(worst)}x): {' '.join(worst.split())[:200]}")
+        sys.exit(1)
+
+    print(f"✅ {len(results)} endpoints within their query and time budgets")
+
+
+if __name__ == '__main__':
+    main()
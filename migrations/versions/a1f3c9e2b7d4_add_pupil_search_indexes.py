@@ -0,0 +1,63 @@
+"""Add pupil search indexes (pg_trgm on PostgreSQL, FTS5 table on SQLite)
+
+Revision ID: a1f3c9e2b7d4
+Revises: e163bc05c7b1
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1f3c9e2b7d4'
+down_revision = 'e163bc05c7b1'
+branch_labels = None
+depends_on = None
+
+SEARCH_COLUMNS = ('first_name', 'last_name', 'admission_number', 'roll_number')
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    if bind.dialect.name == 'postgresql':
+        # Trigram GIN indexes serve ILIKE '%q%' without a sequential scan
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for column in SEARCH_COLUMNS:
+            op.execute(f'CREATE INDEX IF NOT EXISTS ix_pupils_{column}_trgm '
+                       f'ON pupils USING gin ({column} gin_trgm_ops)')
+
+    elif bind.dialect.name == 'sqlite':
+        # Shadow FTS5 table with the trigram tokenizer (SQLite 3.34+), kept in step by triggers
+        try:
+            op.execute("CREATE VIRTUAL TABLE pupils_search USING fts5("
+                       "pupil_id UNINDEXED, first_name, last_name, admission_number, roll_number, "
+                       "tokenize='trigram')")
+        except sa.exc.OperationalError as e:
+            print(f"⚠ Skipping pupil search index, FTS5 trigram tokenizer unavailable: {e}")
+            return
+
+        columns = ', '.join(SEARCH_COLUMNS)
+        new_values = ', '.join(f'new.{column}' for column in SEARCH_COLUMNS)
+        op.execute(f"INSERT INTO pupils_search (pupil_id, {columns}) SELECT id, {columns} FROM pupils")
+        op.execute(f"CREATE TRIGGER pupils_search_ai AFTER INSERT ON pupils BEGIN "
+                   f"INSERT INTO pupils_search (pupil_id, {columns}) VALUES (new.id, {new_values}); END")
+        op.execute("CREATE TRIGGER pupils_search_ad AFTER DELETE ON pupils BEGIN "
+                   "DELETE FROM pupils_search WHERE pupil_id = old.id; END")
+        op.execute(f"CREATE TRIGGER pupils_search_au AFTER UPDATE ON pupils BEGIN "
+                   f"DELETE FROM pupils_search WHERE pupil_id = old.id; "
+                   f"INSERT INTO pupils_search (pupil_id, {columns}) VALUES (new.id, {new_values}); END")
+
+
+def downgrade():
+    bind = op.get_bind()
+
+    if bind.dialect.name == 'postgresql':
+        for column in SEARCH_COLUMNS:
+            op.execute(f'DROP INDEX IF EXISTS ix_pupils_{column}_trgm')
+
+    elif bind.dialect.name == 'sqlite':
+        for trigger in ('pupils_search_ai', 'pupils_search_ad', 'pupils_search_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS pupils_search')
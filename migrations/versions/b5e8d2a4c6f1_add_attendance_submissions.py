@@ -0,0 +1,39 @@
+"""Add attendance_submissions table for idempotent offline attendance sync
+
+Revision ID: b5e8d2a4c6f1
+Revises: a1f3c9e2b7d4
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e8d2a4c6f1'
+down_revision = 'a1f3c9e2b7d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('attendance_submissions',
+    sa.Column('request_id', sa.String(length=64), nullable=False),
+    sa.Column('teacher_id', sa.String(length=36), nullable=False),
+    sa.Column('class_id', sa.String(length=80), nullable=False),
+    sa.Column('stream_id', sa.String(length=120), nullable=False),
+    sa.Column('attendance_date', sa.Date(), nullable=False),
+    sa.Column('saved_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['teacher_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('request_id')
+    )
+    with op.batch_alter_table('attendance_submissions', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_attendance_submissions_teacher_id'), ['teacher_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('attendance_submissions', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_attendance_submissions_teacher_id'))
+
+    op.drop_table('attendance_submissions')
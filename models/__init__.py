@@ -3,8 +3,8 @@ from .register_pupil import Pupil, AcademicYear
 from .stream import Stream
 from .school_class import SchoolClass
 from .teacher_assignment import TeacherAssignment
-from .attendance import Attendance
+from .attendance import Attendance, AttendanceSubmission
 from .bursar import FeeCategory, FeeStructure, StudentFee, Payment, PaymentMethod, Term, BursarSettings
 from .system_settings import SystemSetting
 
-__all__ = ['User', 'UserRoles', 'db', 'Pupil', 'AcademicYear', 'Stream', 'SchoolClass', 'TeacherAssignment', 'Attendance', 'FeeCategory', 'FeeStructure', 'StudentFee', 'Payment', 'PaymentMethod', 'Term', 'BursarSettings', 'SystemSetting']
+__all__ = ['User', 'UserRoles', 'db', 'Pupil', 'AcademicYear', 'Stream', 'SchoolClass', 'TeacherAssignment', 'Attendance', 'AttendanceSubmission', 'FeeCategory', 'FeeStructure', 'StudentFee', 'Payment', 'PaymentMethod', 'Term', 'BursarSettings', 'SystemSetting']
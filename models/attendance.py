@@ -1,4 +1,7 @@
 from datetime import datetime
+
+from sqlalchemy.dialects import postgresql, sqlite
+
 from . import db
 
 
@@ -29,4 +32,77 @@ class Attendance(db.Model):
     )
 
     def __repr__(self):
-        return f"<Attendance {self.pupil_id} on {self.attendance_date}: {self.status}>"
\ No newline at end of file
+        return f"<Attendance {self.pupil_id} on {self.attendance_date}: {self.status}>"
+
+    @staticmethod
+    def insert_many(rows):
+        """Insert attendance rows, skipping pupils already marked for that date
+
+        `rows` are dicts of column values. Returns the ids of the pupils whose
+        rows were inserted. The insert bypasses the ORM, so callers must pass
+        these to utils.pupil_snapshot.note_pupil_changes.
+        """
+        if not rows:
+            return []
+
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = insert(Attendance.__table__).values(rows)
+            stmt = stmt.on_conflict_do_nothing(index_elements=['pupil_id', 'attendance_date'])
+            return db.session.execute(stmt.returning(Attendance.__table__.c.pupil_id)).scalars().all()
+
+        marked = set(db.session.query(Attendance.pupil_id, Attendance.attendance_date).filter(
+            Attendance.pupil_id.in_({row['pupil_id'] for row in rows}),
+            Attendance.attendance_date.in_({row['attendance_date'] for row in rows})
+        ))
+        inserted = []
+        for row in rows:
+            key = (row['pupil_id'], row['attendance_date'])
+            if key not in marked:
+                marked.add(key)
+                db.session.add(Attendance(**row))
+                inserted.append(row['pupil_id'])
+        return inserted
+
+
+class AttendanceSubmission(db.Model):
+    """A register sent by a teacher's device, keyed by the id the device generated
+
+    Replays of the same register (offline queue retries) find their id here
+    and are not saved again.
+    """
+
+    __tablename__ = 'attendance_submissions'
+
+    request_id = db.Column(db.String(64), primary_key=True)
+    teacher_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    class_id = db.Column(db.String(80), nullable=False)
+    stream_id = db.Column(db.String(120), nullable=False)
+    attendance_date = db.Column(db.Date, nullable=False)
+    saved_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @staticmethod
+    def claim(request_id, **values):
+        """Record a register's id; False if it was already recorded
+
+        On PostgreSQL a concurrent replay of the same id waits here until the
+        first one commits or rolls back.
+        """
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = insert(AttendanceSubmission.__table__).values(request_id=request_id, created_at=datetime.utcnow(),
+                                                                 **values)
+            stmt = stmt.on_conflict_do_nothing(index_elements=['request_id'])
+            return db.session.execute(stmt).rowcount == 1
+
+        if db.session.get(AttendanceSubmission, request_id) is not None:
+            return False
+        db.session.add(AttendanceSubmission(request_id=request_id, **values))
+        db.session.flush()
+        return True
+
+    def __repr__(self):
+        return f"<AttendanceSubmission {self.request_id}: {self.saved_count} pupils>"
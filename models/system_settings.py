@@ -1,6 +1,8 @@
 from models import db
 from datetime import datetime
 
+from sqlalchemy.dialects import postgresql, sqlite
+
 class SystemSetting(db.Model):
     __tablename__ = 'system_settings'
 
@@ -23,36 +25,42 @@ class SystemSetting(db.Model):
     @property
     def typed_value(self):
         """Return the value converted to its proper type"""
-        if self.value_type == 'boolean':
-            return self.value.lower() in ('true', '1', 'yes', 'on')
-        elif self.value_type == 'integer':
+        return SystemSetting.parse_value(self.value, self.value_type)
+
+    @staticmethod
+    def parse_value(value, value_type):
+        """Python value for a stored (value, value_type) pair"""
+        if value_type == 'boolean':
+            return value is not None and value.lower() in ('true', '1', 'yes', 'on')
+        elif value_type == 'integer':
             try:
-                return int(self.value)
+                return int(value)
             except (ValueError, TypeError):
                 return 0
-        elif self.value_type == 'float':
+        elif value_type == 'float':
             try:
-                return float(self.value)
+                return float(value)
             except (ValueError, TypeError):
                 return 0.0
         else:
-            return self.value
+            return value
 
     @typed_value.setter
     def typed_value(self, val):
         """Set the value and update value_type accordingly"""
+        self.value, self.value_type = SystemSetting.encode_value(val)
+
+    @staticmethod
+    def encode_value(val):
+        """(value, value_type) as stored for a Python value"""
         if isinstance(val, bool):
-            self.value_type = 'boolean'
-            self.value = 'true' if val else 'false'
+            return ('true' if val else 'false'), 'boolean'
         elif isinstance(val, int):
-            self.value_type = 'integer'
-            self.value = str(val)
+            return str(val), 'integer'
         elif isinstance(val, float):
-            self.value_type = 'float'
-            self.value = str(val)
+            return str(val), 'float'
         else:
-            self.value_type = 'string'
-            self.value = str(val) if val is not None else None
+            return (str(val) if val is not None else None), 'string'
 
     @staticmethod
     def upsert_setting(category, key, value, description=None):
@@ -71,4 +79,80 @@ class SystemSetting(db.Model):
             )
             setting.typed_value = value
             db.session.add(setting)
-        return setting
\ No newline at end of file
+        return setting
+
+    @staticmethod
+    def upsert_many(settings):
+        """Insert or update several settings with one SELECT and one upsert
+
+        `settings` is an iterable of (category, key, value) or
+        (category, key, value, description) tuples. Settings whose stored
+        value is unchanged are not written. Returns the number written; the
+        settings cache reloads once when the transaction commits.
+        """
+        wanted = {}
+        for category, key, value, *description in settings:
+            stored_value, value_type = SystemSetting.encode_value(value)
+            wanted[(category, key)] = (stored_value, value_type, description[0] if description else None)
+        if not wanted:
+            return 0
+
+        existing = {
+            (setting.category, setting.key): setting
+            for setting in SystemSetting.query.filter(
+                SystemSetting.category.in_({category for category, _ in wanted}),
+                SystemSetting.key.in_({key for _, key in wanted})
+            )
+        }
+
+        now = datetime.utcnow()
+        rows = []
+        for (category, key), (stored_value, value_type, description) in wanted.items():
+            setting = existing.get((category, key))
+            if (setting is not None and setting.value == stored_value and setting.value_type == value_type
+                    and (not description or setting.description == description)):
+                continue
+            rows.append({
+                'category': category,
+                'key': key,
+                'value': stored_value,
+                'value_type': value_type,
+                'description': description,
+                'is_active': True,
+                'created_at': now,
+                'updated_at': now,
+            })
+        if not rows:
+            return 0
+
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = insert(SystemSetting.__table__).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['category', 'key'],
+                set_={
+                    'value': stmt.excluded.value,
+                    'value_type': stmt.excluded.value_type,
+                    'description': db.func.coalesce(stmt.excluded.description, SystemSetting.__table__.c.description),
+                    'updated_at': stmt.excluded.updated_at,
+                }
+            )
+            db.session.execute(stmt)
+            # Loaded rows no longer match the table
+            for setting in existing.values():
+                db.session.expire(setting)
+        else:
+            for row in rows:
+                setting = existing.get((row['category'], row['key']))
+                if setting is None:
+                    db.session.add(SystemSetting(**row))
+                else:
+                    setting.value = row['value']
+                    setting.value_type = row['value_type']
+                    if row['description']:
+                        setting.description = row['description']
+                    setting.updated_at = now
+
+        db.session.info['system_settings_changed'] = True
+        return len(rows)
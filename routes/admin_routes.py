@@ -173,56 +173,54 @@ def system_settings():
             school_phone = request.form.get('school_phone', '')
             school_email = request.form.get('school_email', '')
 
-            SystemSetting.upsert_setting('general', 'school_name', school_name)
-            SystemSetting.upsert_setting('general', 'abbreviated_school_name', abbreviated_school_name)
-            SystemSetting.upsert_setting('general', 'currency', currency)
-            SystemSetting.upsert_setting('general', 'academic_year', academic_year)
-            SystemSetting.upsert_setting('general', 'timezone', timezone)
-            SystemSetting.upsert_setting('general', 'school_address', school_address)
-            SystemSetting.upsert_setting('general', 'school_phone', school_phone)
-            SystemSetting.upsert_setting('general', 'school_email', school_email)
-
             # Maintenance Mode
             maintenance_mode = request.form.get('maintenance_mode') == 'on'
             maintenance_message = request.form.get('maintenance_message', 'System is under maintenance. Please try again later.')
 
-            SystemSetting.upsert_setting('system', 'maintenance_mode', maintenance_mode)
-            SystemSetting.upsert_setting('system', 'maintenance_message', maintenance_message)
-
             # Backup Settings
             auto_backup_enabled = request.form.get('auto_backup_enabled') == 'on'
             backup_frequency = request.form.get('backup_frequency', 'weekly')
             backup_time = request.form.get('backup_time', '02:00')
 
-            SystemSetting.upsert_setting('backups', 'enabled', auto_backup_enabled)
-            SystemSetting.upsert_setting('backups', 'frequency', backup_frequency)
-            SystemSetting.upsert_setting('backups', 'time', backup_time)
-
             # Log Settings
             log_level = request.form.get('log_level', 'INFO')
             log_retention = int(request.form.get('log_retention', 30))
 
-            SystemSetting.upsert_setting('logs', 'level', log_level)
-            SystemSetting.upsert_setting('logs', 'retention_days', log_retention)
-
             # Performance Settings
             cache_timeout = request.form.get('cache_enabled') == 'on'
             max_upload_size = int(request.form.get('max_upload_size', 10))
 
-            SystemSetting.upsert_setting('performance', 'cache_enabled', cache_timeout)
-            SystemSetting.upsert_setting('performance', 'upload_max_size', max_upload_size)
-
             # Security Settings
             force_https = request.form.get('force_https') == 'on'
             enable_cors = request.form.get('enable_cors') == 'on'
 
-            SystemSetting.upsert_setting('security', 'https_enforced', force_https)
-            SystemSetting.upsert_setting('security', 'cors_enabled', enable_cors)
+            # One SELECT and one upsert; the settings cache reloads on commit
+            SystemSetting.upsert_many([
+                ('general', 'school_name', school_name),
+                ('general', 'abbreviated_school_name', abbreviated_school_name),
+                ('general', 'currency', currency),
+                ('general', 'academic_year', academic_year),
+                ('general', 'timezone', timezone),
+                ('general', 'school_address', school_address),
+                ('general', 'school_phone', school_phone),
+                ('general', 'school_email', school_email),
+                ('system', 'maintenance_mode', maintenance_mode),
+                ('system', 'maintenance_message', maintenance_message),
+                ('backups', 'enabled', auto_backup_enabled),
+                ('backups', 'frequency', backup_frequency),
+                ('backups', 'time', backup_time),
+                ('logs', 'level', log_level),
+                ('logs', 'retention_days', log_retention),
+                ('performance', 'cache_enabled', cache_timeout),
+                ('performance', 'upload_max_size', max_upload_size),
+                ('security', 'https_enforced', force_https),
+                ('security', 'cors_enabled', enable_cors),
+            ])
 
             db.session.commit()
-            # Invalidate settings cache
-            from utils.settings import SystemSettings
-            SystemSettings.invalidate_cache()
+            # The active academic year may have changed with the settings
+            from utils.reference_data import ReferenceData
+            ReferenceData.invalidate('academic_years')
 
             # Reschedule automatic backups if settings changed
             try:
@@ -255,6 +253,27 @@ def system_settings():
     return render_template('admin/system_settings.html', settings=settings, academic_years=academic_years)
 
 
+@admin_bp.route('/query_stats', methods=['GET', 'POST'])
+def query_stats():
+    """Per-endpoint query counts and database time for this worker"""
+    if 'user_id' not in session or session.get('user_role', '').lower() != 'admin':
+        flash('Access denied')
+        return redirect(url_for('index'))
+
+    from utils.query_stats import QueryStats
+
+    if request.method == 'POST':
+        QueryStats.reset()
+        flash('Query statistics cleared')
+        return redirect(url_for('admin.query_stats'))
+
+    rows = QueryStats.summary()
+    if request.args.get('format') == 'json':
+        return jsonify({'success': True, 'endpoints': rows})
+
+    return render_template('admin/query_stats.html', rows=rows)
+
+
 @admin_bp.route('/create_backup', methods=['POST'])
 def create_backup():
     """Create a manual database backup"""
@@ -0,0 +1,132 @@
+"""
+Batched JSON API for the dashboards.
+
+POST /api/batch runs several GET requests to the app's own JSON endpoints in
+one round trip, which matters on the slow mobile connections parents use:
+
+    {"requests": {"pupil": "/parent/api/pupil/<id>",
+                  "reports": {"path": "/parent/api/pupil/<id>/reports"}}}
+
+GET /api/batch?pupil=/parent/api/pupil/<id>&reports=... does the same with
+one query parameter per sub-request. Both return
+
+    {"success": true,
+     "responses": {"pupil": {"status": 200, "body": {...}},
+                   "reports": {"status": 200, "body": {...}}}}
+
+Each sub-request runs on a worker thread in its own request and application
+context, so it gets its own database session, and goes through the normal
+before/after request hooks and the target route's own access checks with the
+caller's session cookie.
+
+A GET batch whose sub-responses all carry stale-while-revalidate caching
+headers (see utils.http_cache) gets the most restrictive of them plus its own
+ETag, so the service worker can cache the combined payload too.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+from flask import Blueprint, request, session, jsonify, current_app
+
+from utils.http_cache import apply_cache_headers, stale_while_revalidate_window
+
+api_bp = Blueprint('api', __name__, url_prefix='/api')
+
+# Sub-requests allowed in one batch
+MAX_BATCH_REQUESTS = 10
+
+# Seconds to wait for the whole batch. Sub-requests already running when it
+# passes cannot be interrupted and finish in the background.
+BATCH_TIMEOUT = float(os.getenv('BATCH_TIMEOUT', 30))
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('BATCH_WORKERS', 4)),
+                               thread_name_prefix='api-batch')
+
+
+def _run_sub_request(app, path, cookie):
+    """Dispatch one GET through the app
+
+    Returns ({'status', 'body'}, the response's (max-age, stale-while-revalidate)
+    window or None).
+    """
+    headers = {'Accept': 'application/json'}
+    if cookie:
+        headers['Cookie'] = cookie
+    with app.test_request_context(path, method='GET', headers=headers):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            print(f"⚠ Batch sub-request {path} failed: {e}")
+            return {'status': 500, 'body': None, 'error': 'Internal error'}, None
+
+        if response.status_code in (301, 302, 303, 307, 308):
+            # Usually the route's access check sending the user to log in
+            return {'status': response.status_code, 'body': None, 'location': response.headers.get('Location')}, None
+        if not response.is_json:
+            return {'status': response.status_code, 'body': None, 'error': 'Not a JSON endpoint'}, None
+        window = stale_while_revalidate_window(response.headers.get('Cache-Control')) \
+            if response.status_code == 200 else None
+        return {'status': response.status_code, 'body': response.get_json(silent=True)}, window
+
+
+def _parse_requests():
+    """{name: path} from the query string or JSON body, or an error message"""
+    if request.method == 'GET':
+        requests = request.args.to_dict()
+    else:
+        payload = request.get_json(silent=True)
+        requests = payload.get('requests') if isinstance(payload, dict) else None
+    if not isinstance(requests, dict) or not requests:
+        return None, 'Expected {"requests": {"name": "/path", ...}} or ?name=/path'
+    if len(requests) > MAX_BATCH_REQUESTS:
+        return None, f'At most {MAX_BATCH_REQUESTS} requests per batch'
+
+    batch_path = request.path
+    paths = {}
+    for name, spec in requests.items():
+        path = spec.get('path') if isinstance(spec, dict) else spec
+        if not isinstance(path, str) or not path.startswith('/') or path.startswith('//'):
+            return None, f'Invalid path for "{name}"'
+        if urlsplit(path).path == batch_path:
+            return None, 'Batches cannot contain batches'
+        paths[name] = path
+    return paths, None
+
+
+@api_bp.route('/batch', methods=['GET', 'POST'])
+def batch():
+    """Run several GET sub-requests concurrently and return all their responses"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Not logged in'}), 401
+
+    paths, error = _parse_requests()
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+
+    app = current_app._get_current_object()
+    cookie = request.headers.get('Cookie')
+    futures = {name: _executor.submit(_run_sub_request, app, path, cookie) for name, path in paths.items()}
+
+    # One deadline for the whole batch; sub-requests still queued then are cancelled
+    done, _ = wait(futures.values(), timeout=BATCH_TIMEOUT)
+
+    responses = {}
+    windows = []
+    for name, future in futures.items():
+        if future not in done:
+            future.cancel()
+            responses[name] = {'status': 504, 'body': None, 'error': 'Timed out'}
+            windows.append(None)
+            continue
+        try:
+            responses[name], window = future.result()
+        except Exception as e:
+            print(f"⚠ Batch sub-request {name} failed: {e}")
+            responses[name], window = {'status': 500, 'body': None, 'error': 'Internal error'}, None
+        windows.append(window)
+
+    response = jsonify({'success': True, 'responses': responses})
+    if request.method == 'GET' and all(windows):
+        response = apply_cache_headers(response, min(w[0] for w in windows), min(w[1] for w in windows))
+    return response
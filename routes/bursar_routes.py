@@ -1,7 +1,14 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_template, stream_with_context
 import uuid
 from models import db, FeeCategory, FeeStructure, StudentFee, Payment, PaymentMethod, Pupil, AcademicYear, SchoolClass, User, Stream, Term, BursarSettings, SystemSetting
 from utils.settings import SystemSettings
+from utils.cache import ResultCache, BURSAR_DASHBOARD, invalidate_payment_caches
+from utils.reference_data import ReferenceData
+from utils.fee_analytics import class_collection, revenue_analysis, REVENUE_BUCKETS, TERM_COLUMNS
+from utils.pupil_search import search_pupils
+from utils.autocomplete import PupilAutocomplete
+from utils.invoices import paid_pupil_summaries, class_fee_totals, build_invoice, iter_invoices, invoice_context, stream_invoice_zip, bulk_invoice_extension
+from utils.http_cache import cache_headers
 from datetime import datetime, date, timedelta
 from sqlalchemy import func, and_, or_
 import pytz
@@ -27,58 +34,70 @@ def bursar_required(f):
 def dashboard():
     """Bursar dashboard with key metrics and quick actions"""
     # Get current academic year
-    current_academic_year = AcademicYear.query.filter_by(is_active=True).first()
+    current_academic_year = ReferenceData.current_academic_year()
+    today = date.today()
+
+    # Aggregates are cached per academic year and day; payment and fee structure
+    # saves invalidate them, so busy reloads between payments are cache hits
+    cache_key = (current_academic_year.id if current_academic_year else None, today)
+    stats = ResultCache.get_or_set(BURSAR_DASHBOARD, cache_key,
+                                   lambda: _dashboard_stats(current_academic_year, today))
 
-    # Quick stats
-    total_students = Pupil.query.filter_by(academic_year_id=current_academic_year.id, enrollment_status='active').count() if current_academic_year else 0
+    # Load academic years and terms for the termly report modal
+    academic_years = ReferenceData.academic_years()
+    terms = ReferenceData.terms(active_only=False)
 
+    return render_template('bursar/dashboard.html',
+                         total_students=stats['total_students'],
+                         todays_payments_count=stats['todays_payments_count'],
+                         todays_total=stats['todays_total'],
+                         todays_total_formatted=SystemSettings.format_currency(stats['todays_total']),
+                         outstanding_count=stats['outstanding_count'],
+                         academic_years=academic_years,
+                         terms=terms)
+
+
+def _dashboard_stats(current_academic_year, today):
+    """Compute the dashboard figures with aggregate queries"""
     # Today's payments
-    today = date.today()
-    todays_payments = Payment.query.filter_by(payment_date=today).all()
-    todays_total = sum(p.amount for p in todays_payments) if todays_payments else 0.0
+    todays_payments_count, todays_total = db.session.query(
+        func.count(Payment.id), func.coalesce(func.sum(Payment.amount), 0)
+    ).filter(Payment.payment_date == today).one()
 
-    # Outstanding fees calculation
+    total_students = 0
     outstanding_count = 0
     if current_academic_year:
-        # Get all active students for current academic year
-        students = Pupil.query.filter_by(academic_year_id=current_academic_year.id, enrollment_status='active').all()
+        # Only the class of each active student is needed
+        students = db.session.query(Pupil.id, Pupil.class_admitted)\
+            .filter_by(academic_year_id=current_academic_year.id, enrollment_status='active').all()
+        total_students = len(students)
 
         if students:
             # Aggregate fee structures per class
-            fee_structs = FeeStructure.query.filter_by(academic_year_id=current_academic_year.id).all()
-            assigned_by_class = {}
-            for fs in fee_structs:
-                assigned_by_class.setdefault(fs.class_id, 0)
-                assigned_by_class[fs.class_id] += (fs.term1_amount or 0) + (fs.term2_amount or 0) + (fs.term3_amount or 0)
+            assigned_by_class = class_fee_totals(current_academic_year.id)
 
-            # Get payments totals for all students
-            student_ids = [s.id for s in students]
+            # Payment totals per student for the year
             payments_q = db.session.query(Payment.pupil_id, func.coalesce(func.sum(Payment.amount), 0))\
-                            .filter(Payment.pupil_id.in_(student_ids))\
+                            .join(Pupil, Pupil.id == Payment.pupil_id)\
+                            .filter(Pupil.academic_year_id == current_academic_year.id,
+                                    Pupil.enrollment_status == 'active')\
                             .filter(Payment.academic_year_id == current_academic_year.id)\
                             .group_by(Payment.pupil_id).all()
             payments_dict = {r[0]: float(r[1]) for r in payments_q}
 
             # Count students with outstanding fees
-            for student in students:
-                total_assigned = assigned_by_class.get(student.class_admitted, 0)
-                total_paid = payments_dict.get(student.id, 0.0)
-                outstanding = max(0, total_assigned - total_paid)
-                if outstanding > 0:
+            for student_id, class_id in students:
+                total_assigned = assigned_by_class.get(class_id, 0)
+                total_paid = payments_dict.get(student_id, 0.0)
+                if max(0, total_assigned - total_paid) > 0:
                     outstanding_count += 1
 
-    # Load academic years and terms for the termly report modal
-    academic_years = AcademicYear.query.order_by(AcademicYear.name.desc()).all()
-    terms = Term.query.order_by(Term.id).all()
-
-    return render_template('bursar/dashboard.html',
-                         total_students=total_students,
-                         todays_payments_count=len(todays_payments),
-                         todays_total=todays_total,
-                         todays_total_formatted=SystemSettings.format_currency(todays_total),
-                         outstanding_count=outstanding_count,
-                         academic_years=academic_years,
-                         terms=terms)
+    return {
+        'total_students': total_students,
+        'todays_payments_count': todays_payments_count,
+        'todays_total': float(todays_total or 0),
+        'outstanding_count': outstanding_count
+    }
 
 
 @bursar_bp.route('/fee_search', methods=['POST'])
@@ -106,13 +125,14 @@ def fee_search():
 
         # Limit results for performance
         rows = qry.order_by(Payment.payment_date.desc()).limit(100).all()
+        money = SystemSettings.current().currency_formatter
         for payment, pupil in rows:
             results.append({
                 'pupil_name': f"{pupil.first_name} {pupil.last_name}",
                 'admission_no': getattr(pupil, 'admission_number', ''),
                 'receipt_no': getattr(payment, 'receipt_number', ''),
                 'amount': payment.amount,
-                'amount_formatted': SystemSettings.format_currency(payment.amount),
+                'amount_formatted': money.format(payment.amount),
                 'date_posted': payment.payment_date.strftime('%Y-%m-%d') if getattr(payment, 'payment_date', None) else '',
                 'payment_id': payment.id,
                 'pupil_id': pupil.id
@@ -144,13 +164,14 @@ def term_reports():
         if term_int is not None:
             rows = rows.filter(Payment.term == term_int)
         rows = rows.order_by(Payment.payment_date.desc()).limit(500).all()
+        money = SystemSettings.current().currency_formatter
         for payment, pupil in rows:
             results.append({
                 'pupil_name': f"{pupil.first_name} {pupil.last_name}",
                 'admission_no': getattr(pupil, 'admission_number', ''),
                 'receipt_no': getattr(payment, 'receipt_number', ''),
                 'amount': payment.amount,
-                'amount_formatted': SystemSettings.format_currency(payment.amount),
+                'amount_formatted': money.format(payment.amount),
                 'date_posted': payment.payment_date.strftime('%Y-%m-%d') if getattr(payment, 'payment_date', None) else '',
                 'payment_id': payment.id,
                 'pupil_id': pupil.id
@@ -169,11 +190,11 @@ def pupil_payments(pupil_id):
         return redirect(url_for('bursar.dashboard'))
 
     # Current academic year and list
-    current_year = AcademicYear.query.filter_by(is_active=True).first()
-    academic_years = AcademicYear.query.order_by(AcademicYear.name.desc()).all()
+    current_year = ReferenceData.current_academic_year()
+    academic_years = ReferenceData.academic_years()
 
     # Payment methods
-    payment_methods = PaymentMethod.query.filter_by(is_active=True).order_by(PaymentMethod.name).all()
+    payment_methods = ReferenceData.payment_methods()
 
     editing_payment = None
     if request.method == 'POST':
@@ -205,6 +226,7 @@ def pupil_payments(pupil_id):
                     payment.recorded_by = session.get('user_id')
                     payment.recorded_at = datetime.utcnow()
                     db.session.commit()
+                    invalidate_payment_caches()
                     flash('Payment updated', 'success')
             else:
                 payment = Payment(
@@ -224,6 +246,7 @@ def pupil_payments(pupil_id):
                     payment.receipt_number = f"RCPT-{int(datetime.utcnow().timestamp())}-{uuid.uuid4().hex[:6]}"
                 db.session.add(payment)
                 db.session.commit()
+                invalidate_payment_caches()
                 flash('Payment recorded', 'success')
 
             try:
@@ -292,13 +315,14 @@ def pupil_payments(pupil_id):
 
     # Build results structure (used by the payments partial) so each row can include payment_id
     results = []
+    money = SystemSettings.current().currency_formatter
     for payment in payments:
         results.append({
             'pupil_name': f"{pupil.first_name} {pupil.last_name}",
             'admission_no': getattr(pupil, 'admission_number', ''),
             'receipt_no': getattr(payment, 'receipt_number', ''),
             'amount': payment.amount,
-            'amount_formatted': SystemSettings.format_currency(payment.amount),
+            'amount_formatted': money.format(payment.amount),
             'date_posted': payment.payment_date.strftime('%Y-%m-%d') if getattr(payment, 'payment_date', None) else '',
             'payment_method': getattr(payment, 'payment_method', ''),
             'term': getattr(payment, 'term', None),
@@ -309,13 +333,13 @@ def pupil_payments(pupil_id):
         })
 
     # Format for display
-    assigned_total_formatted = SystemSettings.format_currency(assigned_total)
-    total_paid_formatted = SystemSettings.format_currency(total_paid)
-    balance_formatted = SystemSettings.format_currency(balance)
+    assigned_total_formatted = money.format(assigned_total)
+    total_paid_formatted = money.format(total_paid)
+    balance_formatted = money.format(balance)
 
     # Provide class and stream name lookups so templates show human-readable names
-    classes = {cls.id: cls.name for cls in SchoolClass.query.all()}
-    streams = {strm.id: strm.name for strm in Stream.query.all()}
+    classes = ReferenceData.class_names()
+    streams = ReferenceData.stream_names()
 
     # Allow pre-filling an edit form via query parameter ?edit_payment_id=<id>
     edit_payment_id = request.args.get('edit_payment_id')
@@ -326,17 +350,22 @@ def pupil_payments(pupil_id):
             editing_payment = None
 
     # Terms for dropdowns
-    terms = Term.query.filter_by(is_active=True).order_by(Term.term_number).all()
+    terms = ReferenceData.terms()
 
     # Build assigned_by_year map for the pupil's class so client can compute assigned totals per year/term
     assigned_by_year = {}
     try:
-        class_id = pupil.class_admitted
+        # One grouped query over all years instead of one query per year
+        term_sums = db.session.query(
+            FeeStructure.academic_year_id,
+            func.coalesce(func.sum(FeeStructure.term1_amount), 0),
+            func.coalesce(func.sum(FeeStructure.term2_amount), 0),
+            func.coalesce(func.sum(FeeStructure.term3_amount), 0)
+        ).filter(FeeStructure.class_id == pupil.class_admitted)\
+         .group_by(FeeStructure.academic_year_id).all()
+        sums_by_year = {row[0]: row[1:] for row in term_sums}
         for ay in academic_years:
-            fee_structs_for_ay = FeeStructure.query.filter_by(academic_year_id=ay.id, class_id=class_id).all()
-            term1 = sum((fs.term1_amount or 0) for fs in fee_structs_for_ay)
-            term2 = sum((fs.term2_amount or 0) for fs in fee_structs_for_ay)
-            term3 = sum((fs.term3_amount or 0) for fs in fee_structs_for_ay)
+            term1, term2, term3 = sums_by_year.get(ay.id, (0, 0, 0))
             total = term1 + term2 + term3
             assigned_by_year[ay.id] = {'term1': term1, 'term2': term2, 'term3': term3, 'annual': total}
     except Exception:
@@ -359,26 +388,28 @@ def pupil_payments(pupil_id):
 def payment_history():
     """View payment history"""
     # Get class names for lookup
-    class_names = {cls.id: cls.name for cls in SchoolClass.query.all()}
+    class_names = ReferenceData.class_names()
 
     # Get payment methods from PaymentMethod table
-    payment_methods = PaymentMethod.query.filter_by(is_active=True).order_by(PaymentMethod.name).all()
+    payment_methods = ReferenceData.payment_methods()
     payment_method_names = [method.name for method in payment_methods]
 
     # Get terms from database
-    terms = Term.query.filter_by(is_active=True).order_by(Term.term_number).all()
+    terms = ReferenceData.terms()
 
     # Get academic years from database
-    academic_years = AcademicYear.query.order_by(AcademicYear.name).all()
+    academic_years = ReferenceData.academic_years(descending=False)
 
     # Get recent payments with student and academic year details
     payments = Payment.query.join(Pupil).join(AcademicYear).order_by(Payment.payment_date.desc()).limit(100).all()
 
     # Process payments with system timezone
-    system_tz = pytz.timezone(SystemSettings.get_timezone())
+    settings = SystemSettings.current()
+    system_tz = pytz.timezone(settings.timezone)
     processed_payments = []
 
-    for payment in payments:
+    amounts_formatted = settings.currency_formatter.format_many(payment.amount for payment in payments)
+    for payment, amount_formatted in zip(payments, amounts_formatted):
         # Convert recorded_at to system timezone
         if payment.recorded_at:
             # Assume recorded_at is UTC (as stored by SQLAlchemy)
@@ -394,7 +425,7 @@ def payment_history():
             'pupil': payment.pupil,
             'academic_year': payment.academic_year,
             'amount': payment.amount,
-            'amount_formatted': SystemSettings.format_currency(payment.amount),
+            'amount_formatted': amount_formatted,
             'term': payment.term,
             'payment_date': payment.payment_date,
             'payment_method': payment.payment_method,
@@ -410,11 +441,11 @@ def payment_history():
 @bursar_required
 def fee_structure():
     """Manage fee structures"""
-    current_academic_year = AcademicYear.query.filter_by(is_active=True).first()
-    classes = SchoolClass.query.all()
-    academic_years = AcademicYear.query.order_by(AcademicYear.name.desc()).all()
+    current_academic_year = ReferenceData.current_academic_year()
+    classes = ReferenceData.classes()
+    academic_years = ReferenceData.academic_years()
     fee_categories = FeeCategory.query.filter_by(is_active=True).all()
-    terms = Term.query.filter_by(is_active=True).order_by(Term.term_number).all()
+    terms = ReferenceData.terms()
 
     # Get existing fee structures
     fee_structures = FeeStructure.query.filter_by(
@@ -484,6 +515,7 @@ def save_fee_structure():
             db.session.add(fee_structure)
 
         db.session.commit()
+        invalidate_payment_caches()
         flash('Fee structure saved successfully', 'success')
 
     except Exception as e:
@@ -565,6 +597,7 @@ def update_fee_structures():
                 fee_structure.updated_at = datetime.utcnow()
 
         db.session.commit()
+        invalidate_payment_caches()
         return jsonify({'success': True})
 
     except Exception as e:
@@ -573,10 +606,11 @@ def update_fee_structures():
 
 @bursar_bp.route('/get_terms')
 @bursar_required
+@cache_headers()
 def get_terms():
     """Get all active terms via AJAX"""
     try:
-        terms = Term.query.filter_by(is_active=True).order_by(Term.term_number).all()
+        terms = ReferenceData.terms()
         term_data = [{'id': t.term_number, 'name': t.name} for t in terms]
         return jsonify({'terms': term_data})
     except Exception as e:
@@ -587,7 +621,7 @@ def get_terms():
 def students():
     """View students and their fee status"""
     # Get all academic years for filter
-    academic_years = AcademicYear.query.order_by(AcademicYear.name.desc()).all()
+    academic_years = ReferenceData.academic_years()
 
     # Filter params from query string
     academic_year_filter = request.args.get('academic_year', '')
@@ -603,11 +637,11 @@ def students():
         except ValueError:
             academic_year_filter = None
 
-    current_academic_year = AcademicYear.query.filter_by(is_active=True).first()
-    classes = SchoolClass.query.all()
-    streams = Stream.query.all()
-    payment_methods = PaymentMethod.query.filter_by(is_active=True).all()
-    terms = Term.query.filter_by(is_active=True).order_by(Term.term_number).all()
+    current_academic_year = ReferenceData.current_academic_year()
+    classes = ReferenceData.classes()
+    streams = ReferenceData.streams()
+    payment_methods = ReferenceData.payment_methods()
+    terms = ReferenceData.terms()
 
     # Create lookup dictionaries for class and stream names
     class_names = {cls.id: cls.name for cls in classes}
@@ -730,29 +764,17 @@ def students():
 @bursar_required
 def record_payment():
     """Record payment page"""
-    current_academic_year = AcademicYear.query.filter_by(is_active=True).first()
-    academic_years = AcademicYear.query.order_by(AcademicYear.name.desc()).all()
-    payment_methods = PaymentMethod.query.filter_by(is_active=True).all()
-    terms = Term.query.filter_by(is_active=True).order_by(Term.term_number).all()
-
-    # Get all students with their class and stream info
-    students = Pupil.query.join(SchoolClass, Pupil.class_admitted == SchoolClass.id)\
-                         .join(Stream, Pupil.stream == Stream.id)\
-                         .order_by(Pupil.admission_number)\
-                         .all()
-
-    # Create lookup dictionaries for class and stream names
-    classes = {cls.id: cls.name for cls in SchoolClass.query.all()}
-    streams = {strm.id: strm.name for strm in Stream.query.all()}
+    current_academic_year = ReferenceData.current_academic_year()
+    academic_years = ReferenceData.academic_years()
+    payment_methods = ReferenceData.payment_methods()
+    terms = ReferenceData.terms()
 
+    # Students are picked through the search_student typeahead
     return render_template('bursar/record_payment.html',
                          current_academic_year=current_academic_year,
                          academic_years=academic_years,
                          payment_methods=payment_methods,
                          terms=terms,
-                         students=students,
-                         classes=classes,
-                         streams=streams,
                          date=date)
 
 @bursar_bp.route('/edit_payments/<pupil_id>')
@@ -760,9 +782,9 @@ def record_payment():
 def edit_payments(pupil_id):
     """Edit payments for a specific student"""
     student = Pupil.query.get_or_404(pupil_id)
-    academic_years = AcademicYear.query.order_by(AcademicYear.name.desc()).all()
-    payment_methods = PaymentMethod.query.filter_by(is_active=True).all()
-    terms = Term.query.filter_by(is_active=True).order_by(Term.term_number).all()
+    academic_years = ReferenceData.academic_years()
+    payment_methods = ReferenceData.payment_methods()
+    terms = ReferenceData.terms()
 
     # Get all payments for this student
     payments = Payment.query.filter_by(pupil_id=pupil_id).order_by(Payment.payment_date.desc()).all()
@@ -789,6 +811,7 @@ def update_payment(payment_id):
         payment.notes = request.form.get('notes', '')
 
         db.session.commit()
+        invalidate_payment_caches()
         flash('Payment updated successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -835,6 +858,7 @@ def update_payments(pupil_id):
             payment.notes = fields.get('notes', '')
 
         db.session.commit()
+        invalidate_payment_caches()
         flash('All payments updated successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -899,6 +923,7 @@ def save_payment():
 
         db.session.add(payment)
         db.session.commit()
+        invalidate_payment_caches()
 
         flash(f'Payment of UGX {amount:,.0f} recorded successfully.', 'success')
         try:
@@ -947,27 +972,23 @@ def get_today_payments():
 def search_student():
     """Search student for payment"""
     query = request.args.get('q', '')
-    current_academic_year = AcademicYear.query.filter_by(is_active=True).first()
+    current_academic_year = ReferenceData.current_academic_year()
 
     # Get lookup dictionaries for names
-    classes = SchoolClass.query.all()
-    streams = Stream.query.all()
+    classes = ReferenceData.classes()
+    streams = ReferenceData.streams()
     class_names = {cls.id: cls.name for cls in classes}
     stream_names = {stream.id: stream.name for stream in streams}
 
-    students = []
-    if query:
-        students = Pupil.query.filter(
-            and_(
-                Pupil.academic_year_id == current_academic_year.id if current_academic_year else True,
-                Pupil.enrollment_status == 'active',
-                or_(
-                    Pupil.first_name.ilike(f'%{query}%'),
-                    Pupil.last_name.ilike(f'%{query}%'),
-                    Pupil.admission_number.ilike(f'%{query}%')
-                )
-            )
-        ).order_by(Pupil.admission_number.asc()).limit(10).all()
+    # Prefix matches come from the in-memory index; only fall back to the
+    # database (substring search) when it has nothing
+    year_id = current_academic_year.id if current_academic_year else None
+    students = PupilAutocomplete.suggest(query, academic_year_id=year_id)
+    if not students:
+        criteria = [Pupil.enrollment_status == 'active']
+        if current_academic_year:
+            criteria.append(Pupil.academic_year_id == current_academic_year.id)
+        students = search_pupils(query, *criteria)
 
     return jsonify([{
         'id': s.id,
@@ -983,19 +1004,19 @@ def search_student():
 def reports():
     """Financial reports"""
     current_year = datetime.now().year
-    terms = Term.query.filter_by(is_active=True).order_by(Term.term_number).all()
-    academic_years = AcademicYear.query.order_by(AcademicYear.name).all()
+    terms = ReferenceData.terms()
+    academic_years = ReferenceData.academic_years(descending=False)
     return render_template('bursar/reports.html', current_year=current_year, terms=terms, academic_years=academic_years)
 
 @bursar_bp.route('/api/outstanding_fees')
 def api_outstanding_fees():
     """API endpoint for outstanding fees data"""
     try:
-        current_academic_year = AcademicYear.query.filter_by(is_active=True).first()
+        current_academic_year = ReferenceData.current_academic_year()
         if not current_academic_year:
             return jsonify({'error': 'No active academic year'}), 400
 
-        classes = SchoolClass.query.all()
+        classes = ReferenceData.classes()
         class_names = {cls.id: cls.name for cls in classes}
 
         # Get filter parameters
@@ -1087,11 +1108,11 @@ def api_outstanding_fees():
 @bursar_required
 def outstanding_fees():
     """View outstanding fees"""
-    current_academic_year = AcademicYear.query.filter_by(is_active=True).first()
-    classes = SchoolClass.query.all()
+    current_academic_year = ReferenceData.current_academic_year()
+    classes = ReferenceData.classes()
     class_names = {cls.id: cls.name for cls in classes}
-    payment_methods = PaymentMethod.query.filter_by(is_active=True).all()
-    terms = Term.query.filter_by(is_active=True).order_by(Term.term_number).all()
+    payment_methods = ReferenceData.payment_methods()
+    terms = ReferenceData.terms()
 
     # Filter params from query string
     class_filter = request.args.get('class_name', '')
@@ -1216,6 +1237,7 @@ def outstanding_fees():
                          amount_filter=amount_filter)
 
 @bursar_bp.route('/api/payment_summary')
+@cache_headers()
 def api_payment_summary():
     """API endpoint for payment summary report"""
     try:
@@ -1227,7 +1249,7 @@ def api_payment_summary():
         if academic_year_id:
             academic_year = AcademicYear.query.get(academic_year_id)
         else:
-            academic_year = AcademicYear.query.filter_by(is_active=True).first()
+            academic_year = ReferenceData.current_academic_year()
 
         if not academic_year:
             return jsonify({'error': 'No academic year found'}), 400
@@ -1251,7 +1273,7 @@ def api_payment_summary():
         results = query.all()
 
         # Get term names
-        terms_dict = {term.term_number: term.name for term in Term.query.all()}
+        terms_dict = ReferenceData.term_names()
 
         data = []
         for result in results:
@@ -1266,6 +1288,7 @@ def api_payment_summary():
         return jsonify({'error': str(e)}), 500
 
 @bursar_bp.route('/api/revenue_analysis')
+@cache_headers()
 def api_revenue_analysis():
     """API endpoint for revenue analysis report"""
     try:
@@ -1277,69 +1300,37 @@ def api_revenue_analysis():
         if academic_year_id:
             academic_year = AcademicYear.query.get(academic_year_id)
         else:
-            academic_year = AcademicYear.query.filter_by(is_active=True).first()
+            academic_year = ReferenceData.current_academic_year()
 
         if not academic_year:
             return jsonify({'error': 'No academic year found'}), 400
 
-        # Get total revenue
-        total_revenue_query = db.session.query(func.sum(Payment.amount)).filter(
-            Payment.academic_year_id == academic_year.id
-        )
-        if term_filter:
-            total_revenue_query = total_revenue_query.filter(Payment.term == int(term_filter))
+        bucket = request.args.get('bucket', 'month')
+        if bucket not in REVENUE_BUCKETS:
+            return jsonify({'error': f'Invalid bucket: {bucket}'}), 400
+        term = int(term_filter) if term_filter.isdigit() else None
+        if term_filter and term not in TERM_COLUMNS:
+            return jsonify({'error': f'Invalid term: {term_filter}'}), 400
 
-        total_revenue = total_revenue_query.scalar() or 0
-
-        # Get student count
-        student_count = Pupil.query.filter_by(
-            academic_year_id=academic_year.id,
-            enrollment_status='active'
-        ).count()
-
-        avg_revenue = total_revenue / student_count if student_count > 0 else 0
+        # Totals, pupil count and the bucketed series come from one statement
+        data = revenue_analysis(academic_year, term, bucket)
 
         # Calculate collection rate (simplified - total collected vs expected)
         # For now, assume 95% collection rate as placeholder
         collection_rate = 95.2
 
-        # Monthly revenue data (group by month)
-        monthly_query = db.session.query(
-            func.extract('month', Payment.payment_date).label('month'),
-            func.sum(Payment.amount).label('amount')
-        ).filter(
-            Payment.academic_year_id == academic_year.id,
-            Payment.payment_date.isnot(None)
-        )
-
-        if term_filter:
-            monthly_query = monthly_query.filter(Payment.term == int(term_filter))
-
-        monthly_query = monthly_query.group_by(func.extract('month', Payment.payment_date)).order_by(func.extract('month', Payment.payment_date))
-
-        monthly_data = monthly_query.all()
-
-        months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-        monthly_amounts = [0] * 12
-
-        for result in monthly_data:
-            month_idx = int(result.month) - 1
-            if 0 <= month_idx < 12:
-                monthly_amounts[month_idx] = result.amount
-
-        data = {
-            'total_revenue': total_revenue,
-            'avg_revenue': avg_revenue,
-            'collection_rate': collection_rate,
-            'monthly_labels': months,
-            'monthly_data': monthly_amounts
-        }
+        data = dict(data,
+                    collection_rate=collection_rate,
+                    # Kept for older clients: the series labels/amounts for the chosen bucket
+                    monthly_labels=data['series']['labels'],
+                    monthly_data=data['series']['amounts'])
 
         return jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @bursar_bp.route('/api/class_collection')
+@cache_headers()
 def api_class_collection():
     """API endpoint for class-wise collection report"""
     try:
@@ -1351,69 +1342,13 @@ def api_class_collection():
         if academic_year_id:
             academic_year = AcademicYear.query.get(academic_year_id)
         else:
-            academic_year = AcademicYear.query.filter_by(is_active=True).first()
+            academic_year = ReferenceData.current_academic_year()
 
         if not academic_year:
             return jsonify({'error': 'No academic year found'}), 400
 
-        # Get all classes
-        classes = SchoolClass.query.all()
-        class_names = {cls.id: cls.name for cls in classes}
-
-        data = []
-
-        for class_id, class_name in class_names.items():
-            # Count students in this class
-            student_count = Pupil.query.filter_by(
-                academic_year_id=academic_year.id,
-                class_admitted=class_id,
-                enrollment_status='active'
-            ).count()
-
-            # Get fee structures for this class
-            fee_structures = FeeStructure.query.filter_by(
-                academic_year_id=academic_year.id,
-                class_id=class_id
-            ).all()
-
-            # Calculate expected fees
-            expected_total = 0
-            for fs in fee_structures:
-                if term_filter:
-                    term = int(term_filter)
-                    if term == 1:
-                        expected_total += fs.term1_amount * student_count
-                    elif term == 2:
-                        expected_total += fs.term2_amount * student_count
-                    elif term == 3:
-                        expected_total += fs.term3_amount * student_count
-                else:
-                    expected_total += (fs.term1_amount + fs.term2_amount + fs.term3_amount) * student_count
-
-            # Get collected amount for this class
-            collected_query = db.session.query(func.sum(Payment.amount)).filter(
-                Payment.academic_year_id == academic_year.id,
-                Payment.pupil.has(class_admitted=class_id)
-            )
-
-            if term_filter:
-                collected_query = collected_query.filter(Payment.term == int(term_filter))
-
-            collected_total = collected_query.scalar() or 0
-
-            # Calculate percentage
-            percentage = (collected_total / expected_total * 100) if expected_total > 0 else 0
-
-            data.append({
-                'class': class_name,
-                'students': student_count,
-                'expected': expected_total,
-                'collected': collected_total,
-                'percentage': round(percentage, 1)
-            })
-
-        # Sort by class name
-        data.sort(key=lambda x: x['class'])
+        # Per-class and per-stream totals from one grouped statement
+        data = class_collection(academic_year.id, int(term_filter) if term_filter else None)
 
         return jsonify(data)
     except Exception as e:
@@ -1480,28 +1415,26 @@ def settings():
         print(f"DEBUG: Form data: {dict(request.form)}")
         # Handle form submission
         try:
-            # Notification settings
-            SystemSetting.upsert_setting('notifications', 'email_notifications', request.form.get('email_notifications') == 'on')
-            SystemSetting.upsert_setting('notifications', 'payment_reminders', request.form.get('payment_reminders') == 'on')
-            SystemSetting.upsert_setting('notifications', 'overdue_alerts', request.form.get('overdue_alerts') == 'on')
-            SystemSetting.upsert_setting('notifications', 'reminder_days', int(request.form.get('reminder_days', 7)))
-
-            # Security settings
-            SystemSetting.upsert_setting('security', 'password_min_length', int(request.form.get('password_min_length', 8)))
-            SystemSetting.upsert_setting('security', 'session_timeout', int(request.form.get('session_timeout', 30)))
-            SystemSetting.upsert_setting('security', 'two_factor_auth', request.form.get('two_factor_auth') == 'on')
-            SystemSetting.upsert_setting('security', 'login_attempts', int(request.form.get('login_attempts', 5)))
-
-            # Report settings
-            SystemSetting.upsert_setting('reports', 'default_format', request.form.get('default_format', 'pdf'))
-            SystemSetting.upsert_setting('reports', 'auto_generate', request.form.get('auto_generate') == 'on')
-            SystemSetting.upsert_setting('reports', 'include_charts', request.form.get('include_charts') == 'on')
-            SystemSetting.upsert_setting('reports', 'report_frequency', request.form.get('report_frequency', 'monthly'))
+            SystemSetting.upsert_many([
+                # Notification settings
+                ('notifications', 'email_notifications', request.form.get('email_notifications') == 'on'),
+                ('notifications', 'payment_reminders', request.form.get('payment_reminders') == 'on'),
+                ('notifications', 'overdue_alerts', request.form.get('overdue_alerts') == 'on'),
+                ('notifications', 'reminder_days', int(request.form.get('reminder_days', 7))),
+                # Security settings
+                ('security', 'password_min_length', int(request.form.get('password_min_length', 8))),
+                ('security', 'session_timeout', int(request.form.get('session_timeout', 30))),
+                ('security', 'two_factor_auth', request.form.get('two_factor_auth') == 'on'),
+                ('security', 'login_attempts', int(request.form.get('login_attempts', 5))),
+                # Report settings
+                ('reports', 'default_format', request.form.get('default_format', 'pdf')),
+                ('reports', 'auto_generate', request.form.get('auto_generate') == 'on'),
+                ('reports', 'include_charts', request.form.get('include_charts') == 'on'),
+                ('reports', 'report_frequency', request.form.get('report_frequency', 'monthly')),
+            ])
 
             db.session.commit()
-            # Invalidate system settings cache
-            SystemSettings.invalidate_cache()
-            print(f"DEBUG: Settings committed and cache invalidated")
+            print(f"DEBUG: Settings committed")
             flash('Settings saved successfully!', 'success')
         except Exception as e:
             db.session.rollback()
@@ -1512,12 +1445,10 @@ def settings():
     # GET request - load current settings
     settings_data = {}
 
-    # Load all settings from database
-    all_settings = SystemSetting.query.filter_by(is_active=True).all()
-    for setting in all_settings:
-        if setting.category not in settings_data:
-            settings_data[setting.category] = {}
-        settings_data[setting.category][setting.key] = setting.typed_value
+    # Load the saved settings from the settings snapshot
+    current = SystemSettings.current()
+    for category in ('notifications', 'security', 'reports'):
+        settings_data[category] = current.category(category)
 
     # Set defaults if not found
     defaults = {
@@ -1549,9 +1480,6 @@ def settings():
             if key not in settings_data[category]:
                 settings_data[category][key] = default_value
 
-    # Fetch academic years for dropdown
-    academic_years = AcademicYear.query.order_by(AcademicYear.start_year.desc()).all()
-
     return render_template('bursar/settings.html', settings=settings_data)
 
 @bursar_bp.route('/generate_invoice')
@@ -1562,37 +1490,38 @@ def generate_invoice():
         flash('Access denied')
         return redirect(url_for('index'))
 
-    # Get all pupils who have made payments (paid pupils)
-    # First get all pupil IDs that have payments
-    paid_pupil_ids = db.session.query(Payment.pupil_id).distinct().all()
-    paid_pupil_ids = [p[0] for p in paid_pupil_ids]  # Extract IDs from tuples
-
-    # Then get the pupil details
-    paid_pupils = Pupil.query.filter(
-        Pupil.id.in_(paid_pupil_ids),
-        Pupil.enrollment_status == 'active'
-    ).order_by(Pupil.first_name, Pupil.last_name).all()
-
-    # Create pupil data with payment info
-    pupils_data = []
-    for pupil in paid_pupils:
-        # Get total payments made by this pupil
-        total_paid = db.session.query(func.sum(Payment.amount)).filter_by(pupil_id=pupil.id).scalar() or 0.0
-
-        # Get latest payment date
-        latest_payment = Payment.query.filter_by(pupil_id=pupil.id).order_by(Payment.payment_date.desc()).first()
-
-        pupils_data.append({
-            'id': pupil.id,
-            'first_name': pupil.first_name,
-            'last_name': pupil.last_name,
-            'admission_number': pupil.admission_number,
-            'total_paid': total_paid,
-            'latest_payment_date': latest_payment.payment_date if latest_payment else None,
-            'payment_count': Payment.query.filter_by(pupil_id=pupil.id).count()
-        })
+    # Totals, latest payment date and payment count for every paid pupil in one grouped query
+    pupils_data = paid_pupil_summaries()
+    classes = ReferenceData.classes()
+
+    return render_template('bursar/generate_invoice.html', pupils=pupils_data, classes=classes)
 
-    return render_template('bursar/generate_invoice.html', pupils=pupils_data)
+@bursar_bp.route('/generate_invoices/bulk')
+@bursar_required
+def generate_bulk_invoices():
+    """Stream invoices for a class (or the whole school) as a ZIP or one printable document"""
+    class_id = request.args.get('class_id') or None
+    output = request.args.get('format', 'zip')
+
+    label = 'All_Classes'
+    if class_id:
+        school_class = SchoolClass.query.get_or_404(class_id)
+        label = school_class.name.replace(' ', '_')
+
+    if output == 'html':
+        # One document with a page per pupil, rendered as the browser reads it
+        return Response(stream_template('bursar/bulk_invoices_template.html',
+                                        invoices=iter_invoices(class_id),
+                                        title=label.replace('_', ' '),
+                                        **invoice_context()),
+                        mimetype='text/html')
+
+    filename = f"Invoices_{label}_{datetime.now().strftime('%Y%m%d')}.zip"
+    response = Response(stream_with_context(stream_invoice_zip(class_id, base_url=request.url_root)),
+                        mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Invoice-Format'] = bulk_invoice_extension()
+    return response
 
 @bursar_bp.route('/generate_pupil_invoice/<pupil_id>')
 @bursar_required
@@ -1607,58 +1536,10 @@ def generate_pupil_invoice(pupil_id):
     # Get all payments for this pupil
     payments = Payment.query.filter_by(pupil_id=pupil_id).order_by(Payment.payment_date.desc()).all()
 
-    # Calculate total paid
-    total_paid = sum(payment.amount for payment in payments)
-    total_paid_formatted = SystemSettings.format_currency(total_paid)
+    # Totals are worked out the same way as for bulk invoices
+    context = invoice_context()
+    current_academic_year = context['current_academic_year']
+    fee_totals = class_fee_totals(current_academic_year.id if current_academic_year else None)
+    invoice = build_invoice(pupil, payments, fee_totals)
 
-    # Calculate required fees and balance for current academic year
-    current_academic_year = AcademicYear.query.filter_by(is_active=True).first()
-    assigned_total = 0.0
-    balance = 0.0
-
-    if current_academic_year and pupil.class_admitted:
-        # Get fee structures for the pupil's class and current academic year
-        fee_structs = FeeStructure.query.filter_by(
-            academic_year_id=current_academic_year.id,
-            class_id=pupil.class_admitted
-        ).all()
-
-        # Sum all term amounts for the annual total
-        for fs in fee_structs:
-            assigned_total += (fs.term1_amount or 0) + (fs.term2_amount or 0) + (fs.term3_amount or 0)
-
-        # Calculate balance (what they still owe)
-        balance = max(0, assigned_total - total_paid)
-
-    # Format amounts
-    assigned_total_formatted = SystemSettings.format_currency(assigned_total)
-    balance_formatted = SystemSettings.format_currency(balance)
-
-    # Format payment amounts
-    for payment in payments:
-        payment.amount_formatted = SystemSettings.format_currency(payment.amount)
-
-    # Get current academic year
-    current_academic_year = AcademicYear.query.filter_by(is_active=True).first()
-
-    # Get system settings
-    system_settings = {
-        'school_name': SystemSettings.get_school_name(),
-        'abbreviated_school_name': SystemSettings.get_abbreviated_school_name(),
-        'school_address': SystemSettings.get('general', 'school_address', ''),
-        'school_phone': SystemSettings.get('general', 'school_phone', ''),
-        'school_email': SystemSettings.get('general', 'school_email', ''),
-    }
-
-    return render_template('bursar/pupil_invoice.html',
-                         pupil=pupil,
-                         payments=payments,
-                         total_paid=total_paid,
-                         total_paid_formatted=total_paid_formatted,
-                         assigned_total=assigned_total,
-                         assigned_total_formatted=assigned_total_formatted,
-                         balance=balance,
-                         balance_formatted=balance_formatted,
-                         current_academic_year=current_academic_year,
-                         system_settings=system_settings,
-                         datetime=datetime)
\ No newline at end of file
+    return render_template('bursar/pupil_invoice.html', **invoice, **context)
\ No newline at end of file
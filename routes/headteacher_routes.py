@@ -4,11 +4,10 @@ from models.school_class import SchoolClass
 from models.stream import Stream
 from models.teacher_assignment import TeacherAssignment
 from models import db
-from datetime import datetime
 import pytz
-import re
-from collections import defaultdict
 from utils.settings import SystemSettings
+from utils.reference_data import ReferenceData
+from utils.assignments import apply_assignments
 
 headteacher_bp = Blueprint('headteacher', __name__, url_prefix='/headteacher')
 
@@ -32,10 +31,10 @@ def assign_classes_streams():
     teachers = User.query.filter_by(role='teacher', is_active=True).all()
 
     # Fetch all classes
-    classes = SchoolClass.query.all()
+    classes = ReferenceData.classes()
 
     # Fetch all streams
-    streams = Stream.query.all()
+    streams = ReferenceData.streams()
 
     # Fetch existing assignments
     assignments = TeacherAssignment.query.filter_by(is_active=True).all()
@@ -90,26 +89,19 @@ def save_assignments():
             seen_class_stream.add(class_stream_key)
             seen_teacher.add(teacher_id)
 
-        db.session.begin()
-
-        TeacherAssignment.query.update({'is_active': False})
-        print(f"DEBUG: Deactivated all existing assignments")
-
-        for assignment in assignments_data:
-            print(f"DEBUG: Creating assignment - teacher_id: {assignment.get('teacher_id')}, class_id: {assignment.get('class_id')}, stream_id: {assignment.get('stream_id')}")
-            new_assignment = TeacherAssignment(
-                teacher_id=assignment.get('teacher_id'),
-                class_id=assignment.get('class_id'),
-                stream_id=assignment.get('stream_id'),
-                assigned_date=datetime.utcnow(),
-                is_active=True
-            )
-            db.session.add(new_assignment)
-
-        db.session.commit()
-        print(f"DEBUG: Successfully saved {len(assignments_data)} assignments")
-
-        return jsonify({'success': True, 'message': 'Assignments saved successfully'})
+        # Only the assignments that changed are written, in one transaction
+        diff = apply_assignments([
+            (assignment.get('teacher_id'), assignment.get('class_id'), assignment.get('stream_id'))
+            for assignment in assignments_data
+        ])
+
+        return jsonify({
+            'success': True,
+            'message': 'Assignments saved successfully',
+            'added': len(diff.added),
+            'removed': len(diff.removed),
+            'unchanged': diff.unchanged
+        })
 
     except Exception as e:
         db.session.rollback()
@@ -137,7 +129,7 @@ def view_assignments():
             TeacherAssignment.created_at
         ).all()
 
-    system_tz = pytz.timezone(SystemSettings.get_timezone())
+    system_tz = pytz.timezone(SystemSettings.current().timezone)
     formatted_assignments = []
 
     for assignment in assignments:
@@ -154,31 +146,19 @@ def view_assignments():
         formatted_assignments.append({
             'teacher_name': f"{assignment.first_name} {assignment.last_name}",
             'teacher_email': assignment.email,
+            'class_id': assignment.TeacherAssignment.class_id,
+            'stream_id': assignment.TeacherAssignment.stream_id,
             'class_name': assignment.class_name,
             'stream_name': assignment.stream_name,
             'assigned_date': formatted_date
         })
 
-    grouped_assignments = defaultdict(list)
-    for assignment in formatted_assignments:
-        grouped_assignments[assignment['class_name']].append(assignment)
-
-    def class_sort_key(class_name):
-        """
-        Extract numeric value from class name.
-        P1 -> 1, P2 -> 2 ... fallback to large number if not found
-        """
-        match = re.search(r'\d+', class_name)
-        return int(match.group()) if match else 999
-
-    organized_assignments = []
-
-    for class_name in sorted(grouped_assignments.keys(), key=class_sort_key):
-        streams_sorted = sorted(
-            grouped_assignments[class_name],
-            key=lambda x: x['stream_name']
-        )
-        organized_assignments.extend(streams_sorted)
+    # Class level then natural name order, then stream, using the precomputed keys
+    class_keys = ReferenceData.class_sort_keys()
+    stream_keys = ReferenceData.stream_sort_keys()
+    organized_assignments = sorted(formatted_assignments, key=lambda a: (
+        class_keys.get(a['class_id'], ()), stream_keys.get(a['stream_id'], ())
+    ))
 
     return render_template(
         'headteacher/view_assignments.html',
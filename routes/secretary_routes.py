@@ -1,10 +1,15 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, get_flashed_messages
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, get_flashed_messages, make_response
 from datetime import timedelta
 import json
 from datetime import datetime
 import uuid
+import base64
+import hashlib
 
 from models import db, Pupil, Stream, SchoolClass
+from utils.reference_data import ReferenceData
+from utils.pupil_search import search_condition, search_order
+from utils.http_cache import cache_headers
 
 secretary_bp = Blueprint('secretary', __name__)
 
@@ -177,6 +182,7 @@ def register_submit():
 
 
 @secretary_bp.route('/api/streams', methods=['GET'])
+@cache_headers()
 def api_streams():
     # Ensure some default streams exist
     streams = Stream.query.order_by(Stream.name).all()
@@ -192,6 +198,7 @@ def api_streams():
 
 
 @secretary_bp.route('/api/classes', methods=['GET'])
+@cache_headers()
 def api_classes():
     classes = SchoolClass.query.order_by(SchoolClass.level).all()
     if not classes:
@@ -208,133 +215,289 @@ def api_classes():
 
 @secretary_bp.route('/secretary/manage', methods=['GET'])
 def manage_pupils():
-    pupils = Pupil.query.order_by(Pupil.admission_number.asc()).all()
-
     # Build lookup maps to avoid N+1 queries
-    class_objs = {c.id: c.name for c in SchoolClass.query.all()}
-    stream_objs = {s.id: s.name for s in Stream.query.all()}
+    class_objs = ReferenceData.class_names()
+    stream_objs = ReferenceData.stream_names()
 
     # Calculate totals per class and stream
     from sqlalchemy import func
 
-    # Total pupils per class
-    class_totals = db.session.query(
+    # One GROUP BY gives the class x stream matrix; class, stream and school
+    # totals are sums over it
+    matrix = db.session.query(
         Pupil.class_admitted,
-        func.count(Pupil.id).label('total_pupils')
-    ).filter(Pupil.enrollment_status == 'active').group_by(Pupil.class_admitted).all()
-
-    # Total pupils per stream
-    stream_totals = db.session.query(
         Pupil.stream,
         func.count(Pupil.id).label('total_pupils')
-    ).filter(Pupil.enrollment_status == 'active').group_by(Pupil.stream).all()
-
-    # Total pupils in the whole school
-    total_school_pupils = db.session.query(func.count(Pupil.id)).filter(Pupil.enrollment_status == 'active').scalar() or 0
+    ).filter(Pupil.enrollment_status == 'active').group_by(Pupil.class_admitted, Pupil.stream).all()
+
+    counts = {}
+    class_totals = {}
+    stream_totals = {}
+    total_school_pupils = 0
+    for class_id, stream_id, total in matrix:
+        counts[(class_id, stream_id)] = total
+        class_totals[class_id] = class_totals.get(class_id, 0) + total
+        stream_totals[stream_id] = stream_totals.get(stream_id, 0) + total
+        total_school_pupils += total
 
     # Group streams by class for better display - show all classes and all streams
     class_stream_totals = {}
     for class_id, class_name in class_objs.items():
-        streams_in_class = []
-        for stream_id, stream_name in stream_objs.items():
-            # Count pupils in this specific class and stream combination
-            count = db.session.query(func.count(Pupil.id)).filter(
-                Pupil.class_admitted == class_id,
-                Pupil.stream == stream_id,
-                Pupil.enrollment_status == 'active'
-            ).scalar() or 0
-
-            # Include all streams, even with 0 pupils
-            streams_in_class.append({
-                'stream': stream_name,
-                'total': count
-            })
-
-        # Include all classes, even if all streams have 0 pupils
-        class_stream_totals[class_name] = streams_in_class
+        # Include all streams and classes, even with 0 pupils
+        class_stream_totals[class_name] = [
+            {'stream': stream_name, 'total': counts.get((class_id, stream_id), 0)}
+            for stream_id, stream_name in stream_objs.items()
+        ]
 
     # Convert to dictionaries for template
-    class_totals_dict = {}
-    for class_id, total in class_totals:
-        if class_id and class_id in class_objs:
-            class_totals_dict[class_objs[class_id]] = total
-
-    stream_totals_dict = {}
-    for stream_id, total in stream_totals:
-        if stream_id and stream_id in stream_objs:
-            stream_totals_dict[stream_objs[stream_id]] = total
-
-    pupils_data = []
-    for p in pupils:
-        # Resolve class/stream names from stored ids (if present)
-        class_name = class_objs.get(p.class_admitted) if p.class_admitted else p.class_admitted
-        stream_name = stream_objs.get(p.stream) if p.stream else p.stream
-
-        # Format timestamps to East Africa Time (UTC+3) with am/pm
-        created_local = None
-        if p.created_at:
-            try:
-                created_local = (p.created_at + timedelta(hours=3)).strftime('%Y-%m-%d %I:%M %p')
-            except Exception:
-                created_local = p.created_at.isoformat()
-
-        pupils_data.append({
-            'id': p.id,
-            'admission_number': p.admission_number,
-            'roll_number': p.roll_number,
-            'first_name': p.first_name,
-            'last_name': p.last_name,
-            'gender': p.gender,
-            'dob': p.dob.strftime('%Y-%m-%d') if getattr(p, 'dob', None) else None,
-            'nationality': p.nationality,
-            'religion': p.religion,
-            'previous_school': p.previous_school,
-            'class_admitted': class_name,
-            'stream': stream_name,
-            'guardian_first': p.guardian_first,
-            'guardian_last': p.guardian_last,
-            'guardian_phone': p.guardian_phone,
-            'village': p.village,
-            'subcounty': p.subcounty,
-            'district': p.district,
-            'enrollment_status': p.enrollment_status,
-            'created_at': created_local,
-        })
-
-    # Render server-side table
+    class_totals_dict = {class_objs[class_id]: total for class_id, total in class_totals.items()
+                         if class_id and class_id in class_objs}
+    stream_totals_dict = {stream_objs[stream_id]: total for stream_id, total in stream_totals.items()
+                          if stream_id and stream_id in stream_objs}
+
+    # The pupil table itself is loaded page by page from manage_pupils_data
     return render_template('secretary/manage_pupils.html',
-                         pupils=pupils_data,
                          class_totals=class_totals_dict,
                          stream_totals=stream_totals_dict,
                          total_school_pupils=total_school_pupils,
                          class_stream_totals=class_stream_totals)
 
 
+def _manage_pupil_row(p, class_objs, stream_objs):
+    """Flatten a pupil for the manage table, resolving class/stream names"""
+    # Resolve class/stream names from stored ids (if present)
+    class_name = class_objs.get(p.class_admitted) if p.class_admitted else p.class_admitted
+    stream_name = stream_objs.get(p.stream) if p.stream else p.stream
+
+    # Format timestamps to East Africa Time (UTC+3) with am/pm
+    created_local = None
+    if p.created_at:
+        try:
+            created_local = (p.created_at + timedelta(hours=3)).strftime('%Y-%m-%d %I:%M %p')
+        except Exception:
+            created_local = p.created_at.isoformat()
+
+    return {
+        'id': p.id,
+        'admission_number': p.admission_number,
+        'roll_number': p.roll_number,
+        'first_name': p.first_name,
+        'last_name': p.last_name,
+        'gender': p.gender,
+        'dob': p.dob.strftime('%Y-%m-%d') if getattr(p, 'dob', None) else None,
+        'nationality': p.nationality,
+        'religion': p.religion,
+        'previous_school': p.previous_school,
+        'class_admitted': class_name,
+        'stream': stream_name,
+        'guardian_first': p.guardian_first,
+        'guardian_last': p.guardian_last,
+        'guardian_phone': p.guardian_phone,
+        'village': p.village,
+        'subcounty': p.subcounty,
+        'district': p.district,
+        'enrollment_status': p.enrollment_status,
+        'created_at': created_local,
+    }
+
+
+@secretary_bp.route('/secretary/manage/pupils', methods=['GET'])
+def manage_pupils_data():
+    """One page of the manage table as JSON, searched on the server
+
+    Query params: q (search text), page (1-based), per_page (max 200).
+    """
+    from sqlalchemy import or_
+
+    q = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int) or 1, 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int) or 50, 1), 200)
+
+    class_objs = ReferenceData.class_names()
+    stream_objs = ReferenceData.stream_names()
+
+    query = Pupil.query
+    if q:
+        like = f'%{q}%'
+        conditions = [
+            search_condition(q),
+            Pupil.nationality.ilike(like),
+            Pupil.district.ilike(like),
+        ]
+        # Class and stream are stored as ids, so match their names here
+        class_ids = [cid for cid, name in class_objs.items() if q.lower() in name.lower()]
+        stream_ids = [sid for sid, name in stream_objs.items() if q.lower() in name.lower()]
+        if class_ids:
+            conditions.append(Pupil.class_admitted.in_(class_ids))
+        if stream_ids:
+            conditions.append(Pupil.stream.in_(stream_ids))
+        query = query.filter(or_(*conditions))
+
+    total = query.count()
+    pupils = query.order_by(*search_order(q))\
+        .offset((page - 1) * per_page).limit(per_page).all()
+
+    return jsonify({
+        'pupils': [_manage_pupil_row(p, class_objs, stream_objs) for p in pupils],
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': (total + per_page - 1) // per_page
+    })
+
+
+# Fields /api/pupils can return -> the columns needed to build them
+PUPIL_API_FIELDS = {
+    'id': [Pupil.id],
+    'first_name': [Pupil.first_name],
+    'last_name': [Pupil.last_name],
+    'gender': [Pupil.gender],
+    'dob': [Pupil.dob],
+    'nationality': [Pupil.nationality],
+    'village': [Pupil.village],
+    'subcounty': [Pupil.subcounty],
+    'district': [Pupil.district],
+    'religion': [Pupil.religion],
+    'guardian_first': [Pupil.guardian_first],
+    'guardian_last': [Pupil.guardian_last],
+    'guardian_phone': [Pupil.guardian_phone],
+    'guardian_relationship': [Pupil.guardian_relationship],
+    'guardian_occupation': [Pupil.guardian_occupation],
+    'class_admitted': [Pupil.class_admitted],
+    'academic_year': [Pupil.academic_year_id],
+    'stream': [Pupil.stream],
+    'previous_school': [Pupil.previous_school],
+    'admission_date': [Pupil.admission_date],
+    'roll_number': [Pupil.roll_number],
+    'admission_number': [Pupil.admission_number],
+    'enrollment_status': [Pupil.enrollment_status],
+    'created_at': [Pupil.created_at],
+    'created_at_local': [Pupil.created_at],
+}
+
+PUPIL_API_DEFAULT_LIMIT = 100
+PUPIL_API_MAX_LIMIT = 500
+
+# Sort key for cursor pagination; old rows without created_at sort last
+_CREATED_AT_FLOOR = datetime(1970, 1, 1)
+
+
+def _pupils_version():
+    """Change marker for the pupils table plus the names it is rendered with
+
+    Inserts and updates move max(updated_at); deletes change the count.
+    """
+    from sqlalchemy import func
+
+    count, last_update = db.session.query(func.count(Pupil.id), func.max(Pupil.updated_at)).one()
+    names = (sorted(ReferenceData.class_names().items()),
+             sorted(ReferenceData.stream_names().items()),
+             sorted(ReferenceData.academic_year_names().items()))
+    return f"{count}|{last_update.isoformat() if last_update else ''}|{names}"
+
+
+def _encode_cursor(created_at, pupil_id):
+    raw = f"{(created_at or _CREATED_AT_FLOOR).isoformat()}|{pupil_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    created_at, pupil_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|', 1)
+    return datetime.fromisoformat(created_at), pupil_id
+
+
+def _api_pupil_value(field, row, class_objs, stream_objs, year_names):
+    """Render one projected field the same way the full record did"""
+    if field == 'class_admitted':
+        return class_objs.get(row.class_admitted) if row.class_admitted else row.class_admitted
+    if field == 'stream':
+        return stream_objs.get(row.stream) if row.stream else row.stream
+    if field == 'academic_year':
+        return year_names.get(row.academic_year_id)
+    if field == 'created_at_local':
+        return (row.created_at + timedelta(hours=3)).strftime('%Y-%m-%d %I:%M %p') if row.created_at else None
+    value = getattr(row, field)
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
 @secretary_bp.route('/api/pupils', methods=['GET'])
 def api_pupils():
-    pupils = Pupil.query.order_by(Pupil.created_at.desc()).all()
+    """Pupils, newest first, one cursor page at a time
+
+    Query params:
+      fields     comma-separated subset of PUPIL_API_FIELDS (default: all)
+      class_id, stream_id, status, academic_year_id   optional filters
+      limit      page size (default 100, max 500)
+      cursor     `next_cursor` from the previous page
+
+    Responses carry a strong ETag; a matching If-None-Match gets a 304
+    before any pupil rows are read.
+    """
+    from sqlalchemy import and_, or_, func
+
+    requested = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    fields = requested or list(PUPIL_API_FIELDS)
+    unknown = [f for f in fields if f not in PUPIL_API_FIELDS]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    try:
+        limit = min(max(int(request.args.get('limit', PUPIL_API_DEFAULT_LIMIT)), 1), PUPIL_API_MAX_LIMIT)
+        cursor = request.args.get('cursor')
+        after = _decode_cursor(cursor) if cursor else None
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    # Cheap conditional check first: unchanged table + same params -> 304
+    etag = hashlib.sha256(f"{_pupils_version()}|{sorted(request.args.items(multi=True))}".encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+
+    # Only select what the requested fields need, plus the cursor columns
+    columns = [Pupil.id, Pupil.created_at]
+    for field in fields:
+        for column in PUPIL_API_FIELDS[field]:
+            if column not in columns:
+                columns.append(column)
+
+    sort_key = func.coalesce(Pupil.created_at, _CREATED_AT_FLOOR)
+    query = db.session.query(*columns)
+    filters = {
+        'class_id': Pupil.class_admitted,
+        'stream_id': Pupil.stream,
+        'status': Pupil.enrollment_status,
+        'academic_year_id': Pupil.academic_year_id,
+    }
+    for param, column in filters.items():
+        value = request.args.get(param)
+        if value:
+            query = query.filter(column == value)
+    if after:
+        after_created, after_id = after
+        query = query.filter(or_(sort_key < after_created,
+                                 and_(sort_key == after_created, Pupil.id < after_id)))
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(sort_key.desc(), Pupil.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
 
     # Provide human-friendly class/stream names and localized created_at
-    class_objs = {c.id: c.name for c in SchoolClass.query.all()}
-    stream_objs = {s.id: s.name for s in Stream.query.all()}
-    out = []
-    for p in pupils:
-        class_name = class_objs.get(p.class_admitted) if p.class_admitted else p.class_admitted
-        stream_name = stream_objs.get(p.stream) if p.stream else p.stream
-        created_local = None
-        if p.created_at:
-            try:
-                created_local = (p.created_at + timedelta(hours=3)).strftime('%Y-%m-%d %I:%M %p')
-            except Exception:
-                created_local = p.created_at.isoformat()
-
-        obj = p.to_dict()
-        obj['class_admitted'] = class_name
-        obj['stream'] = stream_name
-        obj['created_at_local'] = created_local
-        out.append(obj)
-
-    return jsonify(out)
+    class_objs = ReferenceData.class_names()
+    stream_objs = ReferenceData.stream_names()
+    year_names = ReferenceData.academic_year_names()
+    out = [{field: _api_pupil_value(field, row, class_objs, stream_objs, year_names) for field in fields}
+           for row in rows]
+
+    response = jsonify({
+        'pupils': out,
+        'count': len(out),
+        'next_cursor': _encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+    })
+    response.set_etag(etag)
+    return response
 
 
 @secretary_bp.route('/secretary/delete/<uuid:id>', methods=['POST'])
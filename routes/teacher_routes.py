@@ -1,14 +1,20 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app
 from models.user import User
 from models.school_class import SchoolClass
 from models.stream import Stream
 from models.teacher_assignment import TeacherAssignment
 from models.register_pupil import Pupil, AcademicYear, PupilMarks
-from models.attendance import Attendance
+from models.attendance import Attendance, AttendanceSubmission
 from models import db
 from datetime import datetime, date, timedelta
 import pytz
 from sqlalchemy import text
+from utils.report_cards import parse_report_type, build_marks_data, build_stream_reports, GENERATED_AT_FORMAT
+from utils.reference_data import ReferenceData
+from utils.pupil_reports import report_facets
+from utils.pupil_snapshot import note_pupil_changes
+from utils.assignments import active_assignments
+from utils.sort_keys import natural_key
 
 teacher_bp = Blueprint('teacher', __name__, url_prefix='/teacher')
 
@@ -32,10 +38,7 @@ def view_pupils():
     print(f"DEBUG view_pupils: teacher_id from session: {teacher_id}, type: {type(teacher_id)}")
 
     # Get all classes and streams assigned to this teacher
-    teacher_assignments = TeacherAssignment.query.filter_by(
-        teacher_id=teacher_id,
-        is_active=True
-    ).all()
+    teacher_assignments = active_assignments(teacher_id)
 
     print(f"DEBUG view_pupils: Found {len(teacher_assignments)} assignments for teacher {teacher_id}")
     for assignment in teacher_assignments:
@@ -86,8 +89,8 @@ def view_pupils():
             seen_ids.add(pupil.id)
             unique_pupils.append(pupil)
 
-    # Sort pupils by admission number in ascending order
-    sorted_pupils = sorted(unique_pupils, key=lambda p: p.admission_number)
+    # Sort pupils by admission number in ascending natural order (AD/2025/9 before AD/2025/10)
+    sorted_pupils = sorted(unique_pupils, key=lambda p: natural_key(p.admission_number))
 
     # Create pupil records with class and stream names
     pupil_records = []
@@ -116,7 +119,7 @@ def view_pupils():
         })
 
     # Get all academic years for display
-    all_academic_years = AcademicYear.query.order_by(AcademicYear.name.desc()).all()
+    all_academic_years = ReferenceData.academic_years()
     academic_year_names = [ay.name for ay in all_academic_years]
     current_year = academic_year_names[0] if academic_year_names else None
 
@@ -136,10 +139,7 @@ def manage_marks():
     teacher_id = session.get('user_id')
 
     # Get all classes and streams assigned to this teacher
-    teacher_assignments = TeacherAssignment.query.filter_by(
-        teacher_id=teacher_id,
-        is_active=True
-    ).all()
+    teacher_assignments = active_assignments(teacher_id)
 
     # If teacher has no assignments, show no assignment page
     if not teacher_assignments:
@@ -186,8 +186,8 @@ def manage_marks():
             seen_ids.add(pupil.id)
             unique_pupils.append(pupil)
 
-    # Sort pupils by admission number in ascending order
-    sorted_pupils = sorted(unique_pupils, key=lambda p: p.admission_number)
+    # Sort pupils by admission number in ascending natural order (AD/2025/9 before AD/2025/10)
+    sorted_pupils = sorted(unique_pupils, key=lambda p: natural_key(p.admission_number))
 
     # Create pupil records with class and stream names
     pupil_records = []
@@ -211,7 +211,7 @@ def manage_marks():
         })
 
     # Get academic years for dropdown
-    academic_years = AcademicYear.query.order_by(AcademicYear.name.desc()).all()
+    academic_years = ReferenceData.academic_years()
 
     # Default selections
     current_academic_year = academic_years[0] if academic_years else None
@@ -558,11 +558,16 @@ def pupil_reports():
         return render_template('teacher/no_assignment.html', teacher=teacher)
 
     # Get academic years for filter dropdown
-    academic_years = AcademicYear.query.order_by(AcademicYear.start_year.desc()).all()
+    academic_years = ReferenceData.academic_years()
+
+    # Mark counts per year and term for the assigned streams (one grouped query)
+    facets = report_facets(class_streams=[(a.class_id, a.stream_id) for a in teacher_assignments])
 
     return render_template('teacher/pupil_reports.html',
                          teacher_assignments=teacher_assignments,
-                         academic_years=academic_years)
+                         academic_years=academic_years,
+                         year_counts={year['id']: year['count'] for year in facets['academic_years']},
+                         term_counts={term['value']: term['count'] for term in facets['terms']})
 
 
 @teacher_bp.route('/get_pupils_for_reports', methods=['GET'])
@@ -580,10 +585,7 @@ def get_pupils_for_reports():
 
     try:
         # Get all classes and streams assigned to this teacher
-        teacher_assignments = TeacherAssignment.query.filter_by(
-            teacher_id=teacher_id,
-            is_active=True
-        ).all()
+        teacher_assignments = active_assignments(teacher_id)
 
         if not teacher_assignments:
             return jsonify({'success': False, 'message': 'No class assignments found'})
@@ -652,188 +654,18 @@ def generate_pupil_report(pupil_id, report_type):
         if stream_obj:
             stream_name = stream_obj.name
 
-    # Get pupil's marks based on report type
+    # Parse report type to determine term and exam types, then fetch all needed marks in one query
+    term, exams = parse_report_type(report_type)
     marks_data = []
 
-    # Parse report type to determine term and exam type
-    if report_type.startswith('term1_'):
-        term = 1
-        if 'beginning' in report_type:
-            exam_type = 'Beginning of term'
-        elif 'mid' in report_type:
-            exam_type = 'Mid_term'
-        elif 'end' in report_type:
-            exam_type = 'End of term'
-        elif 'both' in report_type:
-            # For "both" option, we'll show all three exams: beginning, mid, and end of term
-            exam_type = 'Beginning of term'  # We'll handle this specially
-    elif report_type.startswith('term2_'):
-        term = 2
-        if 'beginning' in report_type:
-            exam_type = 'Beginning of term'
-        elif 'mid' in report_type:
-            exam_type = 'Mid_term'
-        elif 'end' in report_type:
-            exam_type = 'End of term'
-        elif 'both' in report_type:
-            exam_type = 'Beginning of term'
-    elif report_type.startswith('term3_'):
-        term = 3
-        if 'beginning' in report_type:
-            exam_type = 'Beginning of term'
-        elif 'mid' in report_type:
-            exam_type = 'Mid_term'
-        elif 'end' in report_type:
-            exam_type = 'End of term'
-        elif 'both' in report_type:
-            exam_type = 'Beginning of term'
-
-    # Fetch marks data
-    if 'term' in locals():
-        if 'both' in report_type:
-            # For "both" option, get all three exam types: beginning, mid, and end of term
-            beginning_marks = PupilMarks.query.filter_by(
-                pupil_id=pupil_id,
-                academic_year_id=pupil.academic_year_id,
-                term=term,
-                exam_type='Beginning of term'
-            ).first()
-
-            mid_marks = PupilMarks.query.filter_by(
-                pupil_id=pupil_id,
-                academic_year_id=pupil.academic_year_id,
-                term=term,
-                exam_type='Mid_term'
-            ).first()
-
-            end_marks = PupilMarks.query.filter_by(
-                pupil_id=pupil_id,
-                academic_year_id=pupil.academic_year_id,
-                term=term,
-                exam_type='End of term'
-            ).first()
-
-            print(f"DEBUG: 'Both' option - Looking for pupil_id={pupil_id}, academic_year_id={pupil.academic_year_id}, term={term}")
-            print(f"DEBUG: Beginning marks found: {beginning_marks is not None}")
-            print(f"DEBUG: Mid marks found: {mid_marks is not None}")
-            print(f"DEBUG: End marks found: {end_marks is not None}")
-
-            if beginning_marks:
-                print(f"DEBUG: Beginning marks remarks - english: '{beginning_marks.english_remark}', general: '{beginning_marks.general_comment}'")
-
-            if beginning_marks:
-                marks_data.append({
-                    'exam_type': 'Beginning of Term',
-                    'english': beginning_marks.english,
-                    'mathematics': beginning_marks.mathematics,
-                    'science': beginning_marks.science,
-                    'social_studies': beginning_marks.social_studies,
-                    'english_grade': beginning_marks.english_grade,
-                    'mathematics_grade': beginning_marks.mathematics_grade,
-                    'science_grade': beginning_marks.science_grade,
-                    'social_studies_grade': beginning_marks.social_studies_grade,
-                    'total': beginning_marks.total_marks or 0,
-                    'average': beginning_marks.average or 0,
-                    'overall_grade': beginning_marks.overall_grade,
-                    'position': beginning_marks.position_in_stream or 0,
-                    'class_position': beginning_marks.position_in_class or 0,
-                    'stream_student_count': beginning_marks.stream_student_count or 0,
-                    'class_student_count': beginning_marks.class_student_count or 0,
-                    'english_remark': beginning_marks.english_remark or '',
-                    'mathematics_remark': beginning_marks.mathematics_remark or '',
-                    'science_remark': beginning_marks.science_remark or '',
-                    'social_studies_remark': beginning_marks.social_studies_remark or '',
-                    'remarks': beginning_marks.general_comment or ''
-                })
-
-            if mid_marks:
-                marks_data.append({
-                    'exam_type': 'Mid Term',
-                    'english': mid_marks.english,
-                    'mathematics': mid_marks.mathematics,
-                    'science': mid_marks.science,
-                    'social_studies': mid_marks.social_studies,
-                    'english_grade': mid_marks.english_grade,
-                    'mathematics_grade': mid_marks.mathematics_grade,
-                    'science_grade': mid_marks.science_grade,
-                    'social_studies_grade': mid_marks.social_studies_grade,
-                    'total': mid_marks.total_marks or 0,
-                    'average': mid_marks.average or 0,
-                    'overall_grade': mid_marks.overall_grade,
-                    'position': mid_marks.position_in_stream or 0,
-                    'class_position': mid_marks.position_in_class or 0,
-                    'stream_student_count': mid_marks.stream_student_count or 0,
-                    'class_student_count': mid_marks.class_student_count or 0,
-                    'english_remark': mid_marks.english_remark or '',
-                    'mathematics_remark': mid_marks.mathematics_remark or '',
-                    'science_remark': mid_marks.science_remark or '',
-                    'social_studies_remark': mid_marks.social_studies_remark or '',
-                    'remarks': mid_marks.general_comment or ''
-                })
-
-            if end_marks:
-                marks_data.append({
-                    'exam_type': 'End of Term',
-                    'english': end_marks.english,
-                    'mathematics': end_marks.mathematics,
-                    'science': end_marks.science,
-                    'social_studies': end_marks.social_studies,
-                    'english_grade': end_marks.english_grade,
-                    'mathematics_grade': end_marks.mathematics_grade,
-                    'science_grade': end_marks.science_grade,
-                    'social_studies_grade': end_marks.social_studies_grade,
-                    'total': end_marks.total_marks or 0,
-                    'average': end_marks.average or 0,
-                    'overall_grade': end_marks.overall_grade,
-                    'position': end_marks.position_in_stream or 0,
-                    'class_position': end_marks.position_in_class or 0,
-                    'stream_student_count': end_marks.stream_student_count or 0,
-                    'class_student_count': end_marks.class_student_count or 0,
-                    'english_remark': end_marks.english_remark or '',
-                    'mathematics_remark': end_marks.science_remark or '',
-                    'science_remark': end_marks.science_remark or '',
-                    'social_studies_remark': end_marks.social_studies_remark or '',
-                    'remarks': end_marks.general_comment or ''
-                })
-        else:
-            # Single exam type
-            marks = PupilMarks.query.filter_by(
-                pupil_id=pupil_id,
-                academic_year_id=pupil.academic_year_id,
-                term=term,
-                exam_type=exam_type
-            ).first()
-
-            print(f"DEBUG: Single exam - Looking for pupil_id={pupil_id}, academic_year_id={pupil.academic_year_id}, term={term}, exam_type='{exam_type}'")
-            print(f"DEBUG: Marks found: {marks is not None}")
-
-            if marks:
-                print(f"DEBUG: Single marks remarks - english: '{marks.english_remark}', math: '{marks.mathematics_remark}', science: '{marks.science_remark}', social: '{marks.social_studies_remark}', general: '{marks.general_comment}'")
-
-            if marks:
-                marks_data.append({
-                    'exam_type': exam_type,
-                    'english': marks.english,
-                    'mathematics': marks.mathematics,
-                    'science': marks.science,
-                    'social_studies': marks.social_studies,
-                    'english_grade': marks.english_grade,
-                    'mathematics_grade': marks.mathematics_grade,
-                    'science_grade': marks.science_grade,
-                    'social_studies_grade': marks.social_studies_grade,
-                    'total': marks.total_marks or 0,
-                    'average': marks.average or 0,
-                    'overall_grade': marks.overall_grade,
-                    'position': marks.position_in_stream or 0,
-                    'class_position': marks.position_in_class or 0,
-                    'stream_student_count': marks.stream_student_count or 0,
-                    'class_student_count': marks.class_student_count or 0,
-                    'english_remark': marks.english_remark or '',
-                    'mathematics_remark': marks.mathematics_remark or '',
-                    'science_remark': marks.science_remark or '',
-                    'social_studies_remark': marks.social_studies_remark or '',
-                    'remarks': marks.general_comment or ''
-                })
+    if term is not None and exams:
+        marks_records = PupilMarks.query.filter(
+            PupilMarks.pupil_id == pupil_id,
+            PupilMarks.academic_year_id == pupil.academic_year_id,
+            PupilMarks.term == term,
+            PupilMarks.exam_type.in_([exam_type for exam_type, _ in exams])
+        ).all()
+        marks_data = build_marks_data(marks_records, exams)
 
     # For now, just return a simple HTML report
     return render_template('teacher/pupil_report_template.html',
@@ -841,10 +673,58 @@ def generate_pupil_report(pupil_id, report_type):
                          report_type=report_type,
                          marks_data=marks_data,
                          datetime=datetime,
+                         generated_at=datetime.now().strftime(GENERATED_AT_FORMAT),
                          class_name=class_name,
                          stream_name=stream_name)
 
 
+@teacher_bp.route('/generate_stream_reports/<class_id>/<stream_id>/<report_type>')
+def generate_stream_reports(class_id, stream_id, report_type):
+    """Generate report cards for every pupil in an assigned stream as one document"""
+    if 'user_id' not in session or session.get('user_role', '').lower() != 'teacher':
+        flash('Access denied')
+        return redirect(url_for('index'))
+
+    teacher_id = session.get('user_id')
+
+    # Teachers may only print streams they are assigned to
+    assignment = TeacherAssignment.query.filter_by(
+        teacher_id=teacher_id,
+        class_id=class_id,
+        stream_id=stream_id,
+        is_active=True
+    ).first()
+    if not assignment:
+        flash('Access denied - not assigned to this class and stream')
+        return redirect(url_for('teacher.pupil_reports'))
+
+    term, exams = parse_report_type(report_type)
+    if term is None or not exams:
+        flash('Invalid report type')
+        return redirect(url_for('teacher.pupil_reports'))
+
+    academic_year_id = request.args.get('year', type=int)
+    class_name = assignment.school_class.name if assignment.school_class else 'N/A'
+    stream_name = assignment.stream.name if assignment.stream else 'N/A'
+
+    try:
+        body, mimetype, page_count = build_stream_reports(
+            class_id, stream_id, class_name, stream_name, report_type,
+            academic_year_id=academic_year_id, base_url=request.url_root
+        )
+    except Exception as e:
+        print(f"Error generating stream reports: {e}")
+        flash(f'Error generating reports: {str(e)}')
+        return redirect(url_for('teacher.pupil_reports'))
+
+    response = current_app.response_class(body, mimetype=mimetype)
+    if mimetype == 'application/pdf':
+        filename = f"reports_{class_name}_{stream_name}_{report_type}.pdf".replace(' ', '_')
+        response.headers['Content-Disposition'] = f'inline; filename="{filename}"'
+    response.headers['X-Report-Pages'] = str(page_count)
+    return response
+
+
 @teacher_bp.route('/attendance')
 def attendance_view():
     """View and manage attendance for assigned classes"""
@@ -856,10 +736,7 @@ def attendance_view():
     print(f"DEBUG attendance_view: teacher_id from session: {teacher_id}, type: {type(teacher_id)}")
 
     # Get all classes and streams assigned to this teacher
-    teacher_assignments = TeacherAssignment.query.filter_by(
-        teacher_id=teacher_id,
-        is_active=True
-    ).all()
+    teacher_assignments = active_assignments(teacher_id)
 
     print(f"DEBUG attendance_view: Found {len(teacher_assignments)} assignments for teacher {teacher_id}")
     for assignment in teacher_assignments:
@@ -885,7 +762,7 @@ def attendance_view():
             })
 
     # Get current academic year
-    current_academic_year = AcademicYear.query.filter_by(is_active=True).first()
+    current_academic_year = ReferenceData.current_academic_year()
     if not current_academic_year:
         flash('No active academic year found')
         return redirect(url_for('teacher.dashboard'))
@@ -914,8 +791,8 @@ def attendance_view():
             seen_ids.add(pupil.id)
             unique_pupils.append(pupil)
 
-    # Sort pupils by admission number
-    sorted_pupils = sorted(unique_pupils, key=lambda p: p.admission_number)
+    # Sort pupils by admission number in natural order
+    sorted_pupils = sorted(unique_pupils, key=lambda p: natural_key(p.admission_number))
 
     # Create pupil records with class and stream names
     pupil_records = []
@@ -961,16 +838,8 @@ def attendance_view():
     attendance_map = {}
     if selected_date:
         try:
-            attendance_date = date.fromisoformat(selected_date)
-            existing_attendance = Attendance.query.filter_by(
-                attendance_date=attendance_date,
-                academic_year_id=current_academic_year.id
-            ).filter(
-                Attendance.pupil_id.in_([p['id'] for p in pupil_records])
-            ).all()
-
-            for attendance in existing_attendance:
-                attendance_map[str(attendance.pupil_id)] = str(attendance.status)
+            attendance_map = _marked_attendance(date.fromisoformat(selected_date), current_academic_year.id,
+                                                [p['id'] for p in pupil_records])
         except ValueError:
             pass  # Invalid date format, use empty map
 
@@ -985,6 +854,49 @@ def attendance_view():
                          stream_name=teacher_classes_streams[0]['stream_name'] if teacher_classes_streams else None)
 
 
+def _marked_attendance(attendance_date, academic_year_id, pupil_ids):
+    """{pupil_id: status} for the pupils already marked on `attendance_date`"""
+    rows = db.session.query(Attendance.pupil_id, Attendance.status).filter(
+        Attendance.attendance_date == attendance_date,
+        Attendance.academic_year_id == academic_year_id,
+        Attendance.pupil_id.in_(pupil_ids)
+    ).all()
+    return {str(pupil_id): str(status) for pupil_id, status in rows}
+
+
+@teacher_bp.route('/attendance/marked')
+def attendance_marked():
+    """Attendance already marked for the teacher's pupils on ?date=YYYY-MM-DD
+
+    The attendance page is kept for offline use, so a copy loaded from the
+    cache fetches the marks for its date here instead of trusting the ones
+    it was rendered with.
+    """
+    if 'user_id' not in session or session.get('user_role', '').lower() != 'teacher':
+        return jsonify({'error': 'Access denied'}), 403
+
+    try:
+        attendance_date = date.fromisoformat(request.args.get('date', ''))
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+
+    current_academic_year = ReferenceData.current_academic_year()
+    assignments = active_assignments(session.get('user_id'))
+    if not current_academic_year or not assignments:
+        return jsonify({'date': attendance_date.isoformat(), 'attendance': {}})
+
+    pupil_ids = db.session.query(Pupil.id).filter(
+        db.or_(*[db.and_(Pupil.class_admitted == assignment.class_id, Pupil.stream == assignment.stream_id)
+                 for assignment in assignments]),
+        Pupil.enrollment_status == 'active',
+        db.or_(Pupil.academic_year_id == current_academic_year.id, Pupil.academic_year_id.is_(None))
+    )
+    return jsonify({
+        'date': attendance_date.isoformat(),
+        'attendance': _marked_attendance(attendance_date, current_academic_year.id, pupil_ids.scalar_subquery())
+    })
+
+
 @teacher_bp.route('/attendance', methods=['POST'])
 def save_attendance():
     """Save attendance records"""
@@ -1011,7 +923,7 @@ def save_attendance():
         return jsonify({'error': 'Invalid date format'}), 400
 
     # Get current academic year
-    current_academic_year = AcademicYear.query.filter_by(is_active=True).first()
+    current_academic_year = ReferenceData.current_academic_year()
     if not current_academic_year:
         return jsonify({'error': 'No active academic year found'}), 400
 
@@ -1061,6 +973,110 @@ def save_attendance():
         return jsonify({'error': f'Failed to save attendance: {str(e)}'}), 500
 
 
+# Registers accepted in one bulk attendance request
+MAX_BULK_REGISTERS = 50
+
+
+def _save_register(register, teacher_id, academic_year_id):
+    """Save one queued register; returns its result for the bulk response"""
+    request_id = register.get('request_id')
+    if not isinstance(request_id, str) or not 0 < len(request_id) <= 64:
+        return {'request_id': request_id, 'status': 'invalid', 'error': 'Missing request_id'}
+
+    class_id = register.get('class_id')
+    stream_id = register.get('stream_id')
+    if not register.get('date') or not class_id or not stream_id:
+        return {'request_id': request_id, 'status': 'invalid', 'error': 'Missing required fields'}
+    try:
+        attendance_date = datetime.strptime(register['date'], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return {'request_id': request_id, 'status': 'invalid', 'error': 'Invalid date format'}
+
+    entries = register.get('entries') or []
+    statuses = {}
+    for entry in entries:
+        if isinstance(entry, dict) and entry.get('pupil_id') and entry.get('status') in ('present', 'absent'):
+            statuses[str(entry['pupil_id'])] = entry['status']
+
+    if not AttendanceSubmission.claim(request_id, teacher_id=teacher_id, class_id=class_id, stream_id=stream_id,
+                                      attendance_date=attendance_date, saved_count=0):
+        return {'request_id': request_id, 'status': 'duplicate'}
+
+    inserted = Attendance.insert_many([{
+        'pupil_id': pupil_id,
+        'class_id': class_id,
+        'stream_id': stream_id,
+        'attendance_date': attendance_date,
+        'status': status,
+        'teacher_id': teacher_id,
+        'academic_year_id': academic_year_id,
+        'created_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow(),
+    } for pupil_id, status in statuses.items()])
+    note_pupil_changes(db.session, inserted)
+    saved_count = len(inserted)
+    if saved_count:
+        AttendanceSubmission.query.filter_by(request_id=request_id).update({'saved_count': saved_count})
+
+    return {'request_id': request_id, 'status': 'saved', 'saved_count': saved_count,
+            'skipped_count': len(statuses) - saved_count}
+
+
+@teacher_bp.route('/attendance/bulk', methods=['POST'])
+def save_attendance_bulk():
+    """Save registers queued offline on a teacher's device
+
+    Body: {"registers": [{"request_id", "class_id", "stream_id", "date", "entries"}, ...]}.
+    Each register carries an id generated on the device; a register whose id
+    was already saved is reported as "duplicate" and not written again, so
+    the queue can retry a batch safely. Pupils already marked for the date
+    are skipped. A register that cannot be saved is reported as "invalid";
+    the others are committed together.
+    """
+    if 'user_id' not in session or session.get('user_role', '').lower() != 'teacher':
+        return jsonify({'error': 'Access denied'}), 403
+
+    data = request.get_json(silent=True)
+    registers = data.get('registers') if isinstance(data, dict) else None
+    if not isinstance(registers, list) or not registers:
+        return jsonify({'error': 'No registers provided'}), 400
+    if len(registers) > MAX_BULK_REGISTERS:
+        return jsonify({'error': f'At most {MAX_BULK_REGISTERS} registers per request'}), 400
+
+    current_academic_year = ReferenceData.current_academic_year()
+    if not current_academic_year:
+        return jsonify({'error': 'No active academic year found'}), 400
+
+    teacher_id = session.get('user_id')
+    results = []
+    for register in registers:
+        register = register if isinstance(register, dict) else {}
+        # One savepoint per register: a register that fails (e.g. a pupil removed
+        # while the device was offline) is reported and dropped without taking
+        # the rest of the batch with it
+        try:
+            with db.session.begin_nested():
+                results.append(_save_register(register, teacher_id, current_academic_year.id))
+        except Exception as e:
+            print(f"⚠ Could not save attendance register {register.get('request_id')}: {e}")
+            results.append({'request_id': register.get('request_id'), 'status': 'invalid',
+                            'error': 'Could not save this register'})
+
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠ Bulk attendance save failed: {e}")
+        return jsonify({'error': 'Failed to save attendance'}), 500
+
+    saved = sum(result.get('saved_count', 0) for result in results)
+    return jsonify({
+        'success': True,
+        'message': f'Attendance saved for {saved} pupils',
+        'results': results
+    })
+
+
 @teacher_bp.route('/attendance/roster')
 def attendance_roster():
     """View attendance roster for a specific class and date range"""
@@ -1105,7 +1121,7 @@ def attendance_roster():
         return redirect(url_for('teacher.attendance_view'))
 
     # Get current academic year
-    current_academic_year = AcademicYear.query.filter_by(is_active=True).first()
+    current_academic_year = ReferenceData.current_academic_year()
     if not current_academic_year:
         flash('No active academic year found')
         return redirect(url_for('teacher.dashboard'))
@@ -1178,10 +1194,7 @@ def attendance_summary():
     end_date = request.args.get('end_date')
 
     # Get all classes and streams assigned to this teacher
-    teacher_assignments = TeacherAssignment.query.filter_by(
-        teacher_id=teacher_id,
-        is_active=True
-    ).all()
+    teacher_assignments = active_assignments(teacher_id)
 
     # If teacher has no assignments, show no assignment page
     if not teacher_assignments:
@@ -1203,7 +1216,7 @@ def attendance_summary():
             })
 
     # Get current academic year
-    current_academic_year = AcademicYear.query.filter_by(is_active=True).first()
+    current_academic_year = ReferenceData.current_academic_year()
     if not current_academic_year:
         flash('No active academic year found')
         return redirect(url_for('teacher.dashboard'))
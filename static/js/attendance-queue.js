@@ -0,0 +1,145 @@
+// Offline queue for attendance registers, shared by the attendance page and sw.js.
+//
+// Registers are written to IndexedDB first, so saving works without a
+// connection, then sent to /teacher/attendance/bulk in batches. Each register
+// carries a request id generated on the device; the server ignores ids it has
+// already saved, so a batch can be retried after any failure.
+//
+// The page also keeps, per date, which pupils are already marked (by this
+// device or, when it was online, by the server). An offline copy of the page
+// may have been rendered for another day, so it reads the marks for the day
+// it shows from here rather than from the copy.
+const AttendanceQueue = (() => {
+  const DB_NAME = 'school-manager-offline';
+  const DB_VERSION = 2;
+  const STORE = 'attendance-registers';
+  const MARKED_STORE = 'attendance-marked';
+  const MARKED_DAYS = 62;
+  const SYNC_TAG = 'attendance-sync';
+  const BULK_URL = '/teacher/attendance/bulk';
+  const MAX_BATCH = 50;
+
+  let dbPromise = null;
+
+  function open() {
+    if (!dbPromise) {
+      dbPromise = new Promise((resolve, reject) => {
+        const request = indexedDB.open(DB_NAME, DB_VERSION);
+        request.onupgradeneeded = () => {
+          const db = request.result;
+          if (!db.objectStoreNames.contains(STORE)) db.createObjectStore(STORE, { keyPath: 'request_id' });
+          if (!db.objectStoreNames.contains(MARKED_STORE)) db.createObjectStore(MARKED_STORE, { keyPath: 'date' });
+        };
+        request.onsuccess = () => {
+          const db = request.result;
+          // Let a newer page or service worker upgrade the database
+          db.onversionchange = () => { db.close(); dbPromise = null; };
+          resolve(db);
+        };
+        request.onerror = () => reject(request.error);
+      });
+      dbPromise.catch(() => { dbPromise = null; });
+    }
+    return dbPromise;
+  }
+
+  // Run `work(store)` in one transaction; resolves with its request's result once committed
+  async function withStore(mode, work, storeName = STORE) {
+    const db = await open();
+    return new Promise((resolve, reject) => {
+      const tx = db.transaction(storeName, mode);
+      const request = work(tx.objectStore(storeName));
+      tx.oncomplete = () => resolve(request ? request.result : undefined);
+      tx.onerror = () => reject(tx.error);
+      tx.onabort = () => reject(tx.error);
+    });
+  }
+
+  function newRequestId() {
+    if (self.crypto && self.crypto.randomUUID) return self.crypto.randomUUID();
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2, 12);
+  }
+
+  // Queue a register ({class_id, stream_id, date, entries}); resolves with the stored copy
+  async function add(register) {
+    const queued = Object.assign({ request_id: newRequestId() }, register, { queued_at: Date.now() });
+    await withStore('readwrite', store => store.put(queued));
+    return queued;
+  }
+
+  function all() {
+    return withStore('readonly', store => store.getAll());
+  }
+
+  function remove(requestIds) {
+    if (!requestIds.length) return Promise.resolve();
+    return withStore('readwrite', store => {
+      requestIds.forEach(id => store.delete(id));
+    });
+  }
+
+  // POST registers (at most MAX_BATCH) to the bulk endpoint; resolves with the per-register results
+  async function send(registers) {
+    const response = await fetch(BULK_URL, {
+      method: 'POST',
+      credentials: 'same-origin',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ registers: registers.map(({ queued_at, ...register }) => register) })
+    });
+    if (!response.ok) throw new Error(`Attendance sync failed with status ${response.status}`);
+    return (await response.json()).results;
+  }
+
+  // Send every queued register. Registers the server answered for are removed;
+  // on a network or server error the rest stay queued and the error is thrown.
+  async function flush() {
+    const registers = await all();
+    const results = [];
+    for (let i = 0; i < registers.length; i += MAX_BATCH) {
+      const batchResults = await send(registers.slice(i, i + MAX_BATCH));
+      await remove(batchResults.map(result => result.request_id).filter(Boolean));
+      results.push(...batchResults);
+    }
+    return results;
+  }
+
+  // 'YYYY-MM-DD' for the device's local date; toISOString() would give the UTC date
+  function localDate(date = new Date()) {
+    const pad = n => String(n).padStart(2, '0');
+    return `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())}`;
+  }
+
+  // {pupil_id: status} already marked on `date` ('YYYY-MM-DD')
+  async function marked(date) {
+    const record = await withStore('readonly', store => store.get(date), MARKED_STORE);
+    return record ? record.statuses : {};
+  }
+
+  // Record pupils as marked on `date`, and forget days older than MARKED_DAYS
+  function markSaved(date, statuses) {
+    const cutoff = new Date();
+    cutoff.setDate(cutoff.getDate() - MARKED_DAYS);
+    return withStore('readwrite', store => {
+      store.delete(IDBKeyRange.upperBound(localDate(cutoff), true));
+      const request = store.get(date);
+      request.onsuccess = () => {
+        const existing = request.result ? request.result.statuses : {};
+        store.put({ date, statuses: Object.assign({}, existing, statuses) });
+      };
+    }, MARKED_STORE);
+  }
+
+  // Ask the service worker to flush when the network is back; false if Background Sync is unsupported
+  async function requestSync() {
+    if (!self.navigator || !('serviceWorker' in navigator) || !self.SyncManager) return false;
+    try {
+      const registration = await navigator.serviceWorker.ready;
+      await registration.sync.register(SYNC_TAG);
+      return true;
+    } catch (error) {
+      return false;
+    }
+  }
+
+  return { SYNC_TAG, newRequestId, add, all, remove, send, flush, requestSync, localDate, marked, markSaved };
+})();
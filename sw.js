@@ -1,10 +1,156 @@
-const CACHE_NAME = 'school-manager-v5'; // Force cache refresh - fixed API caching
+// Hashed static URLs, precache list and version, prepended by the /sw.js route (utils/assets.py)
+const ASSETS = self.ASSETS || { version: 'dev', urls: {}, precache: [] };
+
+function assetUrl(path) {
+  return ASSETS.urls[path] || `/static/${path}`;
+}
+
+importScripts(assetUrl('js/attendance-queue.js'));
+
+// Changes whenever a static file does, so old copies are dropped on activate
+const CACHE_VERSION = ASSETS.version;
+const CACHE_NAME = `school-manager-${CACHE_VERSION}`;
+// JSON responses the server marked stale-while-revalidate (see utils/http_cache.py).
+// Not tied to the static assets: bump only when the shape of cached API
+// responses changes incompatibly, so old entries are dropped on activate.
+const API_CACHE_VERSION = 'v7';
+const API_CACHE_NAME = `school-manager-api-${API_CACHE_VERSION}`;
+const API_CACHE_MAX_ENTRIES = 60;
+const CACHED_AT_HEADER = 'X-SW-Cached-At';
+const DEBUG = false;
+// Fixed URLs the app links to directly, then every hashed asset small enough to precache.
+// '/' is not cached - navigation requests use network-first strategy
 const urlsToCache = [
   '/static/manifest.json',
-  '/static/images/school_192.png',
-  '/static/offline.html'
-  // Removed '/' from cache - navigation requests use network-first strategy
+  '/static/offline.html',
+  ...ASSETS.precache
 ];
+// Pages served from their last cached copy when offline, so registers can be taken without a connection
+const OFFLINE_PAGES = ['/teacher/attendance'];
+
+function log(...args) {
+  if (DEBUG) console.log(...args);
+}
+
+function isApiRequest(url) {
+  return url.includes('/api/') ||
+    url.includes('/db-test') ||
+    url.includes('/teacher/') ||
+    url.includes('/secretary/') ||
+    url.includes('/headteacher/') ||
+    url.includes('/admin/') ||
+    url.includes('/bursar/') ||
+    url.includes('/parent/');
+}
+
+function offlineResponse() {
+  return new Response(JSON.stringify({ error: 'Offline', message: 'This feature requires internet connection' }), {
+    status: 503,
+    statusText: 'Service Unavailable',
+    headers: { 'Content-Type': 'application/json' }
+  });
+}
+
+// [max-age, stale-while-revalidate] in seconds, or null if the response did not opt in
+function staleWhileRevalidateWindow(response) {
+  const cacheControl = response.headers.get('Cache-Control') || '';
+  if (!response.ok || cacheControl.includes('no-store')) return null;
+  const swr = /stale-while-revalidate=(\d+)/.exec(cacheControl);
+  if (!swr) return null;
+  const maxAge = /max-age=(\d+)/.exec(cacheControl);
+  return [maxAge ? Number(maxAge[1]) : 0, Number(swr[1])];
+}
+
+// Copy of a response stamped with the time it was cached
+async function stamped(response) {
+  const headers = new Headers(response.headers);
+  headers.set(CACHED_AT_HEADER, String(Date.now()));
+  return new Response(await response.blob(), { status: response.status, statusText: response.statusText, headers });
+}
+
+function usableFromCache(cached) {
+  const window = staleWhileRevalidateWindow(cached);
+  if (!window) return false;
+  const age = (Date.now() - Number(cached.headers.get(CACHED_AT_HEADER) || 0)) / 1000;
+  return age <= window[0] + window[1];
+}
+
+// Oldest entries go first once the cache is over its size limit
+async function trimApiCache(cache) {
+  const keys = await cache.keys();
+  for (let i = 0; i < keys.length - API_CACHE_MAX_ENTRIES; i++) {
+    await cache.delete(keys[i]);
+  }
+}
+
+async function notifyClients(url) {
+  await postToClients({ type: 'api-cache-updated', url });
+}
+
+async function postToClients(message) {
+  const clientList = await self.clients.matchAll({ type: 'window' });
+  clientList.forEach(client => client.postMessage(message));
+}
+
+// Background Sync: send the attendance registers queued while offline.
+// A rejected promise makes the browser retry the sync later.
+async function syncAttendance() {
+  const results = await AttendanceQueue.flush();
+  if (results.length) await postToClients({ type: 'attendance-synced', results });
+}
+
+async function offlineNavigation(request) {
+  if (OFFLINE_PAGES.includes(new URL(request.url).pathname)) {
+    const cachedPage = await caches.match(request, { ignoreSearch: true });
+    if (cachedPage) return cachedPage;
+  }
+  return caches.match('/static/offline.html');
+}
+
+// Fetch from the network, revalidating `cached` with its ETag, and update the cache.
+async function revalidate(request, cache, cached) {
+  const headers = new Headers(request.headers);
+  const etag = cached && cached.headers.get('ETag');
+  if (etag) headers.set('If-None-Match', etag);
+  const response = await fetch(request.url, { headers, credentials: 'same-origin', cache: 'no-store' });
+
+  if (response.status === 304 && cached) {
+    await cache.put(request, await stamped(cached.clone()));
+    return cached.clone();
+  }
+  if (staleWhileRevalidateWindow(response)) {
+    await cache.put(request, await stamped(response.clone()));
+    await trimApiCache(cache);
+    if (cached) await notifyClients(request.url);
+  } else if (cached) {
+    await cache.delete(request);
+  }
+  return response;
+}
+
+// Serve opted-in JSON from cache at once and refresh it in the background;
+// everything else goes to the network.
+async function handleApiRequest(event) {
+  const request = event.request;
+  if (request.method !== 'GET') {
+    return fetch(request).catch(offlineResponse);
+  }
+
+  const cache = await caches.open(API_CACHE_NAME);
+  const cached = await cache.match(request);
+  // revalidate() gets its own copy: `cached` itself may be handed to the page
+  const network = revalidate(request, cache, cached ? cached.clone() : undefined);
+
+  if (cached && usableFromCache(cached)) {
+    event.waitUntil(network.catch(error => log('Background revalidation failed:', request.url, error)));
+    return cached;
+  }
+  try {
+    return await network;
+  } catch (error) {
+    return cached || offlineResponse();
+  }
+}
 
 // Install Service Worker
 self.addEventListener('install', event => {
@@ -27,15 +173,17 @@ self.addEventListener('install', event => {
 
 // Fetch Event
 self.addEventListener('fetch', event => {
-  console.log('Fetch event for:', event.request.url, 'Mode:', event.request.mode, 'Destination:', event.request.destination);
+  log('Fetch event for:', event.request.url, 'Mode:', event.request.mode, 'Destination:', event.request.destination);
 
   // Handle navigation requests (page loads) - Network First Strategy
   if (event.request.mode === 'navigate') {
-    console.log('Handling navigation request with network-first strategy');
+    // Cached API data belongs to the user who is logging out
+    if (new URL(event.request.url).pathname === '/logout') {
+      event.waitUntil(caches.delete(API_CACHE_NAME));
+    }
     event.respondWith(
       fetch(event.request)
         .then(response => {
-          console.log('Navigation successful, caching response');
           // Only cache GET requests
           if (event.request.method === 'GET') {
             const responseClone = response.clone();
@@ -47,33 +195,16 @@ self.addEventListener('fetch', event => {
           return response;
         })
         .catch(() => {
-          console.log('Navigation failed, serving offline page');
-          return caches.match('/static/offline.html');
+          log('Navigation failed, serving offline page');
+          return offlineNavigation(event.request);
         })
     );
     return;
   }
 
-  // Handle API requests - Network First, no offline fallback
-  if (event.request.url.includes('/api/') ||
-      event.request.url.includes('/db-test') ||
-      event.request.url.includes('/teacher/') ||
-      event.request.url.includes('/secretary/') ||
-      event.request.url.includes('/headteacher/') ||
-      event.request.url.includes('/admin/') ||
-      event.request.url.includes('/bursar/') ||
-      event.request.url.includes('/parent/')) {
-    console.log('Handling API request:', event.request.url);
-    event.respondWith(
-      fetch(event.request)
-        .catch(() => {
-          return new Response(JSON.stringify({ error: 'Offline', message: 'This feature requires internet connection' }), {
-            status: 503,
-            statusText: 'Service Unavailable',
-            headers: { 'Content-Type': 'application/json' }
-          });
-        })
-    );
+  // Handle API requests - stale-while-revalidate when the server allows it, else network only
+  if (isApiRequest(event.request.url)) {
+    event.respondWith(handleApiRequest(event));
     return;
   }
 
@@ -82,7 +213,6 @@ self.addEventListener('fetch', event => {
     caches.match(event.request)
       .then(response => {
         if (response) {
-          console.log('Serving from cache:', event.request.url);
           return response;
         }
 
@@ -91,13 +221,7 @@ self.addEventListener('fetch', event => {
             // Cache successful GET responses for static assets only (not API calls)
             if (response.status === 200 &&
                 event.request.method === 'GET' &&
-                !event.request.url.includes('/teacher/') &&
-                !event.request.url.includes('/secretary/') &&
-                !event.request.url.includes('/headteacher/') &&
-                !event.request.url.includes('/parent/') &&
-                !event.request.url.includes('/admin/') &&
-                !event.request.url.includes('/bursar/') &&
-                !event.request.url.includes('/api/') &&
+                !isApiRequest(event.request.url) &&
                 (response.type === 'basic' || response.type === 'cors')) {
               const responseClone = response.clone();
               caches.open(CACHE_NAME)
@@ -108,7 +232,7 @@ self.addEventListener('fetch', event => {
             return response;
           })
           .catch(error => {
-            console.log('Fetch failed for:', event.request.url, error);
+            log('Fetch failed for:', event.request.url, error);
             // For failed static asset requests, return a basic response
             return new Response('', { status: 404, statusText: 'Not Found' });
           });
@@ -116,6 +240,12 @@ self.addEventListener('fetch', event => {
   );
 });
 
+self.addEventListener('sync', event => {
+  if (event.tag === AttendanceQueue.SYNC_TAG) {
+    event.waitUntil(syncAttendance());
+  }
+});
+
 // Activate Event
 self.addEventListener('activate', event => {
   console.log('Service Worker activating.');
@@ -123,7 +253,7 @@ self.addEventListener('activate', event => {
     caches.keys().then(cacheNames => {
       return Promise.all(
         cacheNames.map(cacheName => {
-          if (cacheName !== CACHE_NAME) {
+          if (cacheName !== CACHE_NAME && cacheName !== API_CACHE_NAME) {
             console.log('Deleting old cache:', cacheName);
             return caches.delete(cacheName);
           }
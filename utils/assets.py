@@ -0,0 +1,202 @@
+"""
+Fingerprinted static files.
+
+`url_for('static', filename='js/attendance-queue.js')` returns
+'/static/js/attendance-queue.<hash>.js', where <hash> comes from the file's
+contents. A hashed URL changes whenever its file does, so it is served with
+`Cache-Control: public, max-age=31536000, immutable` and repeat page loads
+never ask for it again. Plain /static/ paths keep Flask's default caching;
+the web app manifest and the offline page are linked by fixed URL.
+
+`python -m utils.assets` is the build step: it writes
+static/assets-manifest.json plus .gz (and, with the optional brotli package,
+.br) copies of text files, which are sent instead of the original to
+browsers that accept them. Without a build the manifest is computed at
+startup and files are sent as they are.
+
+The /sw.js route prepends the manifest to sw.js (`self.ASSETS`), so the
+service worker's precache list and cache version follow the files.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are built without it
+    brotli = None
+
+MANIFEST_NAME = 'assets-manifest.json'
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Text formats worth precompressing, and the size below which it is not
+COMPRESSIBLE = {'.js', '.css', '.json', '.html', '.svg', '.txt', '.map', '.webmanifest'}
+MIN_COMPRESS_BYTES = 512
+
+# Files the service worker downloads on install
+PRECACHE_MAX_BYTES = 256 * 1024
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+
+def hashed_name(path, digest):
+    """'js/app.js' -> 'js/app.<digest>.js'"""
+    base, ext = os.path.splitext(path)
+    return f'{base}.{digest}{ext}'
+
+
+def _asset_files(static_folder):
+    """Relative POSIX paths of the files under static/, without build output"""
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.startswith('.') or name == MANIFEST_NAME or name.endswith(('.gz', '.br')):
+                continue
+            yield os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+
+
+def build_manifest(static_folder):
+    """Hash every static file; returns the manifest dict
+
+    {"version": ..., "assets": {path: hashed path}, "precache": [path, ...],
+     "encodings": {path: ["br", "gzip"]}}
+    """
+    assets = {}
+    precache = []
+    encodings = {}
+    for path in _asset_files(static_folder):
+        full_path = os.path.join(static_folder, path)
+        with open(full_path, 'rb') as f:
+            data = f.read()
+        assets[path] = hashed_name(path, hashlib.sha256(data).hexdigest()[:12])
+        if len(data) <= PRECACHE_MAX_BYTES:
+            precache.append(path)
+        variants = [encoding for encoding, suffix in ENCODINGS.items() if _is_current(full_path + suffix, full_path)]
+        if variants:
+            encodings[path] = variants
+
+    version = hashlib.sha256('\n'.join(sorted(assets.values())).encode()).hexdigest()[:12]
+    return {'version': version, 'assets': assets, 'precache': precache, 'encodings': encodings}
+
+
+def _is_current(variant_path, source_path):
+    return os.path.exists(variant_path) and os.path.getmtime(variant_path) >= os.path.getmtime(source_path)
+
+
+def compress_assets(static_folder):
+    """Write .gz/.br copies of compressible files; returns how many were written"""
+    written = 0
+    for path in _asset_files(static_folder):
+        if os.path.splitext(path)[1].lower() not in COMPRESSIBLE:
+            continue
+        full_path = os.path.join(static_folder, path)
+        with open(full_path, 'rb') as f:
+            data = f.read()
+        if len(data) < MIN_COMPRESS_BYTES:
+            continue
+
+        variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(data, quality=11)
+        for suffix, compressed in variants.items():
+            if len(compressed) >= len(data):
+                continue
+            with open(full_path + suffix, 'wb') as f:
+                f.write(compressed)
+            written += 1
+    return written
+
+
+def load_manifest(static_folder):
+    """The built manifest, or None if there is none or a file changed since the build"""
+    manifest_path = os.path.join(static_folder, MANIFEST_NAME)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        built_at = os.path.getmtime(manifest_path)
+    except (OSError, ValueError):
+        return None
+    files = list(_asset_files(static_folder))
+    if set(manifest.get('assets', ())) != set(files):
+        return None
+    if any(os.path.getmtime(os.path.join(static_folder, path)) > built_at for path in files):
+        return None
+    return manifest
+
+
+def build(static_folder):
+    """Compress assets and write the manifest"""
+    written = compress_assets(static_folder)
+    manifest = build_manifest(static_folder)
+    with open(os.path.join(static_folder, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest, written
+
+
+def init_assets(app):
+    """Serve hashed static URLs with far-future caching and precompressed variants"""
+    static_folder = app.static_folder
+    manifest = load_manifest(static_folder)
+    if manifest is None:
+        manifest = build_manifest(static_folder)
+        print("⚠ No asset manifest, hashed static files at startup (run `python -m utils.assets` when deploying)")
+
+    assets = manifest['assets']
+    originals = {hashed: path for path, hashed in assets.items()}
+    encodings = manifest.get('encodings', {})
+    static_url = app.static_url_path.rstrip('/')
+    app.extensions['assets'] = manifest
+
+    @app.url_defaults
+    def _hashed_static_url(endpoint, values):
+        if endpoint == 'static':
+            hashed = assets.get(values.get('filename'))
+            if hashed:
+                values['filename'] = hashed
+
+    def static(filename):
+        path = originals.get(filename, filename)
+        mimetype = mimetypes.guess_type(path)[0]
+
+        accepted = request.accept_encodings
+        encoding = next((encoding for encoding in encodings.get(path, ()) if encoding in accepted), None)
+        if encoding:
+            response = send_from_directory(static_folder, path + ENCODINGS[encoding], mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = send_from_directory(static_folder, path, mimetype=mimetype)
+        if path in encodings:
+            response.vary.add('Accept-Encoding')
+
+        if filename in originals:
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    app.view_functions['static'] = static
+
+    # What sw.js needs: cache version, hashed URLs and the precache list
+    app.extensions['assets_script'] = 'self.ASSETS = ' + json.dumps({
+        'version': manifest['version'],
+        'urls': {path: f'{static_url}/{hashed}' for path, hashed in assets.items()},
+        'precache': [f'{static_url}/{assets[path]}' for path in manifest['precache']],
+    }, sort_keys=True) + ';\n'
+
+
+def service_worker_script(app, path):
+    """sw.js with the asset manifest prepended"""
+    with open(path, encoding='utf-8') as f:
+        script = f.read()
+    return app.extensions.get('assets_script', '') + script
+
+
+if __name__ == '__main__':
+    folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+    built, compressed = build(folder)
+    print(f"✅ Hashed {len(built['assets'])} static files (version {built['version']}), "
+          f"wrote {compressed} compressed copies{'' if brotli else ' (gzip only, brotli not installed)'}")
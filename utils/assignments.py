@@ -0,0 +1,96 @@
+"""
+Teacher assignment saves as a diff against the active assignments.
+
+The headteacher's assignment page submits the complete set of
+(teacher, class, stream) assignments. `apply_assignments` compares it with
+the active rows and, in one transaction, deactivates only the assignments
+that were dropped and inserts only the ones that are new; unchanged
+assignments keep their row and assigned date.
+
+After the commit `assignments_changed` is sent with the ids of the teachers
+whose assignments changed. The teacher pages' cached assignment lists
+subscribe to it and drop just those teachers' entries.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from blinker import Namespace
+
+from models import db
+from models.teacher_assignment import TeacherAssignment
+from utils.cache import ResultCache, TEACHER_ASSIGNMENTS
+
+_signals = Namespace()
+
+# Sent after a save commits: sender is the AssignmentDiff, `teacher_ids`
+# the teachers who gained or lost an assignment
+assignments_changed = _signals.signal('teacher-assignments-changed')
+
+AssignmentDiff = namedtuple('AssignmentDiff', ['added', 'removed', 'unchanged'])
+
+# What the teacher pages need from an assignment
+ActiveAssignment = namedtuple('ActiveAssignment', ['id', 'teacher_id', 'class_id', 'stream_id', 'is_active'])
+
+# Cached per teacher; the TTL bounds staleness after saves in other workers
+TEACHER_ASSIGNMENTS_TTL = 300
+
+
+def diff_assignments(submitted, active):
+    """Split the submitted (teacher_id, class_id, stream_id) keys against active rows
+
+    Returns AssignmentDiff(added=keys to insert, removed=rows to deactivate,
+    unchanged=number kept). Duplicate active rows for one key are removed,
+    keeping the earliest.
+    """
+    wanted = set(submitted)
+    kept = set()
+    removed = []
+    for row in sorted(active, key=lambda row: (row.assigned_date or datetime.min, row.id)):
+        key = (row.teacher_id, row.class_id, row.stream_id)
+        if key in wanted and key not in kept:
+            kept.add(key)
+        else:
+            removed.append(row)
+    added = [key for key in submitted if key not in kept]
+    return AssignmentDiff(added=added, removed=removed, unchanged=len(kept))
+
+
+def apply_assignments(submitted):
+    """Make `submitted` the active assignment set and commit; returns the AssignmentDiff"""
+    submitted = list(dict.fromkeys(submitted))
+    active = TeacherAssignment.query.filter_by(is_active=True).all()
+    diff = diff_assignments(submitted, active)
+    if not diff.added and not diff.removed:
+        return diff
+
+    now = datetime.utcnow()
+    if diff.removed:
+        TeacherAssignment.query.filter(TeacherAssignment.id.in_([row.id for row in diff.removed]))\
+            .update({'is_active': False, 'updated_at': now}, synchronize_session='fetch')
+    db.session.add_all([
+        TeacherAssignment(teacher_id=teacher_id, class_id=class_id, stream_id=stream_id,
+                          assigned_date=now, is_active=True)
+        for teacher_id, class_id, stream_id in diff.added
+    ])
+    db.session.commit()
+
+    teacher_ids = {teacher_id for teacher_id, _, _ in diff.added} | {row.teacher_id for row in diff.removed}
+    assignments_changed.send(diff, teacher_ids=teacher_ids)
+    return diff
+
+
+def active_assignments(teacher_id):
+    """A teacher's active assignments as ActiveAssignment tuples, cached"""
+    def load():
+        rows = db.session.query(TeacherAssignment.id, TeacherAssignment.teacher_id,
+                                TeacherAssignment.class_id, TeacherAssignment.stream_id)\
+            .filter(TeacherAssignment.teacher_id == teacher_id, TeacherAssignment.is_active == True)\
+            .order_by(TeacherAssignment.assigned_date, TeacherAssignment.id).all()
+        return tuple(ActiveAssignment(*row, is_active=True) for row in rows)
+
+    return ResultCache.get_or_set(TEACHER_ASSIGNMENTS, teacher_id, load, ttl=TEACHER_ASSIGNMENTS_TTL)
+
+
+@assignments_changed.connect
+def _drop_cached_assignments(diff, teacher_ids=(), **kwargs):
+    ResultCache.discard(TEACHER_ASSIGNMENTS, *teacher_ids)
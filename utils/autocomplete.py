@@ -0,0 +1,195 @@
+"""
+Worker-local autocomplete index for pupil search-as-you-type.
+
+Every pupil is indexed under several normalised keys: each word of the
+name, "first last", "last first", the admission number and the roll number.
+The keys sit in one sorted list, so a typeahead query is a `bisect` into the
+list followed by a short forward scan, with no database round trip.
+
+Pupil inserts, updates and deletes made through the ORM are applied to the
+index when their transaction commits (the same session hooks as the
+reference registry). Changes made by other worker processes or by bulk SQL
+are picked up when the index is rebuilt after `AUTOCOMPLETE_TTL` seconds;
+that rebuild runs on a background thread while queries keep using the
+previous index.
+"""
+import bisect
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, Pupil
+
+# Rebuild from the database at least this often (seconds)
+AUTOCOMPLETE_TTL = 300
+
+PupilEntry = namedtuple('PupilEntry', [
+    'id', 'first_name', 'last_name', 'admission_number', 'roll_number',
+    'class_admitted', 'stream', 'academic_year_id', 'enrollment_status'
+])
+
+# Sorts after every character a key can contain, to bound prefix scans
+_KEY_END = '\uffff'
+
+
+def normalize(value):
+    """Lower-case and collapse whitespace, so 'Jane  DOE' == 'jane doe'"""
+    return ' '.join((value or '').lower().split())
+
+
+def _entry(pupil):
+    return PupilEntry(*(getattr(pupil, field) for field in PupilEntry._fields))
+
+
+def _keys_for(entry):
+    first = normalize(entry.first_name)
+    last = normalize(entry.last_name)
+    keys = set(first.split()) | set(last.split())
+    keys.update(k for k in (f'{first} {last}'.strip(), f'{last} {first}'.strip(),
+                            normalize(entry.admission_number), normalize(entry.roll_number)) if k)
+    return keys
+
+
+class PupilAutocomplete:
+    """Sorted (key, pupil id) pairs plus the pupil entries they point to
+
+    Readers never lock: changes build new structures and swap them in.
+    """
+
+    _keys = []
+    _entries = {}
+    _expires_at = 0.0
+    _pending = None  # changes committed while a rebuild is loading
+    _refreshing = False
+    _lock = threading.Lock()
+
+    @classmethod
+    def rebuild(cls):
+        """Load every pupil's index fields in one query"""
+        with cls._lock:
+            cls._pending = {}
+        rows = db.session.query(*(getattr(Pupil, field) for field in PupilEntry._fields)).all()
+        entries = {row.id: PupilEntry(*row) for row in rows}
+        keys = sorted((key, pupil_id) for pupil_id, entry in entries.items() for key in _keys_for(entry))
+        with cls._lock:
+            cls._entries, cls._keys = entries, keys
+            # Commits that landed while we were loading may be missing from the rows
+            cls._apply_locked(cls._pending or {})
+            cls._pending = None
+            cls._expires_at = time.monotonic() + AUTOCOMPLETE_TTL
+
+    @classmethod
+    def _refresh_in_background(cls):
+        """Rebuild on a thread while queries keep using the current index"""
+        with cls._lock:
+            if cls._refreshing:
+                return
+            cls._refreshing = True
+        app = current_app._get_current_object()
+
+        def run():
+            try:
+                with app.app_context():
+                    cls.rebuild()
+            except Exception as e:
+                print(f"⚠ Autocomplete index rebuild failed: {e}")
+            finally:
+                cls._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    @classmethod
+    def invalidate(cls):
+        """Rebuild on the next query"""
+        cls._expires_at = 0.0
+
+    @classmethod
+    def apply_changes(cls, changes):
+        """Apply committed changes: {pupil_id: PupilEntry, or None when deleted}"""
+        with cls._lock:
+            if cls._pending is not None:
+                cls._pending.update(changes)
+            if cls._entries:
+                cls._apply_locked(changes)
+
+    @classmethod
+    def _apply_locked(cls, changes):
+        if not changes:
+            return
+        entries = dict(cls._entries)
+        stale = {pupil_id for pupil_id in changes if pupil_id in entries}
+        keys = [pair for pair in cls._keys if pair[1] not in stale] if stale else list(cls._keys)
+        for pupil_id, entry in changes.items():
+            entries.pop(pupil_id, None)
+            if entry is not None:
+                entries[pupil_id] = entry
+                for key in _keys_for(entry):
+                    bisect.insort(keys, (key, pupil_id))
+        cls._entries, cls._keys = entries, keys
+
+    @classmethod
+    def suggest(cls, text, limit=10, active_only=True, academic_year_id=None):
+        """Pupils with an indexed key starting with `text`, exact key matches first"""
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        if cls._expires_at <= time.monotonic():
+            # Only the very first build makes a request wait
+            if cls._entries:
+                cls._refresh_in_background()
+            else:
+                cls.rebuild()
+        keys, entries = cls._keys, cls._entries
+
+        def wanted(entry):
+            if active_only and entry.enrollment_status != 'active':
+                return False
+            return academic_year_id is None or entry.academic_year_id == academic_year_id
+
+        # Keys equal to the prefix sort first, so exact matches come out first
+        matches, seen = [], set()
+        start = bisect.bisect_left(keys, (prefix,))
+        stop = bisect.bisect_left(keys, (prefix + _KEY_END,), start)
+        for index in range(start, stop):
+            pupil_id = keys[index][1]
+            if pupil_id in seen:
+                continue
+            seen.add(pupil_id)
+            if wanted(entries[pupil_id]):
+                matches.append(entries[pupil_id])
+                if len(matches) >= limit:
+                    break
+        return matches
+
+
+# ---------------------------------------------------------------------------
+# Keep the index in step with ORM writes: capture pupil values at flush time
+# (they are expired after commit) and apply them once the commit succeeds
+
+@event.listens_for(Session, 'after_flush')
+def _note_pupil_changes(session, flush_context):
+    changes = {}
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Pupil):
+            changes[obj.id] = _entry(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Pupil):
+            changes[obj.id] = None
+    if changes:
+        session.info.setdefault('autocomplete_changes', {}).update(changes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pupil_changes(session):
+    changes = session.info.pop('autocomplete_changes', None)
+    if changes:
+        PupilAutocomplete.apply_changes(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pupil_changes(session):
+    session.info.pop('autocomplete_changes', None)
@@ -0,0 +1,102 @@
+"""
+Small in-process result cache for expensive page data.
+
+Entries live in named namespaces (e.g. 'bursar_dashboard') with a TTL, and
+routes that change the underlying data call `ResultCache.invalidate(namespace)`
+after committing so the next page load recomputes. Like `SystemSettings`, the
+cache is per worker process; the TTL bounds how stale another worker can be.
+"""
+import threading
+import time
+
+# Namespaces shared between the routes that read and invalidate them
+BURSAR_DASHBOARD = 'bursar_dashboard'
+REVENUE_SERIES = 'revenue_series'
+PUPIL_SNAPSHOT = 'pupil_snapshot'
+TEACHER_ASSIGNMENTS = 'teacher_assignments'
+
+
+class ResultCache:
+    """TTL cache of computed values grouped by namespace"""
+
+    _entries = {}
+    _lock = threading.Lock()
+    _default_ttl = 120
+    # Namespace size past which `set` sweeps out expired entries
+    _sweep_threshold = 512
+    _hits = 0
+    _misses = 0
+
+    @classmethod
+    def get(cls, namespace, key, default=None):
+        """Return a cached value, or `default` when missing or expired"""
+        with cls._lock:
+            entries = cls._entries.get(namespace, {})
+            entry = entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del entries[key]
+                cls._misses += 1
+                return default
+            cls._hits += 1
+            return entry[1]
+
+    @classmethod
+    def set(cls, namespace, key, value, ttl=None):
+        """Store a value for `ttl` seconds"""
+        now = time.monotonic()
+        expires_at = now + (ttl if ttl is not None else cls._default_ttl)
+        with cls._lock:
+            entries = cls._entries.setdefault(namespace, {})
+            # Per-key namespaces (one entry per pupil, teacher or day) would
+            # otherwise keep every key ever requested
+            if len(entries) >= cls._sweep_threshold and key not in entries:
+                for stale in [k for k, (expiry, _) in entries.items() if expiry < now]:
+                    del entries[stale]
+            entries[key] = (expires_at, value)
+
+    @classmethod
+    def get_or_set(cls, namespace, key, producer, ttl=None):
+        """Return the cached value, computing and storing it on a miss"""
+        missing = object()
+        value = cls.get(namespace, key, missing)
+        if value is missing:
+            value = producer()
+            cls.set(namespace, key, value, ttl)
+        return value
+
+    @classmethod
+    def invalidate(cls, *namespaces):
+        """Drop every entry in the given namespaces (all entries when none given)"""
+        with cls._lock:
+            if not namespaces:
+                cls._entries.clear()
+            for namespace in namespaces:
+                cls._entries.pop(namespace, None)
+
+    @classmethod
+    def discard(cls, namespace, *keys):
+        """Drop individual entries from one namespace"""
+        with cls._lock:
+            entries = cls._entries.get(namespace, {})
+            for key in keys:
+                entries.pop(key, None)
+
+    @classmethod
+    def stats(cls):
+        """Hit/miss counters and entry counts per namespace"""
+        with cls._lock:
+            return {
+                'hits': cls._hits,
+                'misses': cls._misses,
+                'namespaces': {name: len(entries) for name, entries in cls._entries.items()}
+            }
+
+
+def invalidate_payment_caches():
+    """Call after committing changes to payments or fee structures
+
+    Revenue series are not cleared here: utils.fee_analytics drops only the
+    academic years a committed payment write touched, so closed years stay cached.
+    """
+    ResultCache.invalidate(BURSAR_DASHBOARD, PUPIL_SNAPSHOT)
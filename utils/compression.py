@@ -0,0 +1,196 @@
+"""
+Response compression and conditional GET for pages and JSON.
+
+`CompressionMiddleware` wraps the WSGI app (see `init_compression`). For each
+buffered response it:
+
+- adds a weak ETag computed from the body, keeping one the view already set
+  (weakened when the body is compressed, since the bytes differ), and answers
+  a GET whose If-None-Match matches with 304 Not Modified;
+- compresses HTML, JSON, JavaScript, CSS, XML and plain-text bodies of at
+  least `min_size` bytes with brotli (when the optional brotli package is
+  installed and the browser accepts it) or gzip, and adds
+  `Vary: Accept-Encoding`.
+
+Streamed responses (no Content-Length), very large downloads, ranges, HEAD
+requests, bodies that are already encoded and responses marked
+`Cache-Control: no-transform` pass through untouched.
+
+Rules can be changed per blueprint, or per endpoint for routes registered on
+the app itself (e.g. 'static'), in app.config['COMPRESSION_RULES']:
+
+    app.config['COMPRESSION_RULES'] = {
+        'admin': {'etag': False},
+        'bursar': {'min_size': 4096, 'gzip_level': 9},
+    }
+"""
+import gzip
+import hashlib
+from collections import namedtuple
+
+from werkzeug.datastructures import Headers
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag, unquote_etag
+from werkzeug.routing import RequestRedirect
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only without it
+    brotli = None
+
+CompressionRule = namedtuple('CompressionRule', ['compress', 'etag', 'min_size', 'gzip_level', 'brotli_quality'])
+
+# Bodies under 1 KB gain little; levels favour speed, as pages are compressed per request
+DEFAULT_RULE = CompressionRule(compress=True, etag=True, min_size=1024, gzip_level=6, brotli_quality=5)
+
+# Larger bodies (backups, exports) are passed through rather than held in memory
+MAX_BUFFER_BYTES = 8 * 1024 * 1024
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/xml', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'application/manifest+json',
+    'image/svg+xml',
+}
+
+# Headers a 304 must not carry, as they describe a body it does not have
+_BODY_HEADERS = {'content-length', 'content-type', 'content-encoding', 'content-range', 'transfer-encoding'}
+
+
+def _is_compressible(content_type):
+    mimetype = (content_type or '').split(';', 1)[0].strip().lower()
+    return mimetype in COMPRESSIBLE_TYPES or mimetype.endswith(('+json', '+xml'))
+
+
+class CompressionMiddleware:
+    """WSGI middleware adding weak ETags, 304 responses and gzip/brotli compression"""
+
+    def __init__(self, wsgi_app, url_map=None, rules=None):
+        self.wsgi_app = wsgi_app
+        self.url_map = url_map
+        self.rules = {name: DEFAULT_RULE._replace(**options) for name, options in (rules or {}).items()}
+
+    def rule_for(self, environ):
+        """The rule for the blueprint (or app-level endpoint) serving this request"""
+        if not self.rules or self.url_map is None:
+            return DEFAULT_RULE
+        try:
+            endpoint, _ = self.url_map.bind_to_environ(environ).match()
+        except (HTTPException, RequestRedirect):
+            return DEFAULT_RULE
+        return self.rules.get(endpoint.rsplit('.', 1)[0], DEFAULT_RULE)
+
+    def __call__(self, environ, start_response):
+        method = environ.get('REQUEST_METHOD', 'GET')
+        rule = self.rule_for(environ)
+        if method == 'HEAD' or not (rule.compress or rule.etag):
+            return self.wsgi_app(environ, start_response)
+
+        captured = []
+        written = []
+
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            return written.append
+
+        # Flask calls start_response before returning the body iterable
+        app_iter = self.wsgi_app(environ, capture)
+        status, header_list, exc_info = captured
+        headers = Headers(header_list)
+
+        if not self._can_buffer(status, headers):
+            start_response(status, header_list, exc_info)
+            if written:
+                return [b''.join(written)] + list(app_iter)
+            return app_iter
+
+        try:
+            body = b''.join(written) + b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+        encoding = None
+        if rule.compress and _is_compressible(headers.get('Content-Type')):
+            self._add_vary(headers)
+            if len(body) >= rule.min_size:
+                encoding = self._choose_encoding(environ)
+            if encoding:
+                # The compressed bytes differ, so a strong validator no longer holds
+                self._weaken_etag(headers)
+
+        if rule.etag and method == 'GET' and status.startswith('200'):
+            etag = self._etag(headers, body)
+            if self._not_modified(environ, etag):
+                not_modified = [(name, value) for name, value in headers.items()
+                                if name.lower() not in _BODY_HEADERS]
+                start_response('304 Not Modified', not_modified, exc_info)
+                return []
+
+        if encoding:
+            compressed = self._compress(body, encoding, rule)
+            if len(compressed) < len(body):
+                body = compressed
+                headers['Content-Encoding'] = encoding
+
+        headers['Content-Length'] = str(len(body))
+        start_response(status, headers.to_wsgi_list(), exc_info)
+        return [body]
+
+    @staticmethod
+    def _can_buffer(status, headers):
+        if status[:3] in ('204', '206', '304') or 'Content-Range' in headers:
+            return False
+        if 'Content-Encoding' in headers or 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+        # Streamed responses have no Content-Length and are sent as they are generated
+        length = headers.get('Content-Length', type=int)
+        return length is not None and length <= MAX_BUFFER_BYTES
+
+    @staticmethod
+    def _add_vary(headers):
+        vary = headers.get('Vary')
+        if not vary:
+            headers['Vary'] = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower() and vary.strip() != '*':
+            headers['Vary'] = f'{vary}, Accept-Encoding'
+
+    @staticmethod
+    def _choose_encoding(environ):
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    @staticmethod
+    def _compress(body, encoding, rule):
+        if encoding == 'br':
+            return brotli.compress(body, quality=rule.brotli_quality)
+        return gzip.compress(body, compresslevel=rule.gzip_level, mtime=0)
+
+    @staticmethod
+    def _weaken_etag(headers):
+        if 'ETag' in headers:
+            value, weak = unquote_etag(headers['ETag'])
+            if not weak:
+                headers['ETag'] = quote_etag(value, weak=True)
+
+    @staticmethod
+    def _etag(headers, body):
+        """The response's ETag value, generated from the body if the view set none"""
+        if 'ETag' in headers:
+            return unquote_etag(headers['ETag'])[0]
+        value = hashlib.sha1(body).hexdigest()
+        headers['ETag'] = quote_etag(value, weak=True)
+        return value
+
+    @staticmethod
+    def _not_modified(environ, etag):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        return bool(if_none_match) and parse_etags(if_none_match).contains_weak(etag)
+
+
+def init_compression(app):
+    """Wrap the app in CompressionMiddleware using app.config['COMPRESSION_RULES']"""
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app, app.url_map, app.config.get('COMPRESSION_RULES'))
@@ -0,0 +1,311 @@
+"""
+Fee collection analytics for the bursar reports page.
+
+Each report is computed from a single SQL statement: the per-class and
+per-stream figures are gathered as labelled GROUP BY branches of one
+UNION ALL, then folded together in Python.
+
+Revenue series for closed (inactive) academic years are kept in the result
+cache for an hour; a committed payment write drops only the series of the
+academic years it touched. The cache is per worker, so the hour bounds how
+long other workers show a closed year's series after a correction or restore.
+"""
+from datetime import timedelta
+
+from sqlalchemy import event, func, literal, union_all, null, cast, String, Date, Integer
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Pupil, Payment, FeeStructure
+from utils.cache import ResultCache, REVENUE_SERIES
+from utils.reference_data import ReferenceData
+
+REVENUE_BUCKETS = ('day', 'week', 'month', 'term')
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+# Seconds to keep the active year's series, and a closed year's
+ACTIVE_YEAR_TTL = 120
+CLOSED_YEAR_TTL = 3600
+
+TERM_COLUMNS = {
+    1: FeeStructure.term1_amount,
+    2: FeeStructure.term2_amount,
+    3: FeeStructure.term3_amount,
+}
+
+
+def _fee_expression(term):
+    """Fee structure amount for one term, or the sum of all three terms"""
+    if term:
+        return func.coalesce(TERM_COLUMNS[term], 0)
+    return (func.coalesce(FeeStructure.term1_amount, 0) +
+            func.coalesce(FeeStructure.term2_amount, 0) +
+            func.coalesce(FeeStructure.term3_amount, 0))
+
+
+def class_collection(academic_year_id, term=None):
+    """Expected, collected and outstanding fees per class, with stream drill-downs
+
+    Expected fees for a class are the class's fee structures (all streams and
+    categories) multiplied by its active pupils, as on the existing report;
+    a stream's share uses the same class total times the stream's pupils.
+    Collected amounts are the year's payments (optionally for one term)
+    grouped by the paying pupil's class and stream.
+    """
+    if term is not None and term not in TERM_COLUMNS:
+        raise ValueError(f'Invalid term: {term}')
+
+    pupil_counts = db.session.query(
+        literal('pupils').label('kind'),
+        Pupil.class_admitted.label('class_id'),
+        Pupil.stream.label('stream_id'),
+        func.count(Pupil.id).label('value')
+    ).filter(
+        Pupil.academic_year_id == academic_year_id,
+        Pupil.enrollment_status == 'active'
+    ).group_by(Pupil.class_admitted, Pupil.stream)
+
+    fees = db.session.query(
+        literal('fees').label('kind'),
+        FeeStructure.class_id.label('class_id'),
+        cast(null(), String).label('stream_id'),
+        func.sum(_fee_expression(term)).label('value')
+    ).filter(
+        FeeStructure.academic_year_id == academic_year_id
+    ).group_by(FeeStructure.class_id)
+
+    collected = db.session.query(
+        literal('collected').label('kind'),
+        Pupil.class_admitted.label('class_id'),
+        Pupil.stream.label('stream_id'),
+        func.sum(Payment.amount).label('value')
+    ).join(Pupil, Pupil.id == Payment.pupil_id)\
+     .filter(Payment.academic_year_id == academic_year_id)
+    if term:
+        collected = collected.filter(Payment.term == term)
+    collected = collected.group_by(Pupil.class_admitted, Pupil.stream)
+
+    rows = db.session.execute(union_all(pupil_counts, fees, collected)).all()
+
+    # Fold the three result sets into per-class and per-stream figures
+    class_fees = {}
+    students = {}
+    received = {}
+    for kind, class_id, stream_id, value in rows:
+        if kind == 'fees':
+            class_fees[class_id] = float(value or 0)
+        elif kind == 'pupils':
+            students[(class_id, stream_id)] = int(value or 0)
+        else:
+            received[(class_id, stream_id)] = float(value or 0)
+
+    stream_names = ReferenceData.stream_names()
+    data = []
+    for school_class in ReferenceData.classes():
+        fee_total = class_fees.get(school_class.id, 0.0)
+        stream_ids = sorted(
+            {s for c, s in students if c == school_class.id} |
+            {s for c, s in received if c == school_class.id},
+            key=lambda s: stream_names.get(s, s or '')
+        )
+
+        streams = []
+        for stream_id in stream_ids:
+            count = students.get((school_class.id, stream_id), 0)
+            streams.append(_collection_row(
+                {'stream': stream_names.get(stream_id, stream_id or 'Unassigned'), 'stream_id': stream_id},
+                count, fee_total * count, received.get((school_class.id, stream_id), 0.0)))
+
+        class_row = _collection_row(
+            {'class': school_class.name, 'class_id': school_class.id},
+            sum(s['students'] for s in streams),
+            sum(s['expected'] for s in streams),
+            sum(s['collected'] for s in streams))
+        class_row['streams'] = streams
+        data.append(class_row)
+
+    # Sort by class name
+    data.sort(key=lambda x: x['class'])
+    return data
+
+
+def _collection_row(labels, students, expected, collected):
+    percentage = (collected / expected * 100) if expected > 0 else 0
+    return dict(labels,
+                students=students,
+                expected=expected,
+                collected=collected,
+                outstanding=max(0, expected - collected),
+                percentage=round(percentage, 1))
+
+
+def _bucket_key(payment_date, term, bucket):
+    if bucket == 'day':
+        return payment_date
+    if bucket == 'week':
+        return payment_date - timedelta(days=payment_date.weekday())
+    if bucket == 'month':
+        return (payment_date.year, payment_date.month)
+    return term
+
+
+def _bucket_range(keys, bucket):
+    """Every bucket between the first and last key, so gaps show as zero"""
+    if bucket == 'term':
+        return sorted(set(keys) | {1, 2, 3})
+    if not keys:
+        return []
+    first, last = min(keys), max(keys)
+    if bucket == 'month':
+        span = (last[0] - first[0]) * 12 + (last[1] - first[1])
+        return [(first[0] + (first[1] - 1 + i) // 12, (first[1] - 1 + i) % 12 + 1) for i in range(span + 1)]
+    step = 7 if bucket == 'week' else 1
+    return [first + timedelta(days=i) for i in range(0, (last - first).days + 1, step)]
+
+
+def _bucket_label(key, bucket, term_names):
+    if bucket == 'month':
+        return f"{MONTH_NAMES[key[1] - 1]} {key[0]}"
+    if bucket == 'term':
+        return term_names.get(key, f'Term {key}')
+    if bucket == 'week':
+        return f"Week of {key.strftime('%d/%m/%Y')}"
+    return key.strftime('%d/%m/%Y')
+
+
+def _revenue_rows(academic_year_id, term):
+    """Payments grouped by date, term and method plus the active pupil count"""
+    payments = db.session.query(
+        literal('payments').label('kind'),
+        Payment.payment_date.label('payment_date'),
+        Payment.term.label('term'),
+        Payment.payment_method.label('method'),
+        func.sum(Payment.amount).label('amount'),
+        func.count(Payment.id).label('count')
+    ).filter(
+        Payment.academic_year_id == academic_year_id,
+        Payment.payment_date.isnot(None)
+    )
+    if term:
+        payments = payments.filter(Payment.term == term)
+    payments = payments.group_by(Payment.payment_date, Payment.term, Payment.payment_method)
+
+    students = db.session.query(
+        literal('students').label('kind'),
+        cast(null(), Date),
+        cast(null(), Integer),
+        cast(null(), String),
+        literal(0.0),
+        func.count(Pupil.id)
+    ).filter(
+        Pupil.academic_year_id == academic_year_id,
+        Pupil.enrollment_status == 'active'
+    )
+
+    return db.session.execute(union_all(payments, students)).all()
+
+
+def _build_revenue_analysis(academic_year_id, term, bucket):
+    student_count = 0
+    amounts = {}
+    counts = {}
+    by_method = {}
+    for kind, payment_date, payment_term, method, amount, count in _revenue_rows(academic_year_id, term):
+        if kind == 'students':
+            student_count = count or 0
+            continue
+        key = _bucket_key(payment_date, payment_term, bucket)
+        amounts[key] = amounts.get(key, 0.0) + float(amount or 0)
+        counts[key] = counts.get(key, 0) + (count or 0)
+        method_amounts = by_method.setdefault(method or 'unknown', {})
+        method_amounts[key] = method_amounts.get(key, 0.0) + float(amount or 0)
+
+    # A term filter with term buckets is a single bucket
+    keys = [term] if bucket == 'term' and term else _bucket_range(list(amounts), bucket)
+    term_names = ReferenceData.term_names()
+
+    series_amounts = [amounts.get(key, 0.0) for key in keys]
+    cumulative = []
+    running = 0.0
+    for value in series_amounts:
+        running += value
+        cumulative.append(running)
+
+    total_revenue = running
+    series = {
+        'bucket': bucket,
+        'labels': [_bucket_label(key, bucket, term_names) for key in keys],
+        'keys': [key.isoformat() if hasattr(key, 'isoformat') else (f'{key[0]}-{key[1]:02d}' if bucket == 'month' else key)
+                 for key in keys],
+        'amounts': series_amounts,
+        'cumulative': cumulative,
+        'counts': [counts.get(key, 0) for key in keys],
+        'by_method': {method: [values.get(key, 0.0) for key in keys]
+                      for method, values in sorted(by_method.items())}
+    }
+
+    return {
+        'total_revenue': total_revenue,
+        'avg_revenue': total_revenue / student_count if student_count > 0 else 0,
+        'student_count': student_count,
+        'series': series
+    }
+
+
+def revenue_analysis(academic_year, term=None, bucket='month'):
+    """Revenue totals and a zero-filled time series for one academic year
+
+    `bucket` is one of day, week, month or term. Results for inactive years
+    are cached for CLOSED_YEAR_TTL or until a payment in that year is written;
+    the active year's for a short TTL.
+    """
+    if bucket not in REVENUE_BUCKETS:
+        raise ValueError(f'Invalid bucket: {bucket}')
+    if term is not None and term not in TERM_COLUMNS:
+        raise ValueError(f'Invalid term: {term}')
+
+    ttl = ACTIVE_YEAR_TTL if academic_year.is_active else CLOSED_YEAR_TTL
+    return ResultCache.get_or_set(
+        REVENUE_SERIES, (academic_year.id, term, bucket),
+        lambda: _build_revenue_analysis(academic_year.id, term, bucket),
+        ttl=ttl)
+
+
+# ---------------------------------------------------------------------------
+# Invalidation: note the academic years of the payments a transaction wrote
+# (old and new year when a payment moves) and drop their series on commit
+
+def _note_years(session, years):
+    years = {int(year_id) for year_id in years if year_id is not None}
+    if years:
+        session.info.setdefault('revenue_series_changes', set()).update(years)
+
+
+@event.listens_for(Payment.academic_year_id, 'set', active_history=True)
+def _note_moved_payment(payment, value, old_value, initiator):
+    # active_history loads the old year even when the attribute was expired
+    session = object_session(payment)
+    if session is not None and isinstance(old_value, (int, str)):
+        _note_years(session, [old_value])
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_revenue_changes(session, flush_context):
+    _note_years(session, [obj.academic_year_id
+                          for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+                          if isinstance(obj, Payment)])
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_revenue_series(session):
+    years = session.info.pop('revenue_series_changes', None)
+    if years:
+        ResultCache.discard(REVENUE_SERIES, *[(year_id, term, bucket)
+                                              for year_id in years
+                                              for term in (None, *TERM_COLUMNS)
+                                              for bucket in REVENUE_BUCKETS])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_revenue_changes(session):
+    session.info.pop('revenue_series_changes', None)
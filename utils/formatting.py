@@ -0,0 +1,81 @@
+"""
+Money formatting for pages, invoices and reports.
+
+A `CurrencyFormatter` is built once per (currency, decimals) and reused, so
+formatting a column of payments is a string format per amount instead of a
+settings lookup and a symbol table per amount. The formatter for the
+school's currency hangs off the settings snapshot
+(`SystemSettings.current().currency_formatter`); templates use the
+`currency` filter.
+"""
+from decimal import Decimal
+
+CURRENCY_SYMBOLS = {
+    'KES': 'KSh',
+    'UGX': 'UGX',
+    'TZS': 'TSh',
+    'USD': '$',
+    'EUR': '€',
+    'GBP': '£'
+}
+
+_formatters = {}
+
+
+class CurrencyFormatter:
+    """Formats amounts as '<symbol> 1,234.00' for one currency"""
+
+    __slots__ = ('currency', 'symbol', 'decimals', '_pattern', '_plain_pattern')
+
+    def __init__(self, currency, decimals=2):
+        self.currency = currency
+        self.symbol = CURRENCY_SYMBOLS.get(currency, currency)
+        self.decimals = decimals
+        self._plain_pattern = f'{{:,.{decimals}f}}'
+        self._pattern = f'{self.symbol} {self._plain_pattern}'
+
+    @staticmethod
+    def _number(amount):
+        if type(amount) is float or type(amount) is int:
+            return amount
+        if isinstance(amount, Decimal):
+            return float(amount)
+        try:
+            return float(amount)
+        except (ValueError, TypeError):
+            return 0.0
+
+    def format(self, amount):
+        """Amount with the currency symbol"""
+        return self._pattern.format(self._number(amount))
+
+    def format_plain(self, amount):
+        """Amount without the currency symbol"""
+        return self._plain_pattern.format(self._number(amount))
+
+    def format_many(self, amounts):
+        """Format a column of amounts, in order"""
+        pattern = self._pattern.format
+        number = self._number
+        return [pattern(number(amount)) for amount in amounts]
+
+
+def currency_formatter(currency, decimals=2):
+    """Shared formatter for a currency code"""
+    key = (currency, decimals)
+    formatter = _formatters.get(key)
+    if formatter is None:
+        formatter = _formatters[key] = CurrencyFormatter(currency, decimals)
+    return formatter
+
+
+def currency_filter(amount, decimals=2, currency=None):
+    """Jinja filter: {{ payment.amount|currency }} or {{ total|currency(0) }}"""
+    if currency is None:
+        from utils.settings import SystemSettings
+        currency = SystemSettings.current().currency
+    return currency_formatter(currency, decimals).format(amount)
+
+
+def register_template_filters(app):
+    app.add_template_filter(currency_filter, 'currency')
@@ -0,0 +1,55 @@
+"""
+HTTP caching headers for read-only JSON endpoints.
+
+`@cache_headers(...)` marks a GET endpoint as safe for the service worker's
+stale-while-revalidate cache. It emits an ETag (hash of the body) and
+`Cache-Control: private, max-age=N, stale-while-revalidate=M`, and answers a
+matching `If-None-Match` with 304, so a background revalidation of unchanged
+data costs one small response. Endpoints without these headers are never
+cached by sw.js.
+"""
+import hashlib
+import re
+from functools import wraps
+
+from flask import request, make_response
+
+# Defaults: always revalidate, but a cached copy may be shown for a day
+DEFAULT_MAX_AGE = 0
+DEFAULT_STALE_WHILE_REVALIDATE = 86400
+
+_DIRECTIVE = re.compile(r'(max-age|stale-while-revalidate)=(\d+)')
+
+
+def cache_control_value(max_age, stale_while_revalidate):
+    return f'private, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}'
+
+
+def stale_while_revalidate_window(cache_control):
+    """(max_age, stale_while_revalidate) from a Cache-Control header, or None if not opted in"""
+    if not cache_control or 'no-store' in cache_control:
+        return None
+    directives = dict(_DIRECTIVE.findall(cache_control))
+    if 'stale-while-revalidate' not in directives:
+        return None
+    return int(directives.get('max-age', 0)), int(directives['stale-while-revalidate'])
+
+
+def apply_cache_headers(response, max_age=DEFAULT_MAX_AGE, stale_while_revalidate=DEFAULT_STALE_WHILE_REVALIDATE):
+    """Add ETag and Cache-Control to a 200 GET response; 304 when the client's copy matches"""
+    if request.method != 'GET' or response.status_code != 200 or response.direct_passthrough:
+        return response
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    response.headers['Cache-Control'] = cache_control_value(max_age, stale_while_revalidate)
+    return response.make_conditional(request)
+
+
+def cache_headers(max_age=DEFAULT_MAX_AGE, stale_while_revalidate=DEFAULT_STALE_WHILE_REVALIDATE):
+    """Decorator for JSON GET endpoints the service worker may serve stale while revalidating"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            response = make_response(view(*args, **kwargs))
+            return apply_cache_headers(response, max_age, stale_while_revalidate)
+        return wrapper
+    return decorator
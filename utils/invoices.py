@@ -0,0 +1,262 @@
+"""
+Invoice/receipt helpers for the bursar's single and bulk invoice pages.
+
+Payment totals, latest payment dates and payment counts for every paid pupil
+come from one grouped query. Bulk jobs walk the pupils in fixed-size batches
+(one pupil query and one payment query per batch) and stream each invoice out
+as soon as it is rendered, so memory use does not grow with the number of
+invoices. When WeasyPrint is available the HTML to PDF conversion runs on a
+process pool with a bounded number of invoices in flight.
+"""
+import os
+import re
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func
+
+from models import db, Payment, Pupil, FeeStructure
+from utils.reference_data import ReferenceData
+from utils.pdf import weasyprint_available, html_to_pdf
+from utils.settings import SystemSettings
+
+# Pupils loaded per database round trip while streaming
+INVOICE_BATCH_SIZE = 50
+
+# Invoices handed to the PDF pool before we wait for the oldest one
+MAX_IN_FLIGHT = max(2, (os.cpu_count() or 1) * 2)
+
+_pdf_pool = None
+
+
+def _get_pdf_pool():
+    """Create the PDF process pool lazily, once per worker"""
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(max_workers=max(1, min(4, os.cpu_count() or 1)))
+    return _pdf_pool
+
+
+def _payment_summary_subquery():
+    """Per-pupil payment total, latest payment date and payment count"""
+    return db.session.query(
+        Payment.pupil_id.label('pupil_id'),
+        func.coalesce(func.sum(Payment.amount), 0).label('total_paid'),
+        func.max(Payment.payment_date).label('latest_payment_date'),
+        func.count(Payment.id).label('payment_count')
+    ).group_by(Payment.pupil_id).subquery()
+
+
+def paid_pupil_summaries(class_id=None):
+    """List active pupils with payments, with their totals, in one query"""
+    summary = _payment_summary_subquery()
+    query = db.session.query(
+        Pupil.id, Pupil.first_name, Pupil.last_name, Pupil.admission_number,
+        summary.c.total_paid, summary.c.latest_payment_date, summary.c.payment_count
+    ).join(summary, summary.c.pupil_id == Pupil.id)\
+     .filter(Pupil.enrollment_status == 'active')
+
+    if class_id:
+        query = query.filter(Pupil.class_admitted == class_id)
+
+    return [{
+        'id': row.id,
+        'first_name': row.first_name,
+        'last_name': row.last_name,
+        'admission_number': row.admission_number,
+        'total_paid': float(row.total_paid or 0),
+        'latest_payment_date': row.latest_payment_date,
+        'payment_count': row.payment_count
+    } for row in query.order_by(Pupil.first_name, Pupil.last_name).all()]
+
+
+def _paid_pupil_ids(class_id=None):
+    """IDs of active pupils with payments, in the order invoices are printed"""
+    query = db.session.query(Pupil.id)\
+        .filter(Pupil.enrollment_status == 'active',
+                Pupil.id.in_(db.session.query(Payment.pupil_id)))
+    if class_id:
+        query = query.filter(Pupil.class_admitted == class_id)
+    return [row.id for row in query.order_by(Pupil.admission_number, Pupil.id).all()]
+
+
+def class_fee_totals(academic_year_id):
+    """Annual fees assigned per class for an academic year"""
+    if not academic_year_id:
+        return {}
+    rows = db.session.query(
+        FeeStructure.class_id,
+        func.sum(
+            func.coalesce(FeeStructure.term1_amount, 0) +
+            func.coalesce(FeeStructure.term2_amount, 0) +
+            func.coalesce(FeeStructure.term3_amount, 0)
+        )
+    ).filter(FeeStructure.academic_year_id == academic_year_id)\
+     .group_by(FeeStructure.class_id).all()
+    return {class_id: float(total or 0) for class_id, total in rows}
+
+
+def build_invoice(pupil, payments, fee_totals):
+    """Work out the totals shown on one pupil's invoice
+
+    `payments` must be ordered newest first, as on the single invoice page.
+    """
+    total_paid = sum(payment.amount for payment in payments)
+    assigned_total = fee_totals.get(pupil.class_admitted, 0.0) if pupil.class_admitted else 0.0
+    balance = max(0, assigned_total - total_paid) if pupil.class_admitted else 0.0
+
+    money = SystemSettings.current().currency_formatter
+    for payment, formatted in zip(payments, money.format_many(payment.amount for payment in payments)):
+        payment.amount_formatted = formatted
+
+    return {
+        'pupil': pupil,
+        'payments': payments,
+        'total_paid': total_paid,
+        'total_paid_formatted': money.format(total_paid),
+        'assigned_total': assigned_total,
+        'assigned_total_formatted': money.format(assigned_total),
+        'balance': balance,
+        'balance_formatted': money.format(balance)
+    }
+
+
+def iter_invoices(class_id=None, batch_size=INVOICE_BATCH_SIZE):
+    """Yield invoice dicts for every paid pupil, loading them batch by batch
+
+    Each batch is expunged from the session once its invoices have been
+    yielded so the identity map does not grow over a whole-school run.
+    """
+    current_academic_year = ReferenceData.current_academic_year()
+    fee_totals = class_fee_totals(current_academic_year.id if current_academic_year else None)
+    pupil_ids = _paid_pupil_ids(class_id)
+
+    for start in range(0, len(pupil_ids), batch_size):
+        batch_ids = pupil_ids[start:start + batch_size]
+
+        pupils = {p.id: p for p in Pupil.query.filter(Pupil.id.in_(batch_ids)).all()}
+        payments_by_pupil = {pupil_id: [] for pupil_id in batch_ids}
+        payments = Payment.query.filter(Payment.pupil_id.in_(batch_ids))\
+            .order_by(Payment.pupil_id, Payment.payment_date.desc(), Payment.id.desc()).all()
+        for payment in payments:
+            payments_by_pupil[payment.pupil_id].append(payment)
+
+        for pupil_id in batch_ids:
+            pupil = pupils.get(pupil_id)
+            if pupil is not None:
+                yield build_invoice(pupil, payments_by_pupil[pupil_id], fee_totals)
+
+        for obj in list(pupils.values()) + payments:
+            db.session.expunge(obj)
+
+
+def invoice_context():
+    """Template variables shared by every invoice in a run"""
+    settings = SystemSettings.current()
+    return {
+        'current_academic_year': ReferenceData.current_academic_year(),
+        'system_settings': {
+            'school_name': settings.school_name,
+            'abbreviated_school_name': settings.abbreviated_school_name,
+            'school_address': settings.school_address,
+            'school_phone': settings.school_phone,
+            'school_email': settings.school_email,
+        },
+        'datetime': datetime
+    }
+
+
+def invoice_filename(pupil, extension):
+    """Safe file name for a pupil's invoice inside the ZIP archive"""
+    name = f"{pupil.admission_number or pupil.id}_{pupil.first_name}_{pupil.last_name}"
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_') + f'.{extension}'
+
+
+class _ZipStream:
+    """Write-only file object that hands finished ZIP bytes back to a generator
+
+    zipfile falls back to streaming mode (data descriptors after each entry)
+    when the target cannot seek, so only the current entry is ever buffered.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _invoice_renderer():
+    """Return a function rendering one invoice as a standalone HTML document
+
+    Context processors run once for the whole job instead of once per
+    invoice, which keeps a whole-school run from re-reading the settings
+    for every pupil.
+    """
+    template = current_app.jinja_env.get_template('bursar/bulk_invoices_template.html')
+    context = invoice_context()
+    current_app.update_template_context(context)
+
+    def render(invoice):
+        pupil = invoice['pupil']
+        return template.render(context, invoices=[invoice],
+                               title=f"{pupil.first_name} {pupil.last_name}")
+    return render
+
+
+def _iter_invoice_files(class_id, base_url):
+    """Yield (filename, bytes) for each invoice, converting to PDF on the pool"""
+    render = _invoice_renderer()
+
+    if not weasyprint_available():
+        for invoice in iter_invoices(class_id):
+            html = render(invoice)
+            yield invoice_filename(invoice['pupil'], 'html'), html.encode('utf-8')
+        return
+
+    pool = _get_pdf_pool()
+    in_flight = deque()
+    for invoice in iter_invoices(class_id):
+        html = render(invoice)
+        in_flight.append((invoice_filename(invoice['pupil'], 'pdf'),
+                          pool.submit(html_to_pdf, html, base_url)))
+        # Keep the window bounded so finished PDFs never pile up in memory
+        if len(in_flight) >= MAX_IN_FLIGHT:
+            filename, future = in_flight.popleft()
+            yield filename, future.result()
+
+    while in_flight:
+        filename, future = in_flight.popleft()
+        yield filename, future.result()
+
+
+def stream_invoice_zip(class_id=None, base_url=None):
+    """Generate a ZIP archive of invoices chunk by chunk
+
+    Must run inside `stream_with_context` because rendering needs the app
+    and request context.
+    """
+    buffer = _ZipStream()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, data in _iter_invoice_files(class_id, base_url):
+            archive.writestr(filename, data)
+            yield buffer.drain()
+    # Central directory is written when the archive closes
+    yield buffer.drain()
+
+
+def bulk_invoice_extension():
+    """File type used for invoices inside the bulk archive on this host"""
+    return 'pdf' if weasyprint_available() else 'html'
@@ -0,0 +1,37 @@
+"""
+PDF helpers shared by the bulk report and invoice generators.
+
+WeasyPrint is optional (it needs Cairo/Pango system libraries that are not
+available on every host, e.g. Vercel), so callers must check
+`weasyprint_available()` and fall back to printable HTML when it is missing.
+"""
+
+_weasyprint_html = None
+_weasyprint_checked = False
+
+
+def _load_weasyprint():
+    """Import WeasyPrint once per worker, remembering a failed import"""
+    global _weasyprint_html, _weasyprint_checked
+    if not _weasyprint_checked:
+        try:
+            from weasyprint import HTML
+            _weasyprint_html = HTML
+        except Exception as e:
+            print(f"⚠ WeasyPrint not available, PDF output disabled: {e}")
+            _weasyprint_html = None
+        _weasyprint_checked = True
+    return _weasyprint_html
+
+
+def weasyprint_available():
+    """Return True when HTML can be converted to PDF on this host"""
+    return _load_weasyprint() is not None
+
+
+def html_to_pdf(html, base_url=None):
+    """Render an HTML string to PDF bytes"""
+    HTML = _load_weasyprint()
+    if HTML is None:
+        raise RuntimeError('WeasyPrint is not installed')
+    return HTML(string=html, base_url=base_url).write_pdf()
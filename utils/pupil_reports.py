@@ -0,0 +1,110 @@
+"""
+Pupil report (marks) lookups shared by the parent portal and teacher pages.
+"""
+from sqlalchemy import and_, or_, func
+
+from models import db, Pupil, AcademicYear
+from models.register_pupil import PupilMarks
+from utils.reference_data import ReferenceData
+
+# Exam types in the order they are sat; any others sort after these
+EXAM_TYPE_ORDER = ['Beginning of term', 'Mid_term', 'End of term']
+
+
+def report_dict(mark, year_names):
+    """One PupilMarks row in the shape the report cards expect"""
+    return {
+        'id': mark.id,
+        'term': mark.term,
+        'exam_type': mark.exam_type,
+        'academic_year': year_names.get(mark.academic_year_id),
+        'english': mark.english,
+        'mathematics': mark.mathematics,
+        'science': mark.science,
+        'social_studies': mark.social_studies,
+        'total_marks': mark.total_marks,
+        'average': mark.average,
+        'english_grade': mark.english_grade,
+        'mathematics_grade': mark.mathematics_grade,
+        'science_grade': mark.science_grade,
+        'social_studies_grade': mark.social_studies_grade,
+        'overall_grade': mark.overall_grade,
+        'position_in_class': mark.position_in_class,
+        'position_in_stream': mark.position_in_stream,
+        'class_student_count': mark.class_student_count,
+        'stream_student_count': mark.stream_student_count,
+        'general_comment': mark.general_comment,
+        'english_remark': mark.english_remark,
+        'mathematics_remark': mark.mathematics_remark,
+        'science_remark': mark.science_remark,
+        'social_studies_remark': mark.social_studies_remark,
+        'created_at': mark.created_at.isoformat() if mark.created_at else None
+    }
+
+
+def pupil_reports(pupil_id, academic_year_id=None, exam_type=None, term=None):
+    """Reports (marks) for a pupil, newest year and term first
+
+    Args:
+        pupil_id: ID of the pupil
+        academic_year_id: Optional academic year ID to filter by
+        exam_type: Optional exam type to filter by (e.g., 'Beginning of term', 'Mid_term', 'End of term')
+        term: Optional term number to filter by (1, 2, or 3)
+    """
+    query = PupilMarks.query.filter_by(pupil_id=pupil_id)
+    if academic_year_id is not None:
+        query = query.filter_by(academic_year_id=academic_year_id)
+    if exam_type:
+        query = query.filter_by(exam_type=exam_type)
+    if term is not None:
+        query = query.filter_by(term=term)
+
+    marks = query.order_by(PupilMarks.academic_year_id.desc(), PupilMarks.term.desc()).all()
+    year_names = ReferenceData.academic_year_names()
+    return [report_dict(mark, year_names) for mark in marks]
+
+
+def report_facets(pupil_id=None, class_streams=None):
+    """Academic years, terms and exam types that have marks, with counts
+
+    Filter by one pupil, or by the pupils in a list of (class_id, stream_id)
+    pairs. Everything comes from a single GROUP BY over pupil_marks joined
+    to academic_years; the counts are numbers of mark records.
+    """
+    query = db.session.query(
+        AcademicYear.id, AcademicYear.name, PupilMarks.term, PupilMarks.exam_type,
+        func.count(PupilMarks.id)
+    ).join(AcademicYear, AcademicYear.id == PupilMarks.academic_year_id)
+
+    if pupil_id is not None:
+        query = query.filter(PupilMarks.pupil_id == pupil_id)
+    if class_streams is not None:
+        if not class_streams:
+            return {'academic_years': [], 'terms': [], 'exam_types': []}
+        query = query.join(Pupil, Pupil.id == PupilMarks.pupil_id).filter(or_(*(
+            and_(Pupil.class_admitted == class_id, Pupil.stream == stream_id)
+            for class_id, stream_id in class_streams
+        )))
+
+    rows = query.group_by(AcademicYear.id, AcademicYear.name, PupilMarks.term, PupilMarks.exam_type).all()
+
+    years, terms, exam_types = {}, {}, {}
+    for year_id, year_name, term, exam_type, count in rows:
+        year = years.setdefault(year_id, {'id': year_id, 'name': year_name, 'count': 0})
+        year['count'] += count
+        if term:
+            terms[term] = terms.get(term, 0) + count
+        if exam_type:
+            exam_types[exam_type] = exam_types.get(exam_type, 0) + count
+
+    def exam_type_position(exam_type):
+        if exam_type in EXAM_TYPE_ORDER:
+            return (EXAM_TYPE_ORDER.index(exam_type), '')
+        return (len(EXAM_TYPE_ORDER), exam_type)
+
+    return {
+        'academic_years': sorted(years.values(), key=lambda y: y['name'], reverse=True),
+        'terms': [{'value': term, 'count': terms[term]} for term in sorted(terms)],
+        'exam_types': [{'value': exam_type, 'count': exam_types[exam_type]}
+                       for exam_type in sorted(exam_types, key=exam_type_position)]
+    }
@@ -0,0 +1,123 @@
+"""
+Pupil search shared by the bursar, parent and secretary search boxes.
+
+Matches first name, last name, admission number and roll number by
+substring, like the old `ILIKE '%q%'` filters, but through an index:
+
+* PostgreSQL: trigram GIN indexes (pg_trgm) on each column serve the ILIKE
+  filters directly, and `similarity()` ranks the results.
+* SQLite: the `pupils_search` FTS5 table (trigram tokenizer), kept in step
+  with `pupils` by triggers, answers terms of three or more characters.
+
+Both are created by the `a1f3c9e2b7d4` migration; until it has run, search
+falls back to plain ILIKE. Each whitespace-separated term must match one of
+the columns, so "jane doe" finds Jane Doe. Results are ranked exact
+admission number first, then admission number prefix, then name prefix.
+"""
+import threading
+
+from sqlalchemy import and_, or_, case, func, select, table, column, text as sql_text
+
+from models import db, Pupil
+
+SEARCH_COLUMNS = (Pupil.first_name, Pupil.last_name, Pupil.admission_number, Pupil.roll_number)
+
+# Results returned to the search-as-you-type boxes
+SEARCH_LIMIT = 10
+
+# FTS5's trigram tokenizer cannot match anything shorter than this
+MIN_INDEXED_TERM = 3
+
+_search_table = table('pupils_search', column('pupil_id'))
+
+_backends = {}
+_lock = threading.Lock()
+
+
+def search_backend():
+    """'trigram', 'fts5' or 'like', detected once per database"""
+    key = str(db.engine.url)
+    backend = _backends.get(key)
+    if backend is None:
+        backend = 'like'
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            if db.session.execute(sql_text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first():
+                backend = 'trigram'
+        elif dialect == 'sqlite':
+            if db.session.execute(sql_text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pupils_search'")).first():
+                backend = 'fts5'
+        with _lock:
+            _backends[key] = backend
+    return backend
+
+
+def _terms(query_text):
+    return (query_text or '').lower().split()
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _term_like(term):
+    """Substring match of one term against any search column"""
+    pattern = f'%{_escape_like(term)}%'
+    return or_(*(col.ilike(pattern, escape='\\') for col in SEARCH_COLUMNS))
+
+
+def search_condition(query_text):
+    """SQL condition matching pupils for `query_text`, or None when it is blank"""
+    terms = _terms(query_text)
+    if not terms:
+        return None
+
+    conditions = []
+    if search_backend() == 'fts5':
+        indexed = [t for t in terms if len(t) >= MIN_INDEXED_TERM]
+        if indexed:
+            match = ' AND '.join('"' + t.replace('"', '""') + '"' for t in indexed)
+            conditions.append(Pupil.id.in_(
+                select(_search_table.c.pupil_id)
+                .where(sql_text('pupils_search MATCH :pupil_search_match').bindparams(pupil_search_match=match))
+            ))
+        terms = [t for t in terms if len(t) < MIN_INDEXED_TERM]
+
+    conditions.extend(_term_like(term) for term in terms)
+    return and_(*conditions)
+
+
+def search_order(query_text):
+    """ORDER BY clauses putting the best matches for `query_text` first"""
+    terms = _terms(query_text)
+    if not terms:
+        return [Pupil.admission_number, Pupil.id]
+
+    phrase = ' '.join(terms)
+    prefix = f'{_escape_like(phrase)}%'
+    admission = func.lower(Pupil.admission_number)
+    tier = case(
+        (admission == phrase, 0),
+        (func.lower(Pupil.roll_number) == phrase, 0),
+        (admission.like(prefix, escape='\\'), 1),
+        (or_(func.lower(Pupil.first_name).like(prefix, escape='\\'),
+             func.lower(Pupil.last_name).like(prefix, escape='\\'),
+             func.lower(Pupil.first_name + ' ' + Pupil.last_name).like(prefix, escape='\\')), 2),
+        else_=3
+    )
+
+    order = [tier]
+    if search_backend() == 'trigram':
+        order.append(func.greatest(*(func.similarity(col, phrase) for col in SEARCH_COLUMNS)).desc())
+    return order + [Pupil.admission_number, Pupil.id]
+
+
+def search_pupils(query_text, *criteria, limit=SEARCH_LIMIT):
+    """Best-matching pupils for `query_text`, narrowed by any extra criteria"""
+    condition = search_condition(query_text)
+    if condition is None:
+        return []
+    return Pupil.query.filter(condition, *criteria)\
+        .order_by(*search_order(query_text))\
+        .limit(limit).all()
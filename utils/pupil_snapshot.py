@@ -0,0 +1,250 @@
+"""
+Pupil snapshot for the parent portal: profile, fees balance, recent payments,
+attendance rates and reports, assembled from three queries.
+
+1. The pupil's columns, total paid (scalar subquery) and present/absent
+   counts for the last 7 days, this month and the last 90 days (one grouped
+   pass over attendance, outer-joined).
+2. A UNION ALL of the pupil's assigned student fees, the class fee structures
+   per stream for the latest active year, and the five latest payments.
+3. The pupil's marks.
+
+Snapshots are cached per pupil for the day. Committed ORM writes to the
+pupil, payments, student fees, attendance or marks drop that pupil's
+snapshot; fee structure and academic year changes drop them all.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case, cast, event, func, literal, null, select, union_all, Date, Float, Integer, String
+from sqlalchemy.orm import Session
+
+from models import db, Pupil, Payment, StudentFee, FeeStructure, AcademicYear, Attendance
+from models.register_pupil import PupilMarks
+from utils.cache import ResultCache, PUPIL_SNAPSHOT
+from utils.pupil_reports import pupil_reports
+from utils.reference_data import ReferenceData
+
+RECENT_PAYMENTS = 5
+
+# Attendance windows (days back from today) shown on the parent dashboard
+WEEK_DAYS = 7
+TERM_DAYS = 90
+
+
+def _attendance_counts(column_prefix, since):
+    """Present and absent counts on or after `since`"""
+    in_window = Attendance.attendance_date >= since
+    return [
+        func.sum(case((and_(in_window, Attendance.status == 'present'), 1), else_=0)).label(f'{column_prefix}_present'),
+        func.sum(case((and_(in_window, Attendance.status == 'absent'), 1), else_=0)).label(f'{column_prefix}_absent'),
+    ]
+
+
+def _pupil_row(pupil_id, today):
+    windows = {
+        'daily': today - timedelta(days=WEEK_DAYS),
+        'weekly': today.replace(day=1),
+        'termly': today - timedelta(days=TERM_DAYS),
+    }
+    counts = [column for name, since in windows.items() for column in _attendance_counts(name, since)]
+    attendance = db.session.query(Attendance.pupil_id.label('pupil_id'), *counts).filter(
+        Attendance.pupil_id == pupil_id,
+        Attendance.attendance_date >= min(windows.values()),
+        Attendance.attendance_date <= today
+    ).group_by(Attendance.pupil_id).subquery()
+
+    total_paid = select(func.coalesce(func.sum(Payment.amount), 0.0))\
+        .where(Payment.pupil_id == Pupil.id).scalar_subquery()
+
+    return db.session.query(
+        Pupil.id, Pupil.first_name, Pupil.last_name, Pupil.admission_number, Pupil.roll_number,
+        Pupil.class_admitted, Pupil.stream, Pupil.academic_year_id,
+        total_paid.label('total_paid'),
+        *(getattr(attendance.c, f'{name}_{status}') for name in windows for status in ('present', 'absent'))
+    ).outerjoin(attendance, attendance.c.pupil_id == Pupil.id)\
+     .filter(Pupil.id == pupil_id).first()
+
+
+def _money_rows(pupil_id):
+    """Student fee total, class fee totals per stream and recent payments"""
+    def owed(term):
+        amount = getattr(FeeStructure, f'term{term}_amount')
+        exemption = func.coalesce(getattr(StudentFee, f'term{term}_exemption'), 0)
+        return case((and_(getattr(StudentFee, f'term{term}_assigned') == True, amount > exemption),
+                     amount - exemption), else_=0)
+
+    student_fees = select(
+        literal('student_fees').label('kind'),
+        cast(null(), String).label('stream_id'),
+        func.count(StudentFee.id).label('ref_id'),
+        func.coalesce(func.sum(owed(1) + owed(2) + owed(3)), 0.0).label('amount'),
+        cast(null(), Date).label('payment_date'),
+        cast(null(), String).label('receipt_number'),
+        cast(null(), String).label('payment_method'),
+        cast(null(), Integer).label('term')
+    ).join(FeeStructure, FeeStructure.id == StudentFee.fee_structure_id)\
+     .where(StudentFee.pupil_id == pupil_id, StudentFee.is_active == True)
+
+    # Same rule as before: the latest active academic year
+    latest_active_year = select(func.max(AcademicYear.id))\
+        .where(AcademicYear.is_active == True).scalar_subquery()
+    pupil_class = select(Pupil.class_admitted).where(Pupil.id == pupil_id).scalar_subquery()
+    class_fees = select(
+        literal('class_fees'),
+        FeeStructure.stream_id,
+        func.min(FeeStructure.id),
+        func.sum(FeeStructure.term1_amount + FeeStructure.term2_amount + FeeStructure.term3_amount),
+        cast(null(), Date),
+        cast(null(), String),
+        cast(null(), String),
+        cast(null(), Integer)
+    ).where(
+        FeeStructure.academic_year_id == latest_active_year,
+        FeeStructure.class_id == pupil_class,
+        FeeStructure.is_active == True
+    ).group_by(FeeStructure.stream_id)
+
+    latest = select(Payment.id, Payment.amount, Payment.payment_date, Payment.receipt_number,
+                    Payment.payment_method, Payment.term)\
+        .where(Payment.pupil_id == pupil_id)\
+        .order_by(Payment.payment_date.desc(), Payment.id.desc())\
+        .limit(RECENT_PAYMENTS).subquery()
+    payments = select(
+        literal('payment'),
+        cast(null(), String),
+        latest.c.id,
+        cast(latest.c.amount, Float),
+        latest.c.payment_date,
+        latest.c.receipt_number,
+        latest.c.payment_method,
+        latest.c.term
+    )
+
+    return db.session.execute(union_all(student_fees, class_fees, payments)).all()
+
+
+def _fees_owed(money_rows, pupil_stream):
+    """Assigned student fees when there are any, else the class fee structures
+
+    For class fees the pupil's own stream is used when it has a structure,
+    otherwise the stream whose structures were created first.
+    """
+    student_fees = next(row for row in money_rows if row.kind == 'student_fees')
+    if student_fees.ref_id:
+        return float(student_fees.amount or 0)
+
+    class_fees = [row for row in money_rows if row.kind == 'class_fees']
+    if not class_fees:
+        return 0.0
+    chosen = next((row for row in class_fees if row.stream_id == pupil_stream), None)
+    if chosen is None:
+        chosen = min(class_fees, key=lambda row: row.ref_id)
+    return float(chosen.amount or 0)
+
+
+def _attendance_stats(row, name):
+    present = int(getattr(row, f'{name}_present') or 0)
+    absent = int(getattr(row, f'{name}_absent') or 0)
+    total = present + absent
+    return {
+        'present': present,
+        'absent': absent,
+        'total': total,
+        'percentage': round((present / total * 100), 1) if total > 0 else 0
+    }
+
+
+def build_pupil_snapshot(pupil_id, today=None):
+    """Assemble the parent portal's pupil record, or None if there is no such pupil"""
+    today = today or datetime.now().date()
+    row = _pupil_row(pupil_id, today)
+    if row is None:
+        return None
+
+    money_rows = _money_rows(pupil_id)
+    balance = _fees_owed(money_rows, row.stream) - float(row.total_paid or 0)
+    payments = sorted((r for r in money_rows if r.kind == 'payment'),
+                      key=lambda r: (r.payment_date, r.ref_id), reverse=True)
+
+    class_names = ReferenceData.class_names()
+    stream_names = ReferenceData.stream_names()
+    return {
+        'id': row.id,
+        'first_name': row.first_name,
+        'last_name': row.last_name,
+        'admission_number': row.admission_number,
+        'roll_number': row.roll_number,
+        'class_admitted': class_names.get(row.class_admitted, row.class_admitted) if row.class_admitted else None,
+        'stream': stream_names.get(row.stream, row.stream) if row.stream else None,
+        'academic_year': ReferenceData.academic_year_names().get(row.academic_year_id),
+        'fees_balance': round(max(0, balance), 2),  # Don't show negative balances
+        'recent_payments': [{
+            'amount': payment.amount,
+            'payment_date': payment.payment_date.strftime('%Y-%m-%d'),
+            'receipt_number': payment.receipt_number,
+            'payment_method': payment.payment_method,
+            'term': payment.term
+        } for payment in payments],
+        'attendance_summary': {name: _attendance_stats(row, name) for name in ('daily', 'weekly', 'termly')},
+        'reports': pupil_reports(pupil_id)
+    }
+
+
+def pupil_snapshot(pupil_id):
+    """Cached `build_pupil_snapshot` for today"""
+    today = datetime.now().date()
+    cached = ResultCache.get(PUPIL_SNAPSHOT, pupil_id)
+    if cached is not None and cached[0] == today:
+        return cached[1]
+
+    snapshot = build_pupil_snapshot(pupil_id, today)
+    if snapshot is not None:
+        ResultCache.set(PUPIL_SNAPSHOT, pupil_id, (today, snapshot))
+    return snapshot
+
+
+# ---------------------------------------------------------------------------
+# Invalidation: note which pupils a transaction touched and drop their
+# snapshots once it commits
+
+_PUPIL_KEYED = (Payment, StudentFee, Attendance, PupilMarks)
+_AFFECTS_ALL = (FeeStructure, AcademicYear)
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_snapshot_changes(session, flush_context):
+    pupils = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Pupil):
+            pupils.add(obj.id)
+        elif isinstance(obj, _PUPIL_KEYED):
+            pupils.add(obj.pupil_id)
+        elif isinstance(obj, _AFFECTS_ALL):
+            pupils.add(None)
+    note_pupil_changes(session, pupils)
+
+
+def note_pupil_changes(session, pupil_ids):
+    """Drop these pupils' snapshots when `session` commits
+
+    The after_flush hook does this for ORM writes; call it directly after
+    Core statements (bulk inserts, upserts), which do not flush objects.
+    """
+    if pupil_ids:
+        session.info.setdefault('pupil_snapshot_changes', set()).update(pupil_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_snapshots(session):
+    pupils = session.info.pop('pupil_snapshot_changes', None)
+    if not pupils:
+        return
+    if None in pupils:
+        ResultCache.invalidate(PUPIL_SNAPSHOT)
+    else:
+        ResultCache.discard(PUPIL_SNAPSHOT, *pupils)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_snapshot_changes(session):
+    session.info.pop('pupil_snapshot_changes', None)
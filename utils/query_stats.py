@@ -0,0 +1,131 @@
+"""
+Per-request SQL instrumentation.
+
+SQLAlchemy `before_cursor_execute`/`after_cursor_execute` hooks count the
+statements each request runs and the time spent in the database. Every
+response gets a `Server-Timing` header (`db` and `app` durations, visible in
+the browser's network panel), statements slower than `SLOW_QUERY_MS` are
+logged with the endpoint that ran them, and the last `QUERY_STATS_SAMPLES`
+requests per endpoint are kept for the p50/p95 figures on the admin
+Query Stats page. Like the other caches, the figures are per worker process.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+# Statements slower than this are logged (milliseconds)
+DEFAULT_SLOW_QUERY_MS = 200
+
+# Requests remembered per endpoint for the percentiles
+DEFAULT_SAMPLES = 500
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class QueryStats:
+    """Rolling per-endpoint samples of (queries, db ms, total ms)"""
+
+    _samples = {}
+    _requests = {}
+    _lock = threading.Lock()
+    max_samples = DEFAULT_SAMPLES
+
+    @classmethod
+    def record(cls, endpoint, queries, db_ms, total_ms):
+        with cls._lock:
+            samples = cls._samples.get(endpoint)
+            if samples is None:
+                samples = cls._samples[endpoint] = deque(maxlen=cls.max_samples)
+            samples.append((queries, db_ms, total_ms))
+            cls._requests[endpoint] = cls._requests.get(endpoint, 0) + 1
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._samples.clear()
+            cls._requests.clear()
+
+    @classmethod
+    def summary(cls):
+        """One row per endpoint, slowest p95 database time first"""
+        with cls._lock:
+            snapshot = {endpoint: list(samples) for endpoint, samples in cls._samples.items()}
+            requests = dict(cls._requests)
+
+        rows = []
+        for endpoint, samples in snapshot.items():
+            queries = [s[0] for s in samples]
+            db_ms = [s[1] for s in samples]
+            total_ms = [s[2] for s in samples]
+            rows.append({
+                'endpoint': endpoint,
+                'requests': requests.get(endpoint, len(samples)),
+                'samples': len(samples),
+                'queries_p50': percentile(queries, 50),
+                'queries_p95': percentile(queries, 95),
+                'queries_max': max(queries),
+                'db_ms_p50': round(percentile(db_ms, 50), 1),
+                'db_ms_p95': round(percentile(db_ms, 95), 1),
+                'total_ms_p95': round(percentile(total_ms, 95), 1),
+            })
+        rows.sort(key=lambda row: row['db_ms_p95'], reverse=True)
+        return rows
+
+
+def init_query_stats(app, engine):
+    """Attach the SQL hooks to `engine` and the request hooks to `app`"""
+    slow_query_ms = float(os.getenv('SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS))
+    QueryStats.max_samples = int(os.getenv('QUERY_STATS_SAMPLES', DEFAULT_SAMPLES))
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_times', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_start_times'].pop()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if not has_request_context():
+            return
+        g._query_count = g.get('_query_count', 0) + 1
+        g._query_ms = g.get('_query_ms', 0.0) + elapsed_ms
+        if elapsed_ms >= slow_query_ms:
+            print(f"⚠ Slow query ({elapsed_ms:.0f} ms) in {request.endpoint} [{request.method} {request.path}]: "
+                  f"{' '.join(statement.split())[:500]}")
+
+    @event.listens_for(engine, 'handle_error')
+    def _drop_timer(context):
+        if context.connection is not None and context.connection.info.get('query_start_times'):
+            context.connection.info['query_start_times'].pop()
+
+    @app.before_request
+    def _start_request_timer():
+        g._request_started = time.perf_counter()
+        g._query_count = 0
+        g._query_ms = 0.0
+
+    @app.after_request
+    def _add_server_timing(response):
+        started = g.get('_request_started')
+        if started is None:
+            return response
+        total_ms = (time.perf_counter() - started) * 1000
+        queries = g.get('_query_count', 0)
+        db_ms = g.get('_query_ms', 0.0)
+
+        response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{queries} queries"')
+        response.headers.add('Server-Timing', f'app;dur={total_ms:.1f}')
+        if request.endpoint and request.endpoint != 'static':
+            QueryStats.record(request.endpoint, queries, db_ms, total_ms)
+        return response
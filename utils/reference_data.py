@@ -0,0 +1,204 @@
+"""
+Reference-data registry for classes, streams, terms, academic years and payment methods.
+
+These tables change a few times a year but are read on almost every page.
+Each table is loaded once per worker into a tuple of immutable snapshots
+(namedtuples with the same attribute names as the model columns, so templates
+keep working unchanged). Any commit that inserts, updates or deletes one of
+these models drops that table's snapshot; a TTL bounds staleness across
+worker processes.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import SchoolClass, Stream, Term, AcademicYear, PaymentMethod
+from utils.sort_keys import natural_key, class_key
+
+# Safety net for changes committed by another worker process
+REFERENCE_TTL = 600
+
+# Tracked model -> (registry key, default ordering used for the snapshot)
+_TRACKED_MODELS = {
+    SchoolClass: ('classes', lambda row: class_key(row.level, row.name)),
+    Stream: ('streams', lambda row: natural_key(row.name)),
+    Term: ('terms', lambda row: row.term_number),
+    AcademicYear: ('academic_years', lambda row: row.name),
+    PaymentMethod: ('payment_methods', lambda row: row.name),
+}
+
+_SNAPSHOT_TYPES = {
+    model: namedtuple(f'{model.__name__}Snapshot', [attr.key for attr in model.__mapper__.column_attrs])
+    for model in _TRACKED_MODELS
+}
+
+
+def _snapshot(row):
+    """Copy a model instance into its immutable snapshot type"""
+    snapshot_type = _SNAPSHOT_TYPES[type(row)]
+    return snapshot_type(*(getattr(row, field) for field in snapshot_type._fields))
+
+
+class ReferenceData:
+    """Per-worker cache of the small lookup tables"""
+
+    _tables = {}
+    _derived = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _rows(cls, model):
+        """Snapshots for one table in default order, loading it on first use"""
+        key, sort_key = _TRACKED_MODELS[model]
+        entry = cls._tables.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        rows = tuple(sorted((_snapshot(row) for row in model.query.all()), key=sort_key))
+        with cls._lock:
+            cls._tables[key] = (time.monotonic() + REFERENCE_TTL, rows)
+        return rows
+
+    @classmethod
+    def _derive(cls, model, name, build):
+        """Value computed from one table's snapshots, rebuilt when the table reloads"""
+        rows = cls._rows(model)
+        cached = cls._derived.get(name)
+        if cached is not None and cached[0] is rows:
+            return cached[1]
+        value = build(rows)
+        cls._derived[name] = (rows, value)
+        return value
+
+    @classmethod
+    def invalidate(cls, *keys):
+        """Drop cached tables by registry key (all tables when none given)"""
+        with cls._lock:
+            if not keys:
+                cls._tables.clear()
+            for key in keys:
+                cls._tables.pop(key, None)
+        if has_app_context():
+            g.pop('_current_academic_year', None)
+
+    # Ordered lists
+    @classmethod
+    def classes(cls):
+        """All classes ordered by level, then name in natural order"""
+        return list(cls._rows(SchoolClass))
+
+    @classmethod
+    def streams(cls):
+        """All streams ordered by name in natural order"""
+        return list(cls._rows(Stream))
+
+    @classmethod
+    def terms(cls, active_only=True):
+        """Terms ordered by term number"""
+        return [t for t in cls._rows(Term) if t.is_active or not active_only]
+
+    @classmethod
+    def academic_years(cls, descending=True):
+        """Academic years ordered by name (newest first by default)"""
+        years = list(cls._rows(AcademicYear))
+        return years[::-1] if descending else years
+
+    @classmethod
+    def payment_methods(cls, active_only=True):
+        """Payment methods ordered by name"""
+        return [m for m in cls._rows(PaymentMethod) if m.is_active or not active_only]
+
+    # id -> name maps
+    @classmethod
+    def class_names(cls):
+        return {c.id: c.name for c in cls._rows(SchoolClass)}
+
+    @classmethod
+    def stream_names(cls):
+        return {s.id: s.name for s in cls._rows(Stream)}
+
+    @classmethod
+    def academic_year_names(cls):
+        return {ay.id: ay.name for ay in cls._rows(AcademicYear)}
+
+    @classmethod
+    def term_names(cls):
+        """term_number -> name, for all terms"""
+        return {t.term_number: t.name for t in cls._rows(Term)}
+
+    # id -> precomputed sort key (see utils.sort_keys)
+    @classmethod
+    def class_sort_keys(cls):
+        return cls._derive(SchoolClass, 'class_sort_keys',
+                           lambda rows: {c.id: class_key(c.level, c.name) for c in rows})
+
+    @classmethod
+    def stream_sort_keys(cls):
+        return cls._derive(Stream, 'stream_sort_keys', lambda rows: {s.id: natural_key(s.name) for s in rows})
+
+    @classmethod
+    def current_academic_year(cls):
+        """The active academic year, or None
+
+        Same rule as `AcademicYear.query.filter_by(is_active=True).first()`,
+        made deterministic by taking the lowest id when several are active.
+        The result is memoized on `g` so repeat calls in a request are free.
+        """
+        if has_app_context() and '_current_academic_year' in g:
+            return g._current_academic_year
+
+        active = [ay for ay in cls._rows(AcademicYear) if ay.is_active]
+        year = min(active, key=lambda ay: ay.id) if active else None
+
+        if has_app_context():
+            g._current_academic_year = year
+        return year
+
+    @classmethod
+    def get_class(cls, class_id):
+        return next((c for c in cls._rows(SchoolClass) if c.id == class_id), None)
+
+    @classmethod
+    def get_stream(cls, stream_id):
+        return next((s for s in cls._rows(Stream) if s.id == stream_id), None)
+
+
+def current_academic_year():
+    """Shortcut for `ReferenceData.current_academic_year()`"""
+    return ReferenceData.current_academic_year()
+
+
+# ---------------------------------------------------------------------------
+# Invalidation: remember which tracked tables a transaction touched and drop
+# their snapshots once it commits (nothing happens if it rolls back)
+
+def _tracked_keys(objects):
+    keys = set()
+    for obj in objects:
+        tracked = _TRACKED_MODELS.get(type(obj))
+        if tracked:
+            keys.add(tracked[0])
+    return keys
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_reference_changes(session, flush_context):
+    keys = _tracked_keys(list(session.new) + list(session.dirty) + list(session.deleted))
+    if keys:
+        session.info.setdefault('reference_data_changes', set()).update(keys)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_reference_data(session):
+    keys = session.info.pop('reference_data_changes', None)
+    if keys:
+        ReferenceData.invalidate(*keys)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_reference_changes(session):
+    session.info.pop('reference_data_changes', None)
@@ -0,0 +1,204 @@
+"""
+Report card helpers for single-pupil and whole-stream report generation.
+
+A stream job loads every pupil in the stream together with their marks for
+the requested term in one query, renders all pages through a single template
+and converts the result to one paginated PDF. Finished documents are kept in
+a small in-memory cache keyed by a hash of their content and the minute they
+were generated (printed in the footer), so reprinting an unchanged stream
+within the same minute skips rendering entirely.
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import render_template
+from sqlalchemy import and_
+from sqlalchemy.orm import joinedload
+
+from models import db
+from models.register_pupil import Pupil, PupilMarks
+from utils.pdf import weasyprint_available, html_to_pdf
+from utils.settings import SystemSettings
+
+# Exam set (suffix of the report type) -> [(stored exam_type, heading on the report)]
+REPORT_EXAMS = {
+    'beginning': [('Beginning of term', 'Beginning of term')],
+    'mid': [('Mid_term', 'Mid_term')],
+    'end': [('End of term', 'End of term')],
+    'both': [
+        ('Beginning of term', 'Beginning of Term'),
+        ('Mid_term', 'Mid Term'),
+        ('End of term', 'End of Term'),
+    ],
+}
+
+# Footer timestamp; documents are cached per minute so it stays accurate
+GENERATED_AT_FORMAT = '%d/%m/%Y %H:%M'
+
+
+def parse_report_type(report_type):
+    """Split a report type like 'term2_both' into (term, [(exam_type, label)])
+
+    Returns (None, []) when the report type is not recognised.
+    """
+    prefix, _, exam_set = (report_type or '').partition('_')
+    if prefix not in ('term1', 'term2', 'term3'):
+        return None, []
+    return int(prefix[-1]), REPORT_EXAMS.get(exam_set, [])
+
+
+def marks_to_report_row(marks, label):
+    """Convert a PupilMarks record into the dict used by the report template"""
+    return {
+        'exam_type': label,
+        'english': marks.english,
+        'mathematics': marks.mathematics,
+        'science': marks.science,
+        'social_studies': marks.social_studies,
+        'english_grade': marks.english_grade,
+        'mathematics_grade': marks.mathematics_grade,
+        'science_grade': marks.science_grade,
+        'social_studies_grade': marks.social_studies_grade,
+        'total': marks.total_marks or 0,
+        'average': marks.average or 0,
+        'overall_grade': marks.overall_grade,
+        'position': marks.position_in_stream or 0,
+        'class_position': marks.position_in_class or 0,
+        'stream_student_count': marks.stream_student_count or 0,
+        'class_student_count': marks.class_student_count or 0,
+        'english_remark': marks.english_remark or '',
+        'mathematics_remark': marks.mathematics_remark or '',
+        'science_remark': marks.science_remark or '',
+        'social_studies_remark': marks.social_studies_remark or '',
+        'remarks': marks.general_comment or ''
+    }
+
+
+def build_marks_data(marks_records, exams):
+    """Order a pupil's marks records by exam and convert them for the template"""
+    by_exam = {m.exam_type: m for m in marks_records}
+    return [marks_to_report_row(by_exam[exam_type], label)
+            for exam_type, label in exams if exam_type in by_exam]
+
+
+def load_stream_pages(class_id, stream_id, term, exams, academic_year_id=None):
+    """Load every active pupil in a stream with their marks in a single query
+
+    Marks are matched on the requested academic year, or on each pupil's own
+    academic year when none is given (the same rule as the single report).
+    Pupils without marks still get a page so the printed set is complete.
+    """
+    year_match = (PupilMarks.academic_year_id == academic_year_id) if academic_year_id \
+        else (PupilMarks.academic_year_id == Pupil.academic_year_id)
+
+    rows = db.session.query(Pupil, PupilMarks)\
+        .outerjoin(PupilMarks, and_(
+            PupilMarks.pupil_id == Pupil.id,
+            PupilMarks.term == term,
+            PupilMarks.exam_type.in_([exam_type for exam_type, _ in exams]),
+            year_match
+        ))\
+        .options(joinedload(Pupil.academic_year))\
+        .filter(
+            Pupil.class_admitted == class_id,
+            Pupil.stream == stream_id,
+            Pupil.enrollment_status == 'active'
+        )\
+        .order_by(Pupil.admission_number.asc(), Pupil.id)\
+        .all()
+
+    # Group marks per pupil, keeping admission number order
+    grouped = OrderedDict()
+    for pupil, marks in rows:
+        entry = grouped.setdefault(pupil.id, (pupil, []))
+        if marks is not None:
+            entry[1].append(marks)
+
+    return [{'pupil': pupil, 'marks_data': build_marks_data(records, exams)}
+            for pupil, records in grouped.values()]
+
+
+class StreamReportCache:
+    """Small LRU cache of finished stream documents keyed by content hash"""
+
+    _entries = OrderedDict()
+    _max_entries = 32
+
+    @classmethod
+    def get(cls, key):
+        entry = cls._entries.get(key)
+        if entry is not None:
+            cls._entries.move_to_end(key)
+        return entry
+
+    @classmethod
+    def put(cls, key, entry):
+        cls._entries[key] = entry
+        cls._entries.move_to_end(key)
+        while len(cls._entries) > cls._max_entries:
+            cls._entries.popitem(last=False)
+
+    @classmethod
+    def clear(cls):
+        cls._entries.clear()
+
+
+def _content_hash(pages, report_type, class_name, stream_name, output, generated_at):
+    """Hash everything that ends up on the printed pages"""
+    payload = {
+        'report_type': report_type,
+        'generated_at': generated_at,
+        'class_name': class_name,
+        'stream_name': stream_name,
+        'output': output,
+        'school': SystemSettings.current().abbreviated_school_name,
+        'pages': [{
+            'id': page['pupil'].id,
+            'first_name': page['pupil'].first_name,
+            'last_name': page['pupil'].last_name,
+            'admission_number': page['pupil'].admission_number,
+            'gender': page['pupil'].gender,
+            'academic_year': page['pupil'].academic_year.name if page['pupil'].academic_year else None,
+            'marks': page['marks_data'],
+        } for page in pages],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def build_stream_reports(class_id, stream_id, class_name, stream_name, report_type,
+                         academic_year_id=None, base_url=None):
+    """Build the combined report document for a whole stream
+
+    Returns (body, mimetype, page_count). The body is a PDF when WeasyPrint
+    is available, otherwise a printable HTML document with one pupil per page.
+    """
+    term, exams = parse_report_type(report_type)
+    if term is None:
+        raise ValueError(f'Unknown report type: {report_type}')
+
+    pages = load_stream_pages(class_id, stream_id, term, exams, academic_year_id)
+    output = 'pdf' if weasyprint_available() else 'html'
+
+    generated_at = datetime.now().strftime(GENERATED_AT_FORMAT)
+    key = _content_hash(pages, report_type, class_name, stream_name, output, generated_at)
+    cached = StreamReportCache.get(key)
+    if cached is not None:
+        return cached
+
+    html = render_template('teacher/stream_reports_template.html',
+                           pages=pages,
+                           report_type=report_type,
+                           class_name=class_name,
+                           stream_name=stream_name,
+                           generated_at=generated_at)
+
+    if output == 'pdf':
+        # One document means the stylesheets are fetched and laid out once for the whole stream
+        entry = (html_to_pdf(html, base_url=base_url), 'application/pdf', len(pages))
+    else:
+        entry = (html.encode('utf-8'), 'text/html', len(pages))
+
+    StreamReportCache.put(key, entry)
+    return entry
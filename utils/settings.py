@@ -1,204 +1,203 @@
 """
 System-wide settings utility for accessing system settings across the application.
 """
-from models import SystemSetting, db
+import threading
+from types import MappingProxyType
 
-class SystemSettings:
-    """Utility class for accessing system settings"""
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 
-    _cache = {}
-    _cache_loaded = False
+from models import SystemSetting, db
+from utils.formatting import currency_formatter
+
+# (category, key) -> (snapshot attribute, type, default). Values are
+# converted to the type when a snapshot is built; stored values that cannot
+# be converted fall back to the default.
+SETTINGS_SCHEMA = {
+    ('general', 'school_name'): ('school_name', str, ''),
+    ('general', 'abbreviated_school_name'): ('abbreviated_school_name', str, ''),
+    ('general', 'school_address'): ('school_address', str, ''),
+    ('general', 'school_phone'): ('school_phone', str, ''),
+    ('general', 'school_email'): ('school_email', str, ''),
+    ('general', 'currency'): ('currency', str, 'KES'),
+    ('general', 'timezone'): ('timezone', str, 'Africa/Nairobi'),
+    ('general', 'academic_year'): ('academic_year', str, ''),
+    ('notifications', 'email_notifications'): ('email_notifications_enabled', bool, False),
+    ('notifications', 'payment_reminders'): ('payment_reminders_enabled', bool, True),
+    ('notifications', 'overdue_alerts'): ('overdue_alerts_enabled', bool, True),
+    ('notifications', 'reminder_days'): ('reminder_days', int, 7),
+    ('security', 'password_min_length'): ('password_min_length', int, 8),
+    ('security', 'session_timeout'): ('session_timeout', int, 30),
+    ('security', 'two_factor_auth'): ('two_factor_auth_enabled', bool, False),
+    ('security', 'login_attempts'): ('login_attempts_limit', int, 5),
+    ('security', 'https_enforced'): ('https_enforced', bool, False),
+    ('security', 'cors_enabled'): ('cors_enabled', bool, False),
+    ('reports', 'default_format'): ('default_report_format', str, 'pdf'),
+    ('reports', 'auto_generate'): ('auto_generate_reports', bool, False),
+    ('reports', 'include_charts'): ('include_charts_in_reports', bool, True),
+    ('reports', 'report_frequency'): ('report_frequency', str, 'monthly'),
+    ('system', 'maintenance_mode'): ('maintenance_mode', bool, False),
+    ('system', 'maintenance_message'): ('maintenance_message', str,
+                                        'The system is currently under maintenance. Please check back later.'),
+    ('backups', 'enabled'): ('backups_enabled', bool, True),
+    ('backups', 'frequency'): ('backup_frequency', str, 'weekly'),
+    ('backups', 'time'): ('backup_time', str, '02:00'),
+    ('logs', 'level'): ('log_level', str, 'INFO'),
+    ('logs', 'retention_days'): ('log_retention_days', int, 30),
+    ('performance', 'cache_enabled'): ('cache_enabled', bool, True),
+    ('performance', 'upload_max_size'): ('upload_max_size', int, 10),  # MB
+}
+
+
+def _coerce(value, value_type, default):
+    """`value` as `value_type`, or `default` when it is missing or does not convert"""
+    if value is None:
+        return default
+    if isinstance(value, value_type):
+        return value
+    try:
+        if value_type is bool:
+            return str(value).lower() in ('true', '1', 'yes', 'on')
+        if value_type is str:
+            return str(value)
+        return value_type(value)
+    except (ValueError, TypeError):
+        return default
+
+
+class SettingsSnapshot:
+    """Read-only settings loaded in one query
+
+    Every SETTINGS_SCHEMA entry is an attribute holding its parsed value;
+    settings outside the schema are available through get() and category().
+    """
+
+    __slots__ = tuple(attribute for attribute, _, _ in SETTINGS_SCHEMA.values()) + \
+        ('_categories', 'version', 'currency_formatter')
+
+    def __init__(self, categories, version):
+        for (category, key), (attribute, value_type, default) in SETTINGS_SCHEMA.items():
+            value = _coerce(categories.get(category, {}).get(key), value_type, default)
+            object.__setattr__(self, attribute, value)
+        object.__setattr__(self, '_categories', {category: MappingProxyType(values)
+                                                 for category, values in categories.items()})
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'currency_formatter', currency_formatter(self.currency))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Settings snapshots are read-only; save settings through SystemSetting.upsert_many')
+
+    __delattr__ = __setattr__
+
+    def get(self, category, key, default=None):
+        return self._categories.get(category, {}).get(key, default)
+
+    def category(self, category):
+        """A copy of one category's settings"""
+        return dict(self._categories.get(category, {}))
 
-    @classmethod
-    def _load_cache(cls):
-        """Load all settings into cache"""
-        if not cls._cache_loaded:
-            all_settings = SystemSetting.query.filter_by(is_active=True).all()
-            for setting in all_settings:
-                if setting.category not in cls._cache:
-                    cls._cache[setting.category] = {}
-                cls._cache[setting.category][setting.key] = setting.typed_value
-            cls._cache_loaded = True
+
+class SystemSettings:
+    """Utility class for accessing system settings
+
+    `SystemSettings.current()` returns the loaded snapshot; read settings as
+    attributes of it (`SystemSettings.current().currency`). Invalidation
+    drops the snapshot and the next reader loads a new one, so a request
+    holding a snapshot always sees one consistent set of values.
+    """
+
+    _snapshot = None
+    _version = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def current(cls):
+        """The current settings snapshot, loading it if needed"""
+        snapshot = cls._snapshot
+        if snapshot is None:
+            snapshot = cls._load()
+        return snapshot
+
+    @classmethod
+    def _load(cls):
+        with cls._lock:
+            if cls._snapshot is not None:
+                return cls._snapshot
+            version = cls._version
+            categories = {}
+            rows = db.session.query(SystemSetting.category, SystemSetting.key,
+                                    SystemSetting.value, SystemSetting.value_type)\
+                .filter(SystemSetting.is_active == True).all()
+            for category, key, value, value_type in rows:
+                categories.setdefault(category, {})[key] = SystemSetting.parse_value(value, value_type)
+            snapshot = SettingsSnapshot(categories, version)
+            # Keep it only if nothing was saved while it loaded
+            if cls._version == version:
+                cls._snapshot = snapshot
+            return snapshot
 
     @classmethod
     def get(cls, category, key, default=None):
         """Get a setting value"""
-        cls._load_cache()
-        return cls._cache.get(category, {}).get(key, default)
+        return cls.current().get(category, key, default)
 
     @classmethod
     def get_category(cls, category):
         """Get all settings for a category"""
-        cls._load_cache()
-        return cls._cache.get(category, {})
+        return cls.current().category(category)
 
     @classmethod
     def set(cls, category, key, value, description=None):
         """Set a setting value"""
-        SystemSetting.upsert_setting(category, key, value, description)
+        cls.set_many([(category, key, value, description)])
+
+    @classmethod
+    def set_many(cls, settings):
+        """Save several (category, key, value[, description]) settings in one transaction"""
+        SystemSetting.upsert_many(settings)
         db.session.commit()
-        # Invalidate cache
-        cls._cache_loaded = False
 
     @classmethod
     def invalidate_cache(cls):
         """Invalidate the settings cache"""
-        cls._cache_loaded = False
-
-    # Convenience methods for common settings
-    @classmethod
-    def get_school_name(cls):
-        return cls.get('general', 'school_name', '')
-
-    @classmethod
-    def get_abbreviated_school_name(cls):
-        return cls.get('general', 'abbreviated_school_name', '')
-
-    @classmethod
-    def get_school_address(cls):
-        return cls.get('general', 'school_address', '')
-
-    @classmethod
-    def get_school_phone(cls):
-        return cls.get('general', 'school_phone', '')
-
-    @classmethod
-    def get_school_email(cls):
-        return cls.get('general', 'school_email', '')
-
-    @classmethod
-    def get_currency(cls):
-        return cls.get('general', 'currency', 'KES')
-
-    @classmethod
-    def get_timezone(cls):
-        return cls.get('general', 'timezone', 'Africa/Nairobi')
-
-    @classmethod
-    def get_academic_year(cls):
-        return cls.get('general', 'academic_year', '')
-
-    @classmethod
-    def get_email_notifications_enabled(cls):
-        return cls.get('notifications', 'email_notifications', False)
-
-    @classmethod
-    def get_payment_reminders_enabled(cls):
-        return cls.get('notifications', 'payment_reminders', True)
-
-    @classmethod
-    def get_overdue_alerts_enabled(cls):
-        return cls.get('notifications', 'overdue_alerts', True)
-
-    @classmethod
-    def get_reminder_days(cls):
-        return cls.get('notifications', 'reminder_days', 7)
-
-    @classmethod
-    def get_password_min_length(cls):
-        return cls.get('security', 'password_min_length', 8)
-
-    @classmethod
-    def get_session_timeout(cls):
-        return cls.get('security', 'session_timeout', 30)
+        cls._version += 1
+        cls._snapshot = None
 
     @classmethod
-    def get_two_factor_auth_enabled(cls):
-        return cls.get('security', 'two_factor_auth', False)
+    def version(cls):
+        """Counter bumped each time this process's settings cache is invalidated"""
+        return cls._version
 
     @classmethod
-    def get_login_attempts_limit(cls):
-        return cls.get('security', 'login_attempts', 5)
-
-    @classmethod
-    def get_default_report_format(cls):
-        return cls.get('reports', 'default_format', 'pdf')
-
-    @classmethod
-    def get_auto_generate_reports(cls):
-        return cls.get('reports', 'auto_generate', False)
-
-    @classmethod
-    def get_include_charts_in_reports(cls):
-        return cls.get('reports', 'include_charts', True)
-
-    @classmethod
-    def get_report_frequency(cls):
-        return cls.get('reports', 'report_frequency', 'monthly')
-
-    # System maintenance settings
-    @classmethod
-    def get_maintenance_mode(cls):
-        return cls.get('system', 'maintenance_mode', False)
-
-    @classmethod
-    def get_maintenance_message(cls):
-        return cls.get('system', 'maintenance_message', 'The system is currently under maintenance. Please check back later.')
-
-    # Backup settings
-    @classmethod
-    def get_backup_frequency(cls):
-        return cls.get('backups', 'frequency', 'weekly')
-
-    @classmethod
-    def get_backup_time(cls):
-        return cls.get('backups', 'time', '02:00')
-
-    # Log settings
-    @classmethod
-    def get_log_level(cls):
-        return cls.get('logs', 'level', 'INFO')
-
-    @classmethod
-    def get_log_retention_days(cls):
-        return cls.get('logs', 'retention_days', 30)
-
-    # Performance settings
-    @classmethod
-    def get_cache_enabled(cls):
-        return cls.get('performance', 'cache_enabled', True)
+    def format_currency(cls, amount, currency=None):
+        """Format amount with currency symbol"""
+        if currency is None:
+            return cls.current().currency_formatter.format(amount)
+        return currency_formatter(currency).format(amount)
 
     @classmethod
-    def get_upload_max_size(cls):
-        return cls.get('performance', 'upload_max_size', 10)  # MB
+    def format_currency_no_symbol(cls, amount):
+        """Format amount without currency symbol"""
+        return cls.current().currency_formatter.format_plain(amount)
 
-    # Security settings
-    @classmethod
-    def get_https_enforced(cls):
-        return cls.get('security', 'https_enforced', False)
 
-    @classmethod
-    def get_cors_enabled(cls):
-        return cls.get('security', 'cors_enabled', False)
+# Reload the cache once per committed transaction that wrote settings,
+# whether through upsert_many or the ORM
 
-    @classmethod
-    def format_currency(cls, amount, currency=None):
-        """Format amount with currency symbol"""
-        if currency is None:
-            currency = cls.get_currency()
+@event.listens_for(Session, 'after_flush')
+def _note_settings_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, SystemSetting):
+            session.info['system_settings_changed'] = True
+            return
 
-        try:
-            amount = float(amount)
-        except (ValueError, TypeError):
-            amount = 0.0
 
-        currency_symbols = {
-            'KES': 'KSh',
-            'UGX': 'UGX',
-            'TZS': 'TSh',
-            'USD': '$',
-            'EUR': '€',
-            'GBP': '£'
-        }
+@event.listens_for(Session, 'after_commit')
+def _invalidate_settings(session):
+    if session.info.pop('system_settings_changed', None):
+        SystemSettings.invalidate_cache()
 
-        symbol = currency_symbols.get(currency, currency)
-        return f"{symbol} {amount:,.2f}"
 
-    @classmethod
-    def format_currency_no_symbol(cls, amount):
-        """Format amount without currency symbol"""
-        try:
-            amount = float(amount)
-        except (ValueError, TypeError):
-            amount = 0
-        return f"{amount:,.2f}"
\ No newline at end of file
+@event.listens_for(Session, 'after_rollback')
+def _discard_settings_changes(session):
+    session.info.pop('system_settings_changed', None)
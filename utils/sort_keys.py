@@ -0,0 +1,129 @@
+"""
+Natural-order sort keys for class names, stream names and admission numbers.
+
+`natural_key('AD/2025/010')` splits the text into digit runs and single
+letters (punctuation and spaces are ignored) and returns a flat tuple of
+integers, so 'P2' sorts before 'P10' and 'AD/2025/9' before 'AD/2025/10'.
+This fixes the order, not the speed: a natural key costs more than a plain
+string key. Keys are memoized because the same names are sorted on every
+page, and the class and stream keys are precomputed per table snapshot in `ReferenceData`.
+
+Timings against the previous string and regex orderings:
+    python -m utils.sort_keys
+"""
+import re
+from functools import lru_cache
+
+_TOKENS = re.compile(r'\d+|[^\W\d_]')
+
+# Digit runs sort before letters, as '0'-'9' do in ASCII
+_NUMBER = 0
+_LETTER = 1
+
+# Classes without a level sort after every numbered level
+NO_LEVEL = 999
+
+
+@lru_cache(maxsize=16384)
+def natural_key(text):
+    """Flat int tuple that orders `text` naturally, ignoring case"""
+    if not text:
+        return ()
+    key = []
+    for token in _TOKENS.findall(str(text).casefold()):
+        if token.isdigit():
+            key += (_NUMBER, int(token))
+        else:
+            key += (_LETTER, ord(token))
+    return tuple(key)
+
+
+def class_key(level, name):
+    """Sort key for a class: its level, then its name in natural order"""
+    return (level if level is not None else NO_LEVEL,) + natural_key(name)
+
+
+def pupil_sort_key(class_keys, stream_keys):
+    """Key function ordering pupils by class, stream, then admission number
+
+    `class_keys` and `stream_keys` map ids to precomputed keys, as returned
+    by ReferenceData.class_sort_keys() and stream_sort_keys().
+    """
+    no_key = (NO_LEVEL,)
+
+    def key(pupil):
+        return (class_keys.get(pupil.class_admitted, no_key), stream_keys.get(pupil.stream, no_key),
+                natural_key(pupil.admission_number))
+    return key
+
+
+def _benchmark(rows=5000, repeat=20):
+    """Time the previous orderings against natural keys, and show where they differ
+
+    The natural keys exist to fix the order (P2 before P10, AD/2025/9 before
+    AD/2025/10), not to make sorting faster: a plain string key is cheaper.
+    """
+    import random
+    import timeit
+    from collections import defaultdict, namedtuple
+
+    Row = namedtuple('Row', ['class_admitted', 'stream', 'admission_number'])
+    random.seed(1)
+    classes = {f'c{level}': f'P{level}' for level in range(1, 8)}
+    streams = {f's{n}': name for n, name in enumerate(['RED', 'BLUE', 'GREEN', 'YELLOW'])}
+    pupils = [Row(random.choice(list(classes)), random.choice(list(streams)), f'AD/2025/{i}')
+              for i in random.sample(range(1, rows * 2), rows)]
+    assignments = [{'class_id': class_id, 'stream_id': stream_id, 'class_name': class_name, 'stream_name': stream_name}
+                   for class_id, class_name in classes.items() for stream_id, stream_name in streams.items()]
+    random.shuffle(assignments)
+
+    class_keys = {class_id: class_key(int(name[1:]), name) for class_id, name in classes.items()}
+    stream_keys = {stream_id: natural_key(name) for stream_id, name in streams.items()}
+
+    def previous_assignments():
+        """view_assignments before natural keys: group by class name, regex once per class"""
+        grouped = defaultdict(list)
+        for assignment in assignments:
+            grouped[assignment['class_name']].append(assignment)
+
+        def class_sort_key(class_name):
+            match = re.search(r'\d+', class_name)
+            return int(match.group()) if match else 999
+
+        organized = []
+        for class_name in sorted(grouped.keys(), key=class_sort_key):
+            organized.extend(sorted(grouped[class_name], key=lambda x: x['stream_name']))
+        return organized
+
+    def natural_assignments():
+        return sorted(assignments, key=lambda a: (class_keys.get(a['class_id'], ()),
+                                                  stream_keys.get(a['stream_id'], ())))
+
+    def previous_pupils():
+        return sorted(pupils, key=lambda p: p.admission_number)
+
+    def natural_pupils_cold():
+        natural_key.cache_clear()
+        return sorted(pupils, key=lambda p: natural_key(p.admission_number))
+
+    def natural_pupils_warm():
+        return sorted(pupils, key=lambda p: natural_key(p.admission_number))
+
+    timings = {
+        f'assignments ({len(assignments)}), previous': previous_assignments,
+        f'assignments ({len(assignments)}), natural': natural_assignments,
+        f'pupils ({rows:,}), string key': previous_pupils,
+        f'pupils ({rows:,}), natural cold': natural_pupils_cold,
+        f'pupils ({rows:,}), natural warm': natural_pupils_warm,
+    }
+    print(f"Best of {repeat} runs each")
+    for label, run in timings.items():
+        best = min(timeit.repeat(run, number=1, repeat=repeat)) * 1000
+        print(f"  {label:34} {best:8.2f} ms")
+
+    print(f"  string key order:  {', '.join(p.admission_number for p in previous_pupils()[:4])}")
+    print(f"  natural key order: {', '.join(p.admission_number for p in natural_pupils_warm()[:4])}")
+
+
+if __name__ == '__main__':
+    _benchmark()